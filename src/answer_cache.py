@@ -0,0 +1,128 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from embedding_cache import normalize_text
+
+
+def context_fingerprint(context) -> str:
+    """Empreinte des chunks récupérés (l'ordre compte : il change le prompt)"""
+    h = hashlib.sha1()
+    for chunk in context or []:
+        h.update(chunk.encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+def _index_name(scope):
+    # Par convention scope[0] est la version de l'index (tuple dont [0] = collection)
+    index_key = scope[0] if scope else None
+    return index_key[0] if isinstance(index_key, tuple) and index_key else index_key
+
+
+class AnswerCache:
+    """Cache de réponses du LLM : questions identiques et quasi-identiques.
+
+    Une réponse est réutilisée si la question normalisée est identique, ou si
+    l'embedding de la question est assez proche (cosinus >= `threshold`)
+    d'une question déjà posée AVEC le même contexte récupéré et dans le même
+    `scope` (index, modèle, langue).
+    """
+
+    def __init__(self, threshold: float = 0.92, ttl: float = 3600, max_entries: int = 2000):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # (scope, contexte, question) -> (réponse, vecteur normalisé, expiration)
+        self._entries = OrderedDict()
+        # (scope, contexte) -> clés, pour la recherche de quasi-doublons
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, question, context, scope=(), query_vector=None):
+        bucket = (scope, context_fingerprint(context))
+        key = bucket + (normalize_text(question).lower(),)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[2] > now:
+                    self._entries.move_to_end(key)
+                    self.exact_hits += 1
+                    return entry[0]
+                del self._entries[key]
+                self._forget(key)
+
+            if query_vector is not None:
+                vector = self._normalize(query_vector)
+                best_key, best_score = None, self.threshold
+                for candidate in self._buckets.get(bucket, ()):
+                    answer, candidate_vector, expires = self._entries[candidate]
+                    if candidate_vector is None or expires <= now:
+                        continue
+                    score = float(np.dot(vector, candidate_vector))
+                    if score >= best_score:
+                        best_key, best_score = candidate, score
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.semantic_hits += 1
+                    return self._entries[best_key][0]
+
+            self.misses += 1
+            return None
+
+    def put(self, question, context, answer, scope=(), query_vector=None):
+        bucket = (scope, context_fingerprint(context))
+        key = bucket + (normalize_text(question).lower(),)
+        vector = self._normalize(query_vector) if query_vector is not None else None
+        with self._lock:
+            self._entries[key] = (answer, vector, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            self._buckets.setdefault(bucket, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                old_key, _ = self._entries.popitem(last=False)
+                self._forget(old_key)
+                self.evictions += 1
+
+    def invalidate(self, index_name=None):
+        """Oublier les réponses d'un index (ou toutes si index_name est None)"""
+        with self._lock:
+            for key in list(self._entries):
+                if index_name is None or _index_name(key[0]) == index_name:
+                    del self._entries[key]
+                    self._forget(key)
+
+    def stats(self) -> dict:
+        total = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / total if total else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+        }
+
+    def _forget(self, key):
+        bucket = key[:2]
+        keys = self._buckets.get(bucket)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._buckets[bucket]
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+# Cache partagé par tout le processus
+answer_cache = AnswerCache()
@@ -2,71 +2,115 @@
 import pandas as pd
 import numpy as np
 from pathlib import Path
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 from dynamic_rag import DynamicRAG
 from main import RAGSystem
+from recommend import load_or_build
+from lazy_init import LazyComponent
+from ollama_clients import get_backend
+import metrics
 
 # =====================================
 # INITIALISATION
 # =====================================
 
-print("[INIT] Initialisation (Ollama + RAG)...")
+# Précharger les modèles Ollama dès le démarrage (la 1re question ne paie pas le chargement)
+WARMUP_MODELS = True
 
-rag_system = RAGSystem()
-dynamic_rag = DynamicRAG()
-current_index = None
+# Métriques Prometheus (durée des étapes, caches, erreurs Ollama) sur http://127.0.0.1:9108/metrics
+# None : pas de serveur, les mesures sont désactivées
+METRICS_PORT = 9108
+
+print("[INIT] Initialisation en arrière-plan (Ollama + RAG)...")
+
+if METRICS_PORT:
+    try:
+        metrics.start_http_server(METRICS_PORT)
+        print(f"[OK] Métriques sur http://127.0.0.1:{METRICS_PORT}/metrics")
+    except OSError as e:
+        print(f"[WARNING] Serveur de métriques non démarré : {e}")
+
+# Client Ollama partagé : sonde de santé périodique, recharge les modèles préchauffés déchargés
+get_backend().start_health_checks(interval=30)
+
+# Les composants lourds sont construits dans des threads : l'interface démarre
+# tout de suite et chaque onglet indique s'il est encore en préparation
+dynamic_rag = LazyComponent(
+    "Chat PDF",
+    DynamicRAG,
+    warmup=(lambda rag: rag.warmup()) if WARMUP_MODELS else None
+).start()
+
+# Modèle TF-IDF pré-calculé (python recommend.py), reconstruit si le CSV change
+recommender = LazyComponent("Recommandation de modules", load_or_build).start()
+
+# Index de documents (data/chroma_db) : construit seulement au premier usage
+rag_system = LazyComponent("Index de documents", RAGSystem)
 
-# Initialisation du système de recommandation
-print("[INIT] Chargement du dataset PEEKC...")
-try:
-    wiki_mapping = pd.read_csv('../dataset/PEEKC-Dataset-main/datasets/v2/id_to_wiki_metadata_mapping.csv')
-    wiki_mapping['combined_text'] = wiki_mapping['title'].fillna('') + ' ' + wiki_mapping['description'].fillna('')
-    wiki_mapping = wiki_mapping.dropna(subset=['title'])
-    
-    vectorizer = TfidfVectorizer(max_features=5000, stop_words='english')
-    tfidf_matrix = vectorizer.fit_transform(wiki_mapping['combined_text'])
-    print(f"[OK] Dataset chargé: {wiki_mapping.shape[0]} ressources (Wikipedia + YouTube + Coursera + Udemy + FreeCodeCamp)")
-except Exception as e:
-    print(f"[WARNING] Erreur chargement dataset: {e}")
-    wiki_mapping = None
-    vectorizer = None
-    tfidf_matrix = None
+
+def readiness():
+    """État de chaque onglet + le minuteur reste actif tant que tout n'est pas prêt"""
+    pending = any(not (c.ready or c.failed) or c.warming_up for c in (dynamic_rag, recommender))
+    return (dynamic_rag.status(), dynamic_rag.status(), recommender.status(),
+            gr.Timer(active=pending))
 
 # =====================================
 # CHARGER PDF
 # =====================================
 
-def load_pdf(pdf_file):
-    global current_index
-
+def load_pdf(pdf_file, request: gr.Request):
+    # Générateur : l'avancement (pages indexées / total) s'affiche au fil de l'indexation
     if pdf_file is None:
-        return "[!] Veuillez sélectionner un PDF"
+        yield "[!] Veuillez sélectionner un PDF"
+        return
 
     try:
+        rag = dynamic_rag.get(timeout=0)
+        if rag is None:
+            yield dynamic_rag.status()
+            return
         file_path = str(pdf_file)
-        current_index, _ = dynamic_rag.load_pdf(file_path)
-        return "[✓] PDF chargé avec succès"
+        # Index propre à la session : les autres utilisateurs gardent leur PDF.
+        # Les questions sont possibles dès la première page indexée
+        for _, message in rag.iter_load_pdf(file_path, session_id=request.session_hash):
+            yield message
     except Exception as e:
-        return f"❌ Erreur: {e}"
+        yield f"❌ Erreur: {e}"
 
 # =====================================
 # POSER UNE QUESTION
 # =====================================
 
-def ask_question(question):
-    if current_index is None:
-        return "[!] Chargez d'abord un PDF", ""
+async def ask_question(question, request: gr.Request):
+    # Générateur asynchrone : Gradio affiche la réponse au fur et à mesure des tokens.
+    # Plusieurs questions sont traitées en parallèle ; l'ordonnanceur limite les
+    # générations simultanées par modèle (voir scheduler.py)
+    if not dynamic_rag.ready or not dynamic_rag.value.sessions.has_pdf(request.session_hash):
+        yield "[!] Chargez d'abord un PDF", ""
+        return
 
     if not question.strip():
-        return "[!] Entrez une question", ""
+        yield "[!] Entrez une question", ""
+        return
 
+    sources_text = ""
+    rag = dynamic_rag.value
     try:
-        answer, sources = dynamic_rag.ask_question(current_index, question)
-        sources_text = "\n\n".join(sources[:2]) if sources else ""
-        return answer, sources_text
+        # L'index d'une session inactive a pu être évincé de la mémoire : use() le rouvre
+        with rag.sessions.use(request.session_hash) as current_index:
+            if current_index is None:
+                yield "[!] Index expiré, rechargez le PDF", ""
+                return
+            async for answer, sources in rag.aask_question_stream(current_index, question):
+                # Les sources arrivent avant le premier token
+                sources_text = "\n\n".join(sources[:2]) if sources else ""
+                yield answer, sources_text
     except Exception as e:
-        return f"[X] Erreur: {e}", ""
+        yield f"[X] Erreur: {e}", sources_text
+
+def release_session(request: gr.Request):
+    """Fermeture de l'onglet : la session libère son index (il reste en cache LRU)"""
+    if dynamic_rag.ready:
+        dynamic_rag.value.sessions.release(request.session_hash)
 
 # =====================================
 # RECOMMANDATION DE MODULES
@@ -76,23 +120,13 @@ def recommend_modules(query, top_n=10):
     """
     Recherche les modules similaires à la requête de l'utilisateur.
     """
-    if wiki_mapping is None or vectorizer is None or tfidf_matrix is None:
+    if not recommender.ready:
+        # Modèle en cours de chargement (ou indisponible) : voir l'état de l'onglet
         return pd.DataFrame(columns=['title', 'url', 'platform'])
     
-    # Vectoriser la requête
-    query_vec = vectorizer.transform([query])
-    
-    # Calculer similarité cosinus
-    similarities = cosine_similarity(query_vec, tfidf_matrix).flatten()
-    
-    # Top N indices
-    top_indices = similarities.argsort()[-top_n:][::-1]
-    
-    # Résultats
-    results = wiki_mapping.iloc[top_indices].copy()
-    
-    # Retourner sans id et similarity_score, formater URL comme lien cliquable
-    return results[['title', 'url', 'platform']]
+    # Produit creux + sélection partielle du top N (seules les ressources qui partagent un terme)
+    with metrics.span("recommend"):
+        return recommender.value.recommend(query, top_n=top_n)
 
 def search_modules(query, top_n=10):
     """Interface Gradio pour rechercher des modules"""
@@ -110,6 +144,7 @@ with gr.Blocks(title="Chat PDF – Ollama") as demo:
     gr.Markdown("# Chat PDF (Ollama + RAG)")
 
     with gr.Tab("[1] Charger PDF"):
+        pdf_ready = gr.Markdown(dynamic_rag.status())
         gr.Markdown("Sélectionnez un fichier PDF")
         pdf_file = gr.File(label="PDF", file_types=[".pdf"])
         load_btn = gr.Button("Charger le PDF", variant="primary")
@@ -118,6 +153,7 @@ with gr.Blocks(title="Chat PDF – Ollama") as demo:
         load_btn.click(load_pdf, pdf_file, status)
 
     with gr.Tab("[2] Poser des questions"):
+        ask_ready = gr.Markdown(dynamic_rag.status())
         gr.Markdown("Posez des questions sur le contenu du PDF")
 
         question = gr.Textbox(
@@ -130,10 +166,12 @@ with gr.Blocks(title="Chat PDF – Ollama") as demo:
         answer = gr.Textbox(label="Réponse", lines=6, interactive=False)
         sources = gr.Textbox(label="Sources (extraits du PDF)", lines=4, interactive=False)
 
-        ask_btn.click(ask_question, question, [answer, sources])
+        # Pas de file globale Gradio : la concurrence est gérée par l'ordonnanceur
+        ask_btn.click(ask_question, question, [answer, sources], concurrency_limit=64)
 
     with gr.Tab("[3] Recommandation de Modules"):
         gr.Markdown("# Recherche de Modules Wikipedia")
+        recommend_ready = gr.Markdown(recommender.status())
         gr.Markdown("Entrez un sujet ou module que vous cherchez (ex: machine learning, python, data science...)")
         
         with gr.Row():
@@ -171,6 +209,12 @@ with gr.Blocks(title="Chat PDF – Ollama") as demo:
             outputs=results_table
         )
 
+    # Rafraîchir l'état des onglets jusqu'à ce que tout soit prêt
+    readiness_timer = gr.Timer(1.0)
+    readiness_timer.tick(readiness, None, [pdf_ready, ask_ready, recommend_ready, readiness_timer])
+    demo.load(readiness, None, [pdf_ready, ask_ready, recommend_ready, readiness_timer])
+    demo.unload(release_session)
+
 # =====================================
 # LANCEMENT
 # =====================================
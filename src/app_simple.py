@@ -8,44 +8,33 @@ from dynamic_rag import DynamicRAG
 
 print("⏳ Initialisation (Ollama)...")
 
+# Un index par session : chaque utilisateur interroge son propre PDF
 dynamic_rag = DynamicRAG()
-current_index = None
 
 # =====================================================
 # CHARGER PDF
 # =====================================================
 
-def process_pdf(pdf_file):
-    global current_index
-
+def process_pdf(pdf_file, request: gr.Request):
     if pdf_file is None:
-        return "⚠️ Veuillez charger un PDF"
+        yield "⚠️ Veuillez charger un PDF"
+        return
 
     try:
         file_path = str(pdf_file)
-        current_index, msg = dynamic_rag.load_pdf(file_path)
-        return f"✅ {msg}"
+        # Avancement affiché page par page ; les questions sont possibles pendant l'indexation
+        for _, msg in dynamic_rag.iter_load_pdf(file_path, session_id=request.session_hash):
+            yield msg
     except Exception as e:
-        return f"❌ Erreur: {e}"
+        yield f"❌ Erreur: {e}"
 
 # =====================================================
 # POSER UNE QUESTION ET OBTENIR LA RÉPONSE
 # =====================================================
 
-def ask_question(question):
-    """Poser une question et obtenir la réponse via RAG"""
-    
-    if current_index is None:
-        return "⚠️ Chargez un PDF d'abord"
-    
-    if not question.strip():
-        return "⚠️ Posez une question"
-    
-    try:
-        print(f"🔍 Recherche: {question}")
-        answer, sources = dynamic_rag.ask_question(current_index, question)
-        
-        result = f"""
+def render_answer(question, answer, sources):
+    """Mise en page HTML de la question, de la réponse (partielle) et de la source"""
+    return f"""
         <div style='padding:20px; font-size:15px; line-height: 1.8;'>
         
         <h3>📝 Votre Question</h3>
@@ -55,7 +44,7 @@ def ask_question(question):
         
         <h3>🤖 Réponse de l'IA</h3>
         <p style='background-color:#e8f4f8; padding:15px; border-radius:5px; border-left:4px solid #28a745;'>
-            {answer}
+            {answer or '<i>⏳ Génération en cours...</i>'}
         </p>
         
         <h3>📚 Source du Document</h3>
@@ -65,14 +54,40 @@ def ask_question(question):
         
         </div>
         """
-        
-        return result
+
+def ask_question(question, request: gr.Request):
+    """Poser une question et obtenir la réponse via RAG (affichée en streaming)"""
+    
+    if not dynamic_rag.sessions.has_pdf(request.session_hash):
+        yield "⚠️ Chargez un PDF d'abord"
+        return
+    
+    if not question.strip():
+        yield "⚠️ Posez une question"
+        return
+    
+    try:
+        print(f"🔍 Recherche: {question}")
+        with dynamic_rag.sessions.use(request.session_hash) as current_index:
+            if current_index is None:
+                yield "⚠️ Index expiré, rechargez le PDF"
+                return
+            # La source s'affiche dès la recherche terminée, puis la réponse token par token
+            answer, sources = "", []
+            for answer, sources in dynamic_rag.ask_question_stream(current_index, question):
+                yield render_answer(question, answer, sources)
+            if not answer:
+                yield render_answer(question, "[X] Aucune réponse générée", sources)
         
     except Exception as e:
         print(f"Erreur: {e}")
         import traceback
         traceback.print_exc()
-        return f"[X] Erreur: {str(e)}"
+        yield f"[X] Erreur: {str(e)}"
+
+def release_session(request: gr.Request):
+    """Fermeture de l'onglet : la session libère son index (il reste en cache LRU)"""
+    dynamic_rag.sessions.release(request.session_hash)
 
 # =====================================================
 # INTERFACE GRADIO - 2 PAGES SIMPLES
@@ -109,6 +124,8 @@ with gr.Blocks(title="Companion IA - Questions et Réponses", theme=gr.themes.So
         result = gr.HTML(label="Résultat")
         
         ask_btn.click(ask_question, question_input, result)
+    
+    demo.unload(release_session)
 
 if __name__ == "__main__":
     print("\n" + "="*60)
@@ -0,0 +1,245 @@
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import time
+from pathlib import Path
+from embedding_cache import normalize_text
+from main import RAGSystem
+from query_cache import query_cache
+from scheduler import scheduler
+
+STAGES = ("query_embed", "retrieval", "generation", "total")
+
+
+def question_id(question: str) -> str:
+    """Identifiant stable d'une question sans colonne `id` (sert à la reprise)"""
+    return hashlib.sha1(normalize_text(question).encode("utf-8")).hexdigest()[:16]
+
+
+def read_questions(path) -> list:
+    """Lire les questions : JSONL ({"id", "question"} ou chaîne) ou CSV (colonnes id, question).
+
+    Retourne [{"id", "question"}], sans questions vides ni identifiants en double.
+    """
+    path = Path(path)
+    rows = []
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if path.suffix.lower() == ".csv":
+            reader = csv.DictReader(f)
+            column = "question" if "question" in (reader.fieldnames or []) else reader.fieldnames[0]
+            for row in reader:
+                rows.append((row.get("id"), row.get(column)))
+        else:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if isinstance(record, str):
+                    rows.append((None, record))
+                else:
+                    rows.append((record.get("id"), record.get("question")))
+
+    items, seen = [], set()
+    for item_id, question in rows:
+        question = (question or "").strip()
+        if not question:
+            continue
+        item_id = str(item_id).strip() if item_id not in (None, "") else question_id(question)
+        if item_id in seen:
+            continue
+        seen.add(item_id)
+        items.append({"id": item_id, "question": question})
+    skipped = len(rows) - len(items)
+    if skipped:
+        print(f"[!] {skipped} lignes ignorées (question vide ou identifiant en double)")
+    return items
+
+
+def load_done(output, retry=None) -> set:
+    """Identifiants déjà répondus dans le fichier de sortie (sans erreur).
+
+    Le fichier est réécrit avec une ligne par identifiant : une dernière
+    ligne tronquée (arrêt pendant l'écriture) est supprimée, ainsi que les
+    erreurs des questions qui seront retentées (`retry`, toutes si None) ou
+    qui ont été répondues depuis.
+    """
+    output = Path(output)
+    if not output.exists():
+        return set()
+    raw = output.read_text(encoding="utf-8", errors="replace")
+    records = []
+    for line in raw.splitlines():
+        try:
+            records.append((line, json.loads(line)))
+        except json.JSONDecodeError:
+            continue
+    done = {record["id"] for _, record in records if record.get("answer") and not record.get("error")}
+
+    valid, seen = [], set()
+    for line, record in records:
+        record_id = record.get("id")
+        if record_id in done:
+            if not record.get("answer") or record.get("error") or record_id in seen:
+                continue
+            seen.add(record_id)
+        elif retry is None or record_id in retry:
+            # Erreur retentée : la nouvelle réponse (ou erreur) la remplacera
+            continue
+        valid.append(line + "\n")
+    if "".join(valid) != raw:
+        tmp = output.with_suffix(output.suffix + ".tmp")
+        tmp.write_text("".join(valid), encoding="utf-8")
+        tmp.replace(output)
+    return done
+
+
+async def _answer(rag, item, top_k, embed_share):
+    """Recherche puis génération d'une question ; les temps incluent l'attente d'un créneau"""
+    question = item["question"]
+    record = {"id": item["id"], "question": question, "answer": "", "sources": []}
+    start = time.perf_counter()
+    timings = {"query_embed": embed_share}
+    try:
+        chunks, query_vector, index_key = await scheduler.retrieve(rag._retrieve, question, top_k)
+        timings["retrieval"] = time.perf_counter() - start
+        record["sources"] = chunks
+
+        gen_start = time.perf_counter()
+        options = dict(context=chunks, language="français", query_vector=query_vector, index_key=index_key)
+        # Réponse en cache : sans attendre un créneau de génération
+        record["answer"] = rag.llm.cached_response(question, **options)
+        if record["answer"] is None:
+            record["answer"] = await scheduler.generate(rag.llm.model, rag.llm.agenerate_response,
+                                                        question, **options)
+        timings["generation"] = time.perf_counter() - gen_start
+        if not record["answer"]:
+            record["error"] = "réponse vide (LLM indisponible ?)"
+    except Exception as e:
+        record["error"] = str(e)
+    timings["total"] = time.perf_counter() - start
+    record["timings"] = {stage: round(seconds, 4) for stage, seconds in timings.items()}
+    return record
+
+
+async def answer_batch(rag, items, output, top_k: int = 3, window: int = 256,
+                       embed_batch: int = 64, progress_every: int = 50) -> list:
+    """Répondre à `items` et ajouter chaque résultat à `output` (JSONL) dès qu'il est prêt.
+
+    Les questions avancent par fenêtres de `window` : leurs embeddings sont
+    calculés en lots de `embed_batch` (un appel au modèle par lot), puis
+    recherches et générations partent en parallèle, bornées par l'ordonnanceur
+    (`scheduler.max_retrievals`, limite du modèle pour le LLM). La fenêtre
+    suivante est embeddée pendant que le LLM répond à la précédente.
+    Retourne la liste des résultats écrits.
+    """
+    embeddings = rag.chroma_index.embeddings
+    results, pending = [], set()
+    start = time.perf_counter()
+
+    with open(output, "a", encoding="utf-8") as f:
+        def write(tasks):
+            for task in tasks:
+                record = task.result()
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                results.append(record)
+                if len(results) % progress_every == 0:
+                    elapsed = time.perf_counter() - start
+                    print(f"[INFO] {len(results)}/{len(items)} réponses ({len(results) / elapsed:.2f} q/s)")
+
+        for offset in range(0, len(items), window):
+            part = items[offset:offset + window]
+            embed_start = time.perf_counter()
+            try:
+                await asyncio.to_thread(query_cache.prefetch, embeddings,
+                                        [item["question"] for item in part], embed_batch)
+            except Exception as e:
+                # Les recherches retomberont sur l'embedding question par question (ou le lexical)
+                print(f"[WARNING] Embeddings par lots indisponibles ({e})")
+            embed_share = (time.perf_counter() - embed_start) / len(part)
+            for item in part:
+                pending.add(asyncio.ensure_future(_answer(rag, item, top_k, embed_share)))
+            # Au plus une fenêtre d'avance sur les réponses écrites
+            while len(pending) > window:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                write(done)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            write(done)
+    return results
+
+
+def summarize(results, elapsed) -> dict:
+    """Débit, erreurs et temps par étape (moyenne, p50, p95) d'un lot"""
+    summary = {
+        "answered": sum(1 for r in results if not r.get("error")),
+        "errors": sum(1 for r in results if r.get("error")),
+        "seconds": round(elapsed, 2),
+        "questions_per_second": round(len(results) / elapsed, 3) if elapsed else 0.0,
+        "stages": {},
+    }
+    for stage in STAGES:
+        values = sorted(r["timings"][stage] for r in results if stage in r["timings"])
+        if values:
+            summary["stages"][stage] = {
+                "mean": round(sum(values) / len(values), 4),
+                "p50": values[len(values) // 2],
+                "p95": values[min(len(values) - 1, int(len(values) * 0.95))],
+            }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Répondre à une liste de questions (FAQ) en lot, avec reprise")
+    parser.add_argument("questions", help="fichier JSONL ({\"id\", \"question\"}) ou CSV (colonnes id, question)")
+    parser.add_argument("--output", default="answers.jsonl", help="résultats JSONL (complétés à la reprise)")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=2, help="générations simultanées du LLM")
+    parser.add_argument("--retrievals", type=int, default=8, help="recherches simultanées")
+    parser.add_argument("--window", type=int, default=256, help="questions embeddées d'avance")
+    parser.add_argument("--embed-batch", type=int, default=64, help="questions par appel d'embedding")
+    parser.add_argument("--no-answer-cache", action="store_true",
+                        help="régénérer toutes les réponses (ignorer le cache de réponses)")
+    parser.add_argument("--restart", action="store_true", help="effacer la sortie au lieu de la reprendre")
+    parser.add_argument("--json", help="écrire le résumé (débit, temps par étape) dans ce fichier JSON")
+    args = parser.parse_args()
+
+    items = read_questions(args.questions)
+    output = Path(args.output)
+    if args.restart and output.exists():
+        output.unlink()
+    done = load_done(output, retry={item["id"] for item in items})
+    todo = [item for item in items if item["id"] not in done]
+    print(f"[INFO] {len(items)} questions, {len(items) - len(todo)} déjà répondues, {len(todo)} à traiter")
+    if not todo:
+        return
+
+    rag = RAGSystem()
+    if args.no_answer_cache:
+        rag.llm.answer_cache = None
+    scheduler.per_model_limits[rag.llm.model] = args.concurrency
+    scheduler.max_retrievals = args.retrievals
+
+    start = time.perf_counter()
+    results = asyncio.run(answer_batch(rag, todo, output, top_k=args.top_k, window=args.window,
+                                       embed_batch=args.embed_batch))
+    summary = summarize(results, time.perf_counter() - start)
+    summary["scheduler"] = scheduler.stats()
+
+    print("\n" + "="*70)
+    print(f"[OK] {summary['answered']} réponses, {summary['errors']} erreurs "
+          f"en {summary['seconds']}s ({summary['questions_per_second']} q/s) -> {output}")
+    for stage, stats in summary["stages"].items():
+        print(f"   - {stage:<11} moyenne {stats['mean']:.3f}s  p50 {stats['p50']:.3f}s  p95 {stats['p95']:.3f}s")
+    if summary["errors"]:
+        print("[!] Les questions en erreur seront retentées en relançant la même commande")
+    print("="*70 + "\n")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+import argparse
+import json
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
+from langchain_chroma import Chroma
+from ollama_clients import get_embeddings
+from fake_ollama import FakeOllamaServer, FakeOllamaConfig
+from ingest import list_document_files, iter_loaded_files
+from split import iter_split_documents
+from embedding_pipeline import EmbeddingPipeline
+from query_cache import QueryCache
+from compact_vectors import build_from_chroma
+from query_batcher import QueryBatcher
+from llm import CompagnionLLM
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+VOCABULARY = (
+    "machine learning apprentissage modèle données réseau neurones couche gradient "
+    "optimisation régression classification cluster shard réplication index requête "
+    "base mongodb collection document transformer attention embedding vecteur "
+    "similarité recherche algorithme entraînement validation test erreur perte "
+    "python fonction classe objet module paquet api serveur client latence débit"
+).split()
+
+
+# =====================================
+# MESURES
+# =====================================
+
+def percentile(values, q):
+    """Percentile par interpolation linéaire (q entre 0 et 100)"""
+    if not values:
+        return None
+    values = sorted(values)
+    pos = (len(values) - 1) * q / 100
+    low = int(pos)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (pos - low)
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Octets sous macOS, kilo-octets sous Linux
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def summarize(latencies, items, elapsed):
+    """Résumé d'une étape : latences (ms) par opération, débit (items/s), RSS max"""
+    return {
+        "operations": len(latencies),
+        "items": items,
+        "elapsed_s": round(elapsed, 4),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3) if latencies else None,
+        "throughput_per_s": round(items / elapsed, 2) if elapsed > 0 else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1) if resource else None,
+    }
+
+
+# =====================================
+# CORPUS SYNTHÉTIQUE
+# =====================================
+
+def write_corpus(folder, num_docs, doc_kb, seed):
+    """Écrire `num_docs` fichiers TXT d'environ `doc_kb` Ko, déterministes"""
+    rng = random.Random(seed)
+    folder.mkdir(parents=True, exist_ok=True)
+    for i in range(num_docs):
+        lines, size = [], 0
+        while size < doc_kb * 1024:
+            line = " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(8, 16)))
+            lines.append(line)
+            size += len(line) + 1
+        (folder / f"doc_{i:05d}.txt").write_text("\n".join(lines), encoding="utf-8")
+
+
+def make_queries(count, seed):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(2, 5))) for _ in range(count)]
+
+
+# =====================================
+# ÉTAPES
+# =====================================
+
+def bench_load(docs_dir):
+    latencies, documents = [], []
+    start = last = time.perf_counter()
+    for _, docs, error in iter_loaded_files(list_document_files(docs_dir), workers=1):
+        now = time.perf_counter()
+        latencies.append(now - last)
+        last = now
+        if not error:
+            documents.extend(docs)
+    return summarize(latencies, len(documents), time.perf_counter() - start), documents
+
+
+def bench_split(documents):
+    latencies, chunks = [], []
+    start = time.perf_counter()
+    for document in documents:
+        t = time.perf_counter()
+        chunks.extend(iter_split_documents([document]))
+        latencies.append(time.perf_counter() - t)
+    return summarize(latencies, len(chunks), time.perf_counter() - start), chunks
+
+
+def bench_embed(embeddings, chunks, batch_size):
+    latencies = []
+    texts = [chunk.page_content for chunk in chunks]
+    start = time.perf_counter()
+    for i in range(0, len(texts), batch_size):
+        t = time.perf_counter()
+        embeddings.embed_documents(texts[i:i + batch_size])
+        latencies.append(time.perf_counter() - t)
+    return summarize(latencies, len(texts), time.perf_counter() - start)
+
+
+def bench_index(embeddings, chunks, persist_dir, batch_size, max_in_flight):
+    chroma_index = Chroma(
+        persist_directory=str(persist_dir),
+        embedding_function=embeddings,
+        collection_name="bench_documents"
+    )
+    start = time.perf_counter()
+    with EmbeddingPipeline(embeddings, chroma_index, batch_size=batch_size,
+                           max_in_flight=max_in_flight, progress_every=float("inf")) as pipeline:
+        pipeline.add(
+            [chunk.page_content for chunk in chunks],
+            [chunk.metadata for chunk in chunks],
+            [f"chunk_{i}" for i in range(len(chunks))]
+        )
+    return summarize([], len(chunks), time.perf_counter() - start), chroma_index
+
+
+def bench_query_burst(embed_query, queries, concurrency):
+    """`concurrency` utilisateurs posent les questions en même temps (embedding seul)"""
+    latencies = []
+
+    def timed(query):
+        t = time.perf_counter()
+        embed_query(query)
+        latencies.append(time.perf_counter() - t)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(timed, queries))
+    return summarize(latencies, len(queries), time.perf_counter() - start)
+
+
+def bench_retrieval(chroma_index, queries, top_k, cache):
+    latencies = []
+    start = time.perf_counter()
+    for query in queries:
+        t = time.perf_counter()
+        cache.search(chroma_index, query, top_k)
+        latencies.append(time.perf_counter() - t)
+    return summarize(latencies, len(queries), time.perf_counter() - start)
+
+
+def _dir_mb(path):
+    return sum(f.stat().st_size for f in Path(path).rglob("*") if f.is_file()) / 1024 / 1024
+
+
+def bench_compact(embeddings, chroma_index, queries, top_k, workdir, persist_dir):
+    """Vecteurs compacts vs Chroma seul : latence, rappel@k, mémoire et disque.
+
+    Référence du rappel : recherche exacte float32 sur tous les embeddings.
+    `disk_mb` d'une copie compacte est du disque en plus de Chroma (`total_disk_mb`).
+    """
+    collection = chroma_index._collection
+    full = np.asarray(collection.get(include=["embeddings"])["embeddings"], dtype=np.float32)
+    ids = collection.get(include=[])["ids"]
+    full /= np.maximum(np.linalg.norm(full, axis=1, keepdims=True), 1e-12)
+    vectors = [embeddings.embed_query(query) for query in queries]
+    truth = [set(ids[i] for i in np.argsort(-(full @ np.asarray(v, dtype=np.float32)))[:top_k])
+             for v in vectors]
+
+    def run(search):
+        latencies, hits = [], 0
+        start = time.perf_counter()
+        for vector, expected in zip(vectors, truth):
+            t = time.perf_counter()
+            found = search(vector)
+            latencies.append(time.perf_counter() - t)
+            hits += len(set(found) & expected)
+        result = summarize(latencies, len(vectors), time.perf_counter() - start)
+        result["recall_at_k"] = round(hits / (len(vectors) * top_k), 4) if vectors else None
+        return result
+
+    stages = {}
+    stages["vectors_chroma"] = run(
+        lambda v: [doc.id for doc in chroma_index.similarity_search_by_vector(v, k=top_k)]
+    )
+    stages["vectors_chroma"]["vector_mb"] = round(full.nbytes / 1024 / 1024, 3)
+    stages["vectors_chroma"]["disk_mb"] = round(_dir_mb(persist_dir), 3)
+    for dtype in ("int8", "float16"):
+        compact = build_from_chroma(chroma_index, workdir / f"compact_{dtype}_{len(ids)}", dtype)
+        stages[f"vectors_{dtype}"] = run(lambda v: [doc.id for doc in compact.search(chroma_index, v, top_k)])
+        stages[f"vectors_{dtype}"]["vector_mb"] = round(compact.nbytes() / 1024 / 1024, 3)
+        # La copie s'ajoute aux float32 de Chroma (reclassement) : disque en plus, pas une économie
+        stages[f"vectors_{dtype}"]["disk_mb"] = round(_dir_mb(compact.folder), 3)
+        stages[f"vectors_{dtype}"]["total_disk_mb"] = round(
+            stages["vectors_chroma"]["disk_mb"] + stages[f"vectors_{dtype}"]["disk_mb"], 3
+        )
+        # Sans reclassement : qualité de la présélection seule
+        no_rerank = run(lambda v: [compact.ids[row] for row in compact.candidates(v, top_k)[0]])
+        stages[f"vectors_{dtype}"]["recall_at_k_no_rerank"] = no_rerank["recall_at_k"]
+    return stages
+
+
+def bench_generation(llm, chroma_index, queries, top_k):
+    latencies, first_tokens = [], []
+    cache = QueryCache()
+    start = time.perf_counter()
+    for query in queries:
+        context = [doc.page_content for doc in cache.search(chroma_index, query, top_k)]
+        t = time.perf_counter()
+        first = None
+        for _ in llm.stream_response(query, context=context):
+            if first is None:
+                first = time.perf_counter() - t
+        latencies.append(time.perf_counter() - t)
+        first_tokens.append(first or latencies[-1])
+    result = summarize(latencies, len(queries), time.perf_counter() - start)
+    result["ttft_p50_ms"] = round(percentile(first_tokens, 50) * 1000, 3)
+    result["ttft_p95_ms"] = round(percentile(first_tokens, 95) * 1000, 3)
+    return result
+
+
+def run_size(base_url, num_docs, args, workdir):
+    docs_dir = workdir / f"docs_{num_docs}"
+    write_corpus(docs_dir, num_docs, args.doc_kb, args.seed)
+    queries = make_queries(args.queries, args.seed + num_docs)
+
+    # Sans cache disque : on mesure le chemin réel vers Ollama
+    embeddings = get_embeddings("nomic-embed-text", base_url)
+    llm = CompagnionLLM(model="orca-mini", base_url=base_url)
+
+    stages = {}
+    stages["load"], documents = bench_load(docs_dir)
+    stages["split"], chunks = bench_split(documents)
+    stages["embed"] = bench_embed(embeddings, chunks, args.batch_size)
+    stages["index_build"], chroma_index = bench_index(
+        embeddings, chunks, workdir / f"chroma_{num_docs}", args.batch_size, args.max_in_flight
+    )
+    # Questions simultanées : un appel par question, puis regroupées par le batcher
+    stages["query_burst"] = bench_query_burst(embeddings.embed_query, queries, args.burst)
+    batcher = QueryBatcher(embeddings)
+    stages["query_burst_batched"] = bench_query_burst(batcher.embed, queries, args.burst)
+    stages["query_burst_batched"]["avg_batch"] = round(batcher.stats()["avg_batch"], 2)
+    # Un seul utilisateur : le batcher ne doit pas ajouter d'attente
+    stages["query_single_batched"] = bench_query_burst(batcher.embed, queries, 1)
+    cache = QueryCache(cache_results=False)
+    stages["retrieval"] = bench_retrieval(chroma_index, queries, args.top_k, cache)
+    # Mêmes questions une seconde fois : embeddings des questions en cache
+    stages["retrieval_warm"] = bench_retrieval(chroma_index, queries, args.top_k, cache)
+    stages.update(bench_compact(embeddings, chroma_index, queries, args.top_k, workdir,
+                                workdir / f"chroma_{num_docs}"))
+    stages["generation"] = bench_generation(llm, chroma_index, queries[:args.generations], args.top_k)
+    return {"corpus_docs": num_docs, "chunks": len(chunks), "stages": stages}
+
+
+# =====================================
+# COMPARAISON AVEC UNE RÉFÉRENCE
+# =====================================
+
+def compare(results, baseline, tolerance):
+    """Lister les régressions : p95 plus lent ou débit plus faible que la référence"""
+    regressions = []
+    reference = {run["corpus_docs"]: run["stages"] for run in baseline.get("runs", [])}
+    for run in results["runs"]:
+        for stage, current in run["stages"].items():
+            previous = reference.get(run["corpus_docs"], {}).get(stage)
+            if not previous:
+                continue
+            if current.get("p95_ms") and previous.get("p95_ms") and \
+                    current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{run['corpus_docs']} docs / {stage} : p95 "
+                                   f"{previous['p95_ms']} -> {current['p95_ms']} ms")
+            if current.get("throughput_per_s") and previous.get("throughput_per_s") and \
+                    current["throughput_per_s"] < previous["throughput_per_s"] * (1 - tolerance):
+                regressions.append(f"{run['corpus_docs']} docs / {stage} : débit "
+                                   f"{previous['throughput_per_s']} -> {current['throughput_per_s']} /s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du pipeline RAG avec un faux serveur Ollama")
+    parser.add_argument("--sizes", default="10,50,200",
+                        help="tailles de corpus (nombre de documents), séparées par des virgules")
+    parser.add_argument("--doc-kb", type=float, default=8, help="taille d'un document (Ko)")
+    parser.add_argument("--queries", type=int, default=50, help="questions pour la recherche")
+    parser.add_argument("--generations", type=int, default=10, help="questions pour la génération")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--burst", type=int, default=16, help="utilisateurs simultanés (rafale de questions)")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--max-in-flight", type=int, default=4)
+    parser.add_argument("--dim", type=int, default=768, help="dimension des faux embeddings")
+    parser.add_argument("--embed-latency-ms", type=float, default=5)
+    parser.add_argument("--embed-latency-per-text-ms", type=float, default=2)
+    parser.add_argument("--embed-parallel", type=int, default=0,
+                        help="requêtes d'embedding traitées en même temps par le faux serveur (0 = illimité)")
+    parser.add_argument("--first-token-ms", type=float, default=50)
+    parser.add_argument("--token-ms", type=float, default=10)
+    parser.add_argument("--tokens", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="benchmark_results.json", help="fichier JSON de résultats")
+    parser.add_argument("--baseline", help="résultats de référence à comparer (JSON)")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="régression tolérée par rapport à la référence (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    config = FakeOllamaConfig(
+        dim=args.dim,
+        embed_latency=args.embed_latency_ms / 1000,
+        embed_latency_per_text=args.embed_latency_per_text_ms / 1000,
+        first_token_latency=args.first_token_ms / 1000,
+        token_latency=args.token_ms / 1000,
+        num_tokens=args.tokens,
+        embed_parallel=args.embed_parallel
+    )
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": vars(args),
+        },
+        "runs": []
+    }
+
+    workdir = Path(tempfile.mkdtemp(prefix="rag_bench_"))
+    try:
+        with FakeOllamaServer(config=config) as server:
+            print(f"[OK] Faux Ollama sur {server.base_url}")
+            for num_docs in sizes:
+                print(f"[BENCH] Corpus de {num_docs} documents...")
+                run = run_size(server.base_url, num_docs, args, workdir)
+                results["runs"].append(run)
+                for stage, stats in run["stages"].items():
+                    print(f"   - {stage:15s} p50={stats['p50_ms']} ms  p95={stats['p95_ms']} ms  "
+                          f"débit={stats['throughput_per_s']}/s  RSS={stats['peak_rss_mb']} MB")
+            results["meta"]["server_stats"] = server.stats
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"[OK] Résultats écrits dans {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"[X] {len(regressions)} régression(s) :")
+            for line in regressions:
+                print(f"   - {line}")
+            sys.exit(1)
+        print("[OK] Aucune régression par rapport à la référence")
+
+
+if __name__ == "__main__":
+    main()
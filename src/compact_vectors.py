@@ -0,0 +1,277 @@
+import json
+import os
+import threading
+from pathlib import Path
+import numpy as np
+from langchain_core.documents import Document
+
+DTYPES = {"int8": np.int8, "float16": np.float16}
+META_FILE = "meta.json"
+
+
+def compact_path(persist_dir):
+    """Vecteurs compacts à côté du dossier Chroma (ex: data/chroma_db_compact/)"""
+    persist_dir = Path(persist_dir)
+    return persist_dir.with_name(f"{persist_dir.name}_compact")
+
+
+def quantize(vectors, dtype: str = "int8"):
+    """Normaliser puis compresser des vecteurs : (valeurs compactes, échelle par vecteur).
+
+    int8 : chaque vecteur est ramené sur [-127, 127] avec sa propre échelle
+    (max |x| / 127) ; float16 : simple conversion, échelle 1.
+    valeurs * échelle ≈ vecteur normalisé, donc le produit scalaire ≈ cosinus.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms > 0, norms, 1.0)
+    if dtype == "float16":
+        return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    values = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return values, scales.astype(np.float32)
+
+
+class CompactVectorIndex:
+    """Copie compacte (int8 ou float16) des embeddings d'une collection Chroma.
+
+    Fichiers dans `folder` : vectors.npy (N x dim, memmap), scales.npy
+    (une échelle par vecteur), ids.json (ID Chroma de chaque ligne) et
+    meta.json. La recherche parcourt les vecteurs compacts par petits blocs,
+    garde `candidates` chunks puis les reclasse avec les embeddings float32
+    de Chroma : le résultat final est en pleine précision.
+
+    La copie s'ajoute au stockage float32 de Chroma (nécessaire au
+    reclassement) : elle réduit la mémoire parcourue par requête, pas le disque.
+    Quand embeddings_chroma.py la reconstruit (meta.json remplacé en dernier),
+    elle est rechargée à la recherche suivante.
+    """
+
+    def __init__(self, folder, block_size: int = 4096):
+        self.folder = Path(folder)
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        stamp = self._stamp()
+        with open(self.folder / META_FILE, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        vectors = np.load(self.folder / "vectors.npy", mmap_mode="r")
+        scales = np.load(self.folder / "scales.npy", mmap_mode="r")
+        with open(self.folder / "ids.json", "r", encoding="utf-8") as f:
+            ids = json.load(f)
+        # Une seule affectation : une recherche en cours garde une version cohérente
+        self._state = (stamp, meta, vectors, scales, ids)
+
+    def _stamp(self):
+        stat = (self.folder / META_FILE).stat()
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    @property
+    def meta(self) -> dict:
+        return self._state[1]
+
+    @property
+    def vectors(self):
+        return self._state[2]
+
+    @property
+    def scales(self):
+        return self._state[3]
+
+    @property
+    def ids(self) -> list:
+        return self._state[4]
+
+    @property
+    def count(self) -> int:
+        return len(self.ids)
+
+    @property
+    def dtype(self) -> str:
+        return self.meta["dtype"]
+
+    def nbytes(self) -> int:
+        return self.vectors.nbytes + self.scales.nbytes
+
+    def refresh(self) -> bool:
+        """Recharger les fichiers si meta.json a changé ; faux si la copie a été supprimée"""
+        try:
+            stamp = self._stamp()
+            if stamp != self._state[0]:
+                with self._lock:
+                    if stamp != self._state[0]:
+                        self._load()
+        except (OSError, ValueError):
+            return False
+        return True
+
+    def matches(self, chroma_index) -> bool:
+        """Vrai si la copie correspond encore à la collection (sinon : recherche Chroma)"""
+        return self.refresh() and self.count == chroma_index._collection.count()
+
+    def candidates(self, query_vector, n: int, state=None):
+        """Indices et scores approchés des n vecteurs les plus proches"""
+        _, _, vectors, scales, _ = state or self._state
+        count = len(vectors)
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        best_idx = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        # Tampon float32 réutilisé d'un bloc à l'autre : la mémoire reste bornée par block_size
+        buffer = np.empty((min(self.block_size, count), vectors.shape[1] if count else 0), dtype=np.float32)
+        for start in range(0, count, self.block_size):
+            block = buffer[:min(self.block_size, count - start)]
+            np.copyto(block, vectors[start:start + len(block)], casting="unsafe")
+            scores = (block @ query) * scales[start:start + len(block)]
+            best_idx = np.concatenate([best_idx, np.arange(start, start + len(block))])
+            best_scores = np.concatenate([best_scores, scores])
+            if len(best_scores) > n:
+                keep = np.argpartition(-best_scores, n - 1)[:n]
+                best_idx, best_scores = best_idx[keep], best_scores[keep]
+        order = np.argsort(-best_scores)
+        return best_idx[order], best_scores[order]
+
+    def search(self, chroma_index, query_vector, k: int = 4, candidates: int = None):
+        """Top-k Documents : présélection compacte puis reclassement float32 (Chroma).
+
+        None si des candidats n'existent plus dans Chroma (copie périmée) :
+        l'appelant refait la recherche avec Chroma.
+        """
+        found = self.search_with_scores(chroma_index, query_vector, k, candidates)
+        return None if found is None else [doc for doc, _ in found]
+
+    def search_with_scores(self, chroma_index, query_vector, k: int = 4, candidates: int = None):
+        """Comme search, avec le cosinus exact : liste de (Document, score), ou None"""
+        state = self._state
+        ids = state[4]
+        if not ids:
+            return []
+        n = min(len(ids), candidates or max(k * 4, 20))
+        rows, _ = self.candidates(query_vector, n, state)
+        wanted = [ids[row] for row in rows]
+        found = chroma_index._collection.get(
+            ids=wanted,
+            include=["documents", "metadatas", "embeddings"]
+        )
+        if len(found["ids"]) < len(wanted):
+            # Chunks supprimés depuis la construction de la copie : résultat incomplet
+            return None
+        return rank_by_cosine(query_vector, found, k)
+
+
+def rank_by_cosine(query_vector, found, k: int):
+    """Classer un résultat Chroma (ids, documents, metadatas, embeddings) par cosinus exact.
+
+    Retourne les k meilleurs (Document, score), score décroissant.
+    """
+    if not found["ids"]:
+        return []
+    exact = np.asarray(found["embeddings"], dtype=np.float32)
+    exact /= np.maximum(np.linalg.norm(exact, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_vector, dtype=np.float32)
+    scores = exact @ (query / max(float(np.linalg.norm(query)), 1e-12))
+    return [
+        (Document(page_content=found["documents"][i], metadata=found["metadatas"][i] or {},
+                  id=found["ids"][i]), float(scores[i]))
+        for i in np.argsort(-scores)[:k]
+    ]
+
+
+def build_from_chroma(chroma_index, folder, dtype: str = "int8", batch_size: int = 1000, revision=None):
+    """(Re)construire la copie compacte en lisant Chroma par pages.
+
+    Les fichiers sont écrits sous un nom temporaire puis renommés : une
+    recherche en cours garde l'ancienne version ouverte.
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"Type inconnu : {dtype} (int8 ou float16)")
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    collection = chroma_index._collection
+    total = collection.count()
+
+    ids, vectors, scales, dim = [], None, None, None
+    for offset in range(0, total, batch_size):
+        page = collection.get(include=["embeddings"], limit=batch_size, offset=offset)
+        if not page["ids"]:
+            break
+        values, page_scales = quantize(page["embeddings"], dtype)
+        if vectors is None:
+            dim = values.shape[1]
+            vectors = np.lib.format.open_memmap(folder / "vectors.npy.tmp", mode="w+",
+                                                dtype=DTYPES[dtype], shape=(total, dim))
+            scales = np.empty(total, dtype=np.float32)
+        end = min(len(ids) + len(values), total)
+        vectors[len(ids):end] = values[:end - len(ids)]
+        scales[len(ids):end] = page_scales[:end - len(ids)]
+        ids.extend(page["ids"][:end - len(ids)])
+
+    if vectors is None:
+        vectors = np.lib.format.open_memmap(folder / "vectors.npy.tmp", mode="w+",
+                                            dtype=DTYPES[dtype], shape=(0, 0))
+        scales = np.empty(0, dtype=np.float32)
+    # Collection réduite pendant la lecture : les dernières lignes restent inutilisées
+    vectors.flush()
+    del vectors
+    with open(folder / "scales.npy.tmp", "wb") as f:
+        np.save(f, scales)
+
+    with open(folder / "ids.json.tmp", "w", encoding="utf-8") as f:
+        json.dump(ids, f)
+    with open(folder / "meta.json.tmp", "w", encoding="utf-8") as f:
+        json.dump({"dtype": dtype, "count": len(ids), "dim": dim,
+                   "collection": collection.name, "revision": revision}, f, indent=2)
+    os.replace(folder / "vectors.npy.tmp", folder / "vectors.npy")
+    os.replace(folder / "scales.npy.tmp", folder / "scales.npy")
+    os.replace(folder / "ids.json.tmp", folder / "ids.json")
+    os.replace(folder / "meta.json.tmp", folder / META_FILE)
+    return CompactVectorIndex(folder)
+
+
+def existing_dtype(folder):
+    """Type de la copie compacte existante, ou None"""
+    try:
+        with open(Path(folder) / META_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)["dtype"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def open_for(chroma_index, folder, revision=None):
+    """Ouvrir la copie compacte d'une collection (si elle existe et est à jour) et l'enregistrer.
+
+    `revision` : révision du manifeste d'indexation, comparée à celle
+    enregistrée à la construction.
+    """
+    if existing_dtype(folder) is None:
+        return None
+    compact = CompactVectorIndex(folder)
+    if not compact.matches(chroma_index) or compact.meta.get("revision") != revision:
+        print(f"[WARNING] Vecteurs compacts désynchronisés ({folder}) : recherche Chroma seule")
+        return None
+    register(chroma_index._collection.name, compact)
+    return compact
+
+
+# Copies compactes ouvertes, par nom de collection Chroma (utilisées par query_cache)
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def register(collection_name: str, compact):
+    with _registry_lock:
+        _registry[collection_name] = compact
+
+
+def unregister(collection_name: str):
+    with _registry_lock:
+        _registry.pop(collection_name, None)
+
+
+def get(collection_name: str):
+    return _registry.get(collection_name)
@@ -0,0 +1,82 @@
+import re
+import numpy as np
+from lexical_index import tokenize
+
+# Approximation sans tokenizer : ~4 caractères par token pour les modèles Ollama
+CHARS_PER_TOKEN = 4
+_SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+|\n+")
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def split_sentences(text: str):
+    return [sentence.strip() for sentence in _SENTENCE_END.split(text) if sentence.strip()]
+
+
+def _cosine(a, b):
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    norm = np.linalg.norm(a) * np.linalg.norm(b)
+    return float(np.dot(a, b) / norm) if norm else 0.0
+
+
+def _truncate(sentence, max_tokens):
+    # Couper à la frontière de mot la plus proche du budget
+    limit = max_tokens * CHARS_PER_TOKEN
+    if len(sentence) <= limit:
+        return sentence
+    cut = sentence.rfind(" ", 0, limit)
+    return sentence[:cut if cut > 0 else limit] + "..."
+
+
+def pack_context(query, chunks, max_tokens=200, query_vector=None, chunk_vectors=None,
+                 duplicate_threshold=0.8):
+    """Choisir les meilleures phrases des chunks récupérés dans un budget de tokens.
+
+    Score d'une phrase = part des termes de la question qu'elle contient
+    + pertinence du chunk d'origine : cosinus entre l'embedding de la
+    question et celui du chunk quand ils sont déjà connus, sinon son rang
+    de recherche. Les phrases en double (chevauchement entre chunks) sont
+    écartées. Les phrases retenues gardent l'ordre du document.
+    """
+    query_terms = set(tokenize(query))
+    candidates = []
+    for rank, chunk in enumerate(chunks):
+        vector = chunk_vectors[rank] if chunk_vectors else None
+        if query_vector is not None and vector is not None:
+            chunk_score = max(_cosine(query_vector, vector), 0.0)
+        else:
+            chunk_score = 1.0 / (1 + rank)
+        for position, sentence in enumerate(split_sentences(chunk)):
+            terms = set(tokenize(sentence))
+            if not terms:
+                continue
+            overlap = len(terms & query_terms) / len(query_terms) if query_terms else 0.0
+            candidates.append((overlap + 0.5 * chunk_score, rank, position, sentence, terms))
+
+    selected, used = [], 0
+    for score, rank, position, sentence, terms in sorted(candidates, key=lambda c: (-c[0], c[1], c[2])):
+        if used >= max_tokens:
+            break
+        if any(len(terms & other) / len(terms | other) >= duplicate_threshold
+               for _, _, _, other in selected):
+            continue
+        if estimate_tokens(sentence) > max_tokens - used:
+            if selected:
+                # Ne rentre plus : une phrase plus courte peut encore tenir
+                continue
+            sentence = _truncate(sentence, max_tokens)
+        used += estimate_tokens(sentence)
+        selected.append((rank, position, sentence, terms))
+
+    selected.sort(key=lambda s: (s[0], s[1]))
+    lines, current = [], None
+    for rank, _, sentence, _ in selected:
+        if rank != current:
+            lines.append(sentence)
+            current = rank
+        else:
+            lines[-1] += " " + sentence
+    return "\n".join(lines)
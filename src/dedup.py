@@ -0,0 +1,324 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import defaultdict
+from pathlib import Path
+import numpy as np
+from lexical_index import tokenize
+
+NUM_PERM = 128
+SHINGLE_SIZE = 5
+# Version des signatures : les signatures d'une autre version sont recalculées
+MINHASH_VERSION = 2
+# Nombre premier de Mersenne 2^61 - 1 : x mod p = (x & p) + (x >> 61), sans division
+_MERSENNE = (1 << 61) - 1
+_PRIME = np.uint64(_MERSENNE)
+_LOW32 = np.uint64(0xFFFFFFFF)
+
+
+def dedup_path(persist_dir):
+    """Signatures MinHash à côté du dossier Chroma (ex: data/chroma_db_dedup.sqlite)"""
+    persist_dir = Path(persist_dir)
+    return persist_dir.with_name(f"{persist_dir.name}_dedup.sqlite")
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set:
+    """Séquences de `size` mots consécutifs (texte normalisé, comme pour le BM25)"""
+    words = tokenize(text)
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def lsh_bands(threshold: float, num_perm: int = NUM_PERM):
+    """(bandes, lignes par bande) : deux chunks de similarité >= threshold partagent
+    une bande avec une probabilité >= 99 %, avec le moins de faux candidats possible"""
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        if 1 - (1 - threshold ** rows) ** bands >= 0.99:
+            best = (bands, rows)
+    return best
+
+
+def _mod_mersenne(x):
+    # x < 2^64 (uint64) -> x mod (2^61 - 1)
+    x = (x & _PRIME) + (x >> np.uint64(61))
+    return np.where(x >= _PRIME, x - _PRIME, x)
+
+
+class MinHasher:
+    """Signatures MinHash : la part de valeurs égales estime le Jaccard des shingles.
+
+    Hachage universel h -> (a * h + b) mod p, avec a et b tirés dans tout
+    [1, p) : des a trop petits donnent des permutations presque identiques
+    (toujours le même shingle minimal) et une estimation très bruitée.
+    """
+
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, _MERSENNE, num_perm, dtype=np.uint64)
+        self.b = rng.integers(1, _MERSENNE, num_perm, dtype=np.uint64)
+        # a = a_hi * 2^32 + a_lo : chaque produit partiel avec h < 2^32 tient dans un uint64
+        self._a_hi = self.a >> np.uint64(32)
+        self._a_lo = self.a & _LOW32
+        self.num_perm = num_perm
+
+    def signature(self, text: str):
+        """Signature (uint32 x num_perm), ou None pour un texte sans mots"""
+        grams = shingles(text)
+        if not grams:
+            return None
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=4).digest(), "little")
+             for gram in grams),
+            dtype=np.uint64, count=len(grams)
+        )
+        values = self._permute(hashes[:, None])
+        return (values.min(axis=0) & _LOW32).astype(np.uint32)
+
+    def _permute(self, h):
+        # (a * h + b) mod p en uint64, pour h < 2^32
+        high = _mod_mersenne(self._a_hi * h)    # < 2^29 * 2^32
+        # high * 2^32 mod p : les 29 bits hauts de high reviennent en bas (2^61 = 1 mod p)
+        high = (high >> np.uint64(29)) + ((high & np.uint64((1 << 29) - 1)) << np.uint64(32))
+        low = _mod_mersenne(self._a_lo * h)     # < 2^32 * 2^32
+        return _mod_mersenne(_mod_mersenne(high + low) + self.b)
+
+
+def similarity(signature_a, signature_b) -> float:
+    return float(np.mean(signature_a == signature_b))
+
+
+class DedupIndex:
+    """Index des quasi-doublons : signatures MinHash des chunks stockés + tables LSH (SQLite).
+
+    `find` retourne le chunk déjà indexé le plus proche dont la similarité
+    estimée atteint `threshold`. Les ajouts restent en mémoire (et visibles
+    par `find`) jusqu'à `flush` : les doublons à l'intérieur d'un même
+    fichier sont détectés sans écrire chunk par chunk.
+    """
+
+    def __init__(self, db_path, threshold: float = 0.9, num_perm: int = NUM_PERM):
+        if not 0 < threshold <= 1:
+            raise ValueError(f"Seuil de similarité invalide : {threshold} (entre 0 et 1)")
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm)
+        self.bands, self.rows = lsh_bands(threshold, num_perm)
+        db_path = Path(db_path)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.db_path = db_path
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._lock = threading.Lock()
+        self._pending = {}                      # id -> signature
+        self._pending_bands = defaultdict(set)  # clé de bande -> ids
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS signatures (id TEXT PRIMARY KEY, sig BLOB NOT NULL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS bands (key INTEGER NOT NULL, id TEXT NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_bands_key ON bands(key)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_bands_id ON bands(id)")
+            meta = dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+            stored = self._conn.execute("SELECT COUNT(*) FROM signatures").fetchone()[0]
+            if (meta.get("num_perm") not in (None, str(num_perm))
+                    or (stored and meta.get("version") != str(MINHASH_VERSION))):
+                # Signatures incompatibles : à recalculer (backfill_from_chroma)
+                self._conn.execute("DELETE FROM signatures")
+                self._conn.execute("DELETE FROM bands")
+            elif meta.get("rows") not in (None, str(self.rows)):
+                # Nouveau seuil : mêmes signatures, autres bandes
+                self._rebuild_bands()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                [("num_perm", str(num_perm)), ("rows", str(self.rows)), ("threshold", str(threshold)),
+                 ("version", str(MINHASH_VERSION))]
+            )
+
+    def signature(self, text: str):
+        return self.hasher.signature(text)
+
+    def find(self, signature, exclude=()):
+        """ID du chunk indexé le plus similaire (>= threshold), ou None"""
+        if signature is None:
+            return None
+        keys = self._band_keys(signature)
+        candidates = set()
+        for key in keys:
+            candidates |= self._pending_bands.get(key, set())
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT s.id, s.sig FROM signatures s WHERE s.id IN"
+                f" (SELECT id FROM bands WHERE key IN ({','.join('?' * len(keys))}))",
+                keys
+            ).fetchall()
+        found = {chunk_id: np.frombuffer(sig, dtype=np.uint32) for chunk_id, sig in rows}
+        found.update((chunk_id, self._pending[chunk_id]) for chunk_id in candidates)
+        best, best_score = None, self.threshold
+        for chunk_id, other in found.items():
+            if chunk_id in exclude:
+                continue
+            score = similarity(signature, other)
+            if score >= best_score:
+                best, best_score = chunk_id, score
+        return best
+
+    def add(self, chunk_id: str, signature):
+        if signature is None:
+            return
+        self._pending[chunk_id] = signature
+        for key in self._band_keys(signature):
+            self._pending_bands[key].add(chunk_id)
+
+    def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        self._pending_bands = defaultdict(set)
+        with self._lock, self._conn:
+            self._delete(list(pending))
+            self._conn.executemany("INSERT INTO signatures (id, sig) VALUES (?, ?)",
+                                   [(chunk_id, sig.tobytes()) for chunk_id, sig in pending.items()])
+            self._conn.executemany("INSERT INTO bands (key, id) VALUES (?, ?)",
+                                   [(key, chunk_id) for chunk_id, sig in pending.items()
+                                    for key in self._band_keys(sig)])
+
+    def delete(self, ids):
+        ids = list(ids)
+        for chunk_id in ids:
+            signature = self._pending.pop(chunk_id, None)
+            if signature is not None:
+                for key in self._band_keys(signature):
+                    self._pending_bands[key].discard(chunk_id)
+        if ids:
+            with self._lock, self._conn:
+                self._delete(ids)
+
+    def clear(self):
+        self._pending.clear()
+        self._pending_bands.clear()
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM signatures")
+            self._conn.execute("DELETE FROM bands")
+
+    def count(self) -> int:
+        with self._lock:
+            stored = self._conn.execute("SELECT COUNT(*) FROM signatures").fetchone()[0]
+        return stored + len(self._pending)
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+    # ------------------------------------------------------------------
+
+    def _band_keys(self, signature):
+        # Une clé entière (signée, 64 bits) par bande : hash de (numéro de bande, valeurs)
+        keys = []
+        for band in range(self.bands):
+            values = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            digest = hashlib.blake2b(band.to_bytes(2, "little") + values, digest_size=8).digest()
+            keys.append(int.from_bytes(digest, "little", signed=True))
+        return keys
+
+    def _delete(self, ids):
+        # Appelé sous verrou
+        for i in range(0, len(ids), 500):
+            part = ids[i:i + 500]
+            marks = ",".join("?" * len(part))
+            self._conn.execute(f"DELETE FROM bands WHERE id IN ({marks})", part)
+            self._conn.execute(f"DELETE FROM signatures WHERE id IN ({marks})", part)
+
+    def _rebuild_bands(self):
+        # Appelé sous verrou, dans une transaction
+        self._conn.execute("DELETE FROM bands")
+        for chunk_id, sig in self._conn.execute("SELECT id, sig FROM signatures").fetchall():
+            self._conn.executemany("INSERT INTO bands (key, id) VALUES (?, ?)",
+                                   [(key, chunk_id) for key in self._band_keys(np.frombuffer(sig, dtype=np.uint32))])
+
+
+def existing_threshold(db_path):
+    """Seuil de l'index de doublons existant, ou None"""
+    if not Path(db_path).exists():
+        return None
+    conn = sqlite3.connect(str(db_path))
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'threshold'").fetchone()
+    except sqlite3.Error:
+        row = None
+    finally:
+        conn.close()
+    return float(row[0]) if row else None
+
+
+def backfill_from_chroma(dedup_index, chroma_index, batch_size=1000):
+    """Calculer les signatures des chunks déjà présents dans Chroma"""
+    collection = chroma_index._collection
+    total = collection.count()
+    for offset in range(0, total, batch_size):
+        page = collection.get(include=["documents"], limit=batch_size, offset=offset)
+        for chunk_id, document in zip(page["ids"], page["documents"]):
+            dedup_index.add(chunk_id, dedup_index.signature(document or ""))
+        dedup_index.flush()
+    return total
+
+
+class ChunkRefs:
+    """Qui référence chaque chunk stocké, d'après les entrées du manifeste.
+
+    Une entrée de fichier liste ses chunks ; `aliases` associe un chunk
+    fusionné avec un quasi-doublon à {"chunk": ID stocké, "source", "page"}.
+    Un chunk stocké reste dans l'index tant qu'un fichier le référence,
+    même si le fichier qui l'a créé a changé ou disparu.
+    """
+
+    def __init__(self, files=None):
+        # ID stocké -> {(clé du fichier, ID du chunk dans le fichier): None (original) ou alias}
+        self.refs = defaultdict(dict)
+        for key, entry in (files or {}).items():
+            self.add(key, entry)
+
+    def add(self, key, entry):
+        aliases = entry.get("aliases", {})
+        for chunk_id in entry["chunks"]:
+            alias = aliases.get(chunk_id)
+            self.refs[alias["chunk"] if alias else chunk_id][(key, chunk_id)] = alias
+
+    def remove(self, key, entry) -> set:
+        """Retirer les références d'un fichier ; retourne les IDs stockés concernés"""
+        aliases = entry.get("aliases", {})
+        touched = set()
+        for chunk_id in entry["chunks"]:
+            alias = aliases.get(chunk_id)
+            stored = alias["chunk"] if alias else chunk_id
+            self.refs[stored].pop((key, chunk_id), None)
+            touched.add(stored)
+        return touched
+
+    def unreferenced(self, ids) -> list:
+        return [chunk_id for chunk_id in ids if not self.refs.get(chunk_id)]
+
+    def metadata(self, chunk_id, metadata) -> dict:
+        """Métadonnées d'un chunk stocké avec toutes ses références (source, page).
+
+        Si le fichier d'origine ne le référence plus, le premier doublon
+        restant devient la source principale.
+        """
+        metadata = dict(metadata or {})
+        refs = self.refs.get(chunk_id, {})
+        duplicates = [alias for alias in refs.values() if alias]
+        if duplicates and len(duplicates) == len(refs):
+            first = duplicates.pop(0)
+            metadata["source"] = first["source"]
+            if first.get("page") is not None:
+                metadata["page"] = first["page"]
+        metadata["duplicates"] = json.dumps(
+            [{"source": alias["source"], "page": alias.get("page")} for alias in duplicates],
+            ensure_ascii=False
+        )
+        metadata["duplicate_count"] = len(duplicates)
+        return metadata
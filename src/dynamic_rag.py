@@ -1,23 +1,115 @@
+import threading
+from functools import partial
 from pathlib import Path
-import tempfile
 from langchain_community.document_loaders import PyPDFLoader
+from pypdf import PdfReader
 from split import split_documents
-from langchain_chroma import Chroma
-from langchain_ollama import OllamaEmbeddings
+from embedding_cache import make_embeddings
+from embedding_pipeline import EmbeddingPipeline
+from index_manifest import chunk_ids
 from llm import CompagnionLLM
+from pdf_index_store import PdfIndexStore
+from session_indexes import SessionIndexes
+from query_cache import query_cache, cached_similarity_search
+from answer_cache import answer_cache
+from scheduler import scheduler
+import metrics
+
+class IndexingProgress:
+    """Avancement de l'indexation d'un PDF (mis à jour par les threads d'embedding)"""
+    
+    def __init__(self, pages_total):
+        self.pages_total = pages_total
+        self.pages_done = 0
+        self.pages_failed = 0
+        self.chunks = 0
+        # Vrai une fois meta.json écrit (index complet)
+        self.committed = False
+        self.error = None
+        self._finished = threading.Event()
+    
+    @property
+    def done(self):
+        return self._finished.is_set()
+    
+    def finish(self):
+        self._finished.set()
+    
+    def wait(self, timeout=None) -> bool:
+        """Attendre la fin de l'indexation ; vrai si elle est terminée"""
+        return self._finished.wait(timeout)
+    
+    @property
+    def coverage(self):
+        return self.pages_done / self.pages_total if self.pages_total else 1.0
+    
+    def describe(self):
+        if not self.done:
+            return (f"[...] Indexation : {self.pages_done}/{self.pages_total} pages "
+                    f"({self.coverage:.0%}) - vous pouvez déjà poser des questions")
+        if self.committed:
+            return f"[✓] {self.chunks} chunks créés à partir de {self.pages_total} pages"
+        if self.pages_failed:
+            return (f"[!] {self.pages_failed} pages non indexées (Ollama indisponible ?) : "
+                    f"réponses basées sur {self.pages_done}/{self.pages_total} pages, "
+                    f"index reconstruit au prochain chargement")
+        reason = f" ({self.error})" if self.error else ""
+        return (f"[!] Indexation interrompue{reason} : {self.pages_done}/{self.pages_total} pages indexées, "
+                f"index reconstruit au prochain chargement")
 
 class DynamicRAG:
     """RAG dynamique - charger un PDF à la volée"""
     
-    def __init__(self):
-        self.llm = CompagnionLLM(model="orca-mini")
-        self.embeddings = OllamaEmbeddings(
+    def __init__(self, store=None, max_memory_mb=1024):
+        self.embeddings = make_embeddings(
             model="nomic-embed-text",
             base_url="http://localhost:11434"
         )
+        # Les embeddings des chunks (cache disque) servent à classer leurs phrases dans le prompt
+        self.llm = CompagnionLLM(
+            model="orca-mini",
+            answer_cache=answer_cache,
+            vector_lookup=getattr(self.embeddings, "lookup", None)
+        )
+        # Index persistés par PDF : un PDF déjà vu n'est pas ré-embeddé
+        self.store = store or PdfIndexStore()
+        # Index par session Gradio, bornés en mémoire (les évincés restent sur disque)
+        self.sessions = SessionIndexes(self.store, self.embeddings, max_memory_mb=max_memory_mb)
+        # empreinte -> (index, IndexingProgress) des PDF en cours d'indexation
+        self._building = {}
+        # empreinte -> (index, IndexingProgress) des indexations terminées sans meta.json
+        # (pages en erreur, interruption) : les réponses signalent la couverture partielle
+        self._incomplete = {}
+    
+    def warmup(self):
+        """Charger le modèle d'embedding et le LLM avant la première question"""
+        # Sans passer par le cache disque : on veut un vrai appel à Ollama
+        error = self.llm.backend.warmup(embedding_models=[self.embeddings.model])[self.embeddings.model]
+        if error is not None:
+            raise error
+        self.llm.warmup()
+    
+    def load_pdf(self, pdf_path, session_id=None):
+        """Charger et indexer un PDF (ou rouvrir son index s'il existe déjà).
+
+        Avec `session_id`, l'index devient celui de la session (voir `sessions.use`).
+        Retourne (index, message) une fois l'indexation terminée.
+        """
+        result = (None, "[X] Aucun document trouvé")
+        for result in self.iter_load_pdf(pdf_path, session_id):
+            pass
+        return result
     
-    def load_pdf(self, pdf_path):
-        """Charger et indexer un PDF"""
+    def iter_load_pdf(self, pdf_path, session_id=None):
+        """Indexer un PDF page par page : yield (index, message) au fil de l'eau.
+
+        Chaque page est parsée, découpée et envoyée à l'embedding dès qu'elle
+        est lue ; ses chunks sont ajoutés à l'index dès qu'ils sont embeddés.
+        L'index est rattaché à la session dès le premier yield : on peut
+        l'interroger pendant l'indexation (voir `progress`). L'indexation
+        tourne dans un thread : elle continue même si l'interface cesse de
+        lire ce générateur (client déconnecté).
+        """
         try:
             # Gradio passe directement le chemin du fichier
             if isinstance(pdf_path, str):
@@ -26,42 +118,209 @@ class DynamicRAG:
                 file_path = str(pdf_path)
             
             print(f"[LOAD] Chargement du PDF: {file_path}")
+            fingerprint = self.store.fingerprint(file_path)
             
-            # Charger le PDF
-            loader = PyPDFLoader(file_path)
-            documents = loader.load()
-            
-            if not documents:
-                return None, "[X] Aucun document trouvé"
-            
-            print(f"[OK] {len(documents)} pages chargées")
-            
-            # Diviser en chunks
-            chunks = split_documents(documents)
-            print(f"[OK] {len(chunks)} chunks créés")
+            building = False
+            with self.store.lock(fingerprint):
+                # PDF en cours d'indexation (autre session) : suivre son avancement
+                chroma_index, progress = self._building.get(fingerprint, (None, None))
+                if chroma_index is None:
+                    # PDF déjà indexé : on réutilise l'index ouvert, ou on le rouvre.
+                    # Sans meta.json, l'index (même ouvert) est incomplet : il est reconstruit
+                    meta = self.store.read_meta(fingerprint)
+                    if meta is None:
+                        chroma_index = None
+                    else:
+                        chroma_index = self.sessions.get_open(fingerprint)
+                        if chroma_index is None:
+                            chroma_index, meta = self.store.open(fingerprint, self.embeddings)
+                    if chroma_index is None:
+                        pages_total = len(PdfReader(file_path).pages)
+                        if pages_total == 0:
+                            yield None, "[X] Aucun document trouvé"
+                            return
+                        # Reste d'une indexation interrompue encore ouvert : le fermer avant de l'effacer
+                        self.sessions.discard(fingerprint)
+                        self._incomplete.pop(fingerprint, None)
+                        chroma_index = self.store.begin(fingerprint, self.embeddings)
+                        progress = IndexingProgress(pages_total)
+                        self._building[fingerprint] = (chroma_index, progress)
+                        building = True
             
-            # Créer l'index Chroma
-            chroma_index = Chroma.from_documents(
-                documents=chunks,
-                embedding=self.embeddings,
-                collection_name="dynamic_pdf"
-            )
+            if session_id is not None:
+                self.sessions.attach(session_id, fingerprint, chroma_index)
             
-            return chroma_index, f"[✓] {len(chunks)} chunks créés à partir de {len(documents)} pages"
+            if building:
+                threading.Thread(
+                    target=self._build,
+                    args=(file_path, fingerprint, chroma_index, progress),
+                    name=f"pdf-index-{fingerprint[:12]}",
+                    daemon=True
+                ).start()
+            if progress is not None:
+                # Indexation de cette session ou d'une autre : suivre son avancement
+                yield chroma_index, progress.describe()
+                while not progress.wait(0.5):
+                    yield chroma_index, progress.describe()
+                yield chroma_index, progress.describe()
+            else:
+                print(f"[OK] Index existant réutilisé ({fingerprint[:12]})")
+                yield chroma_index, f"[✓] Index existant réutilisé : {meta['chunks']} chunks, {meta['pages']} pages"
         
         except Exception as e:
             print(f"Erreur: {e}")
-            return None, f"[X] Erreur: {str(e)}"
+            yield None, f"[X] Erreur: {str(e)}"
     
-    def ask_question(self, chroma_index, question):
-        """Poser une question sur le PDF"""
-        results = chroma_index.similarity_search(question, k=3)
+    def _build(self, file_path, fingerprint, chroma_index, progress):
+        """Thread d'indexation d'un PDF, indépendant du générateur de l'interface"""
+        try:
+            self._index_pages(file_path, fingerprint, chroma_index, progress)
+        except Exception as e:
+            print(f"[X] Indexation interrompue ({fingerprint[:12]}): {e}")
+            progress.error = str(e)
+        finally:
+            with self.store.lock(fingerprint):
+                self._building.pop(fingerprint, None)
+                if not progress.committed:
+                    self._incomplete[fingerprint] = (chroma_index, progress)
+                progress.finish()
+        # Faire de la place (âge / budget disque), sans toucher aux index des sessions
+        self.store.gc(keep={fingerprint} | self.sessions.fingerprints())
+    
+    def _index_pages(self, file_path, fingerprint, chroma_index, progress):
+        def page_indexed(page_no, error, chunks=0):
+            # Appelé par les threads d'embedding quand tous les chunks de la page sont écrits
+            if error is None:
+                progress.pages_done += 1
+                progress.chunks += chunks
+            else:
+                progress.pages_failed += 1
+        
+        # Le dossier n'est pas fermé par le budget mémoire pendant qu'on y écrit
+        with self.sessions.hold(fingerprint, chroma_index), \
+                EmbeddingPipeline(self.embeddings, chroma_index, batch_size=16, max_in_flight=2,
+                                  progress_every=float("inf"),
+                                  lexical_index=self.store.lexical(fingerprint)) as pipeline:
+            pages = metrics.timed(PyPDFLoader(file_path).lazy_load(), "pdf_load")
+            for page_no, page in enumerate(pages):
+                with metrics.span("split"):
+                    chunks = split_documents([page])
+                pipeline.add(
+                    [chunk.page_content for chunk in chunks],
+                    [chunk.metadata for chunk in chunks],
+                    [chunk_id for chunk_id, _ in chunk_ids(f"{fingerprint}:{page_no}", chunks)],
+                    tag=page_no,
+                    on_done=partial(page_indexed, chunks=len(chunks))
+                )
+        
+        print(f"[OK] {progress.pages_done}/{progress.pages_total} pages, {progress.chunks} chunks indexés")
+        if progress.pages_failed:
+            # Pas de meta.json : l'index sera reconstruit au prochain chargement
+            return
+        
+        self.store.commit(
+            fingerprint,
+            chunks=progress.chunks,
+            pages=progress.pages_total,
+            source_name=Path(file_path).name
+        )
+        progress.committed = True
+    
+    def progress(self, chroma_index):
+        """Avancement de l'indexation de cet index (en cours ou terminée sans
+        meta.json), ou None s'il est complet"""
+        name = chroma_index._collection.name
+        for building_index, progress in list(self._building.values()):
+            if building_index._collection.name == name:
+                return progress
+        for fingerprint, (partial_index, progress) in list(self._incomplete.items()):
+            if partial_index._collection.name == name:
+                if self.store.read_meta(fingerprint) is not None:
+                    # Complété depuis (reconstruction par une autre session)
+                    self._incomplete.pop(fingerprint, None)
+                    return None
+                return progress
+        return None
+    
+    def _coverage_note(self, chroma_index):
+        progress = self.progress(chroma_index)
+        if progress is None or progress.committed:
+            return ""
+        if progress.done:
+            return f"[Index incomplet : réponse basée sur {progress.pages_done}/{progress.pages_total} pages]\n\n"
+        return f"[Indexation en cours : réponse basée sur {progress.pages_done}/{progress.pages_total} pages]\n\n"
+    
+    def _retrieve(self, chroma_index, question):
+        """Recherche des chunks : retourne (chunks, embedding de la question, version de l'index)"""
+        with metrics.span("retrieval", index="pdf"):
+            results = cached_similarity_search(chroma_index, question, k=3)
         chunks = [doc.page_content for doc in results]
+        # Embedding déjà calculé pour la recherche (None en mode lexical seul)
+        query_vector = query_cache.cached_query_vector(chroma_index.embeddings, question)
+        return chunks, query_vector, query_cache.index_version(chroma_index)
+    
+    def ask_question(self, chroma_index, question):
+        """Poser une question sur le PDF (éventuellement en cours d'indexation)"""
+        note = self._coverage_note(chroma_index)
+        chunks, query_vector, index_key = self._retrieve(chroma_index, question)
         
         response = self.llm.generate_response(
             question,
             context=chunks,
-            language="français"
+            language="français",
+            query_vector=query_vector,
+            index_key=index_key
         )
         
-        return response, chunks
\ No newline at end of file
+        return (note + response if response else response), chunks
+    
+    def ask_question_stream(self, chroma_index, question):
+        """Poser une question en streaming : yield (réponse partielle, sources).
+
+        Les sources sont envoyées avant le premier token. Si le PDF est encore
+        en cours d'indexation, la réponse commence par la couverture actuelle.
+        """
+        note = self._coverage_note(chroma_index)
+        chunks, query_vector, index_key = self._retrieve(chroma_index, question)
+        yield "", chunks
+        
+        answer = note
+        for token in self.llm.stream_response(
+            question,
+            context=chunks,
+            language="français",
+            query_vector=query_vector,
+            index_key=index_key
+        ):
+            answer += token
+            yield answer, chunks
+    
+    async def aask_question(self, chroma_index, question):
+        """Version asynchrone de ask_question, via l'ordonnanceur partagé"""
+        note = self._coverage_note(chroma_index)
+        chunks, query_vector, index_key = await scheduler.retrieve(self._retrieve, chroma_index, question)
+        
+        options = dict(context=chunks, language="français", query_vector=query_vector, index_key=index_key)
+        # Réponse en cache : sans attendre un créneau de génération
+        response = self.llm.cached_response(question, **options)
+        if response is None:
+            response = await scheduler.generate(self.llm.model, self.llm.agenerate_response, question, **options)
+        
+        return (note + response if response else response), chunks
+    
+    async def aask_question_stream(self, chroma_index, question):
+        """Version asynchrone de ask_question_stream, via l'ordonnanceur partagé"""
+        note = self._coverage_note(chroma_index)
+        chunks, query_vector, index_key = await scheduler.retrieve(self._retrieve, chroma_index, question)
+        yield "", chunks
+        
+        options = dict(context=chunks, language="français", query_vector=query_vector, index_key=index_key)
+        # Réponse en cache : sans attendre un créneau de génération
+        cached = self.llm.cached_response(question, **options)
+        if cached is not None:
+            yield note + cached, chunks
+            return
+        answer = note
+        async for token in scheduler.stream(self.llm.model, self.llm.astream_response, question, **options):
+            answer += token
+            yield answer, chunks
@@ -0,0 +1,210 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from pathlib import Path
+from typing import List
+from langchain_core.embeddings import Embeddings
+from ollama_clients import get_embeddings
+from query_batcher import batched
+import metrics
+
+DEFAULT_CACHE_PATH = Path(__file__).parent.parent / "data" / "embedding_cache.sqlite"
+DEFAULT_MODEL = "nomic-embed-text"
+DEFAULT_BASE_URL = "http://localhost:11434"
+
+
+def normalize_text(text: str) -> str:
+    """Normalisation avant hash : NFC + espaces compactés"""
+    text = unicodedata.normalize("NFC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """Cache disque (SQLite) devant un modèle d'embeddings.
+
+    Clé = (modèle, hash du texte normalisé). Les vecteurs sont stockés en
+    float32. Au-delà de `max_entries`, les entrées les moins récemment
+    utilisées sont évincées (LRU).
+    """
+
+    def __init__(self, base: Embeddings, model: str, db_path=DEFAULT_CACHE_PATH,
+                 max_entries: int = 500_000):
+        self.base = base
+        self.model = model
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        db_path = Path(db_path)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.db_path = db_path
+        # Partagée entre threads (pipeline d'indexation, Gradio) : protégée par un verrou
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY,"
+                " model TEXT NOT NULL,"
+                " vector BLOB NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)"
+            )
+        self._size = self._count()
+
+    # ------------------------------------------------------------------
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [cache_key(self.model, text) for text in texts]
+        found = self._get_many(set(keys))
+
+        # Un seul appel au modèle pour tous les textes absents (dédoublonnés)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        self._record(len(texts) - len(missing), len(missing))
+        metrics.inc("rag_cache_hits_total", len(texts) - len(missing), cache="embeddings")
+        metrics.inc("rag_cache_misses_total", len(missing), cache="embeddings")
+
+        if missing:
+            vectors = self.base.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self._put_many(computed)
+            found.update(computed)
+
+        return [list(found[key]) for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = cache_key(self.model, text)
+        found = self._get_many({key})
+        metrics.hit("embeddings", key in found)
+        if key in found:
+            self._record(1, 0)
+            return list(found[key])
+        self._record(0, 1)
+        vector = self.base.embed_query(text)
+        self._put_many({key: vector})
+        return vector
+
+    def lookup(self, texts: List[str]) -> List:
+        """Vecteurs déjà en cache (None pour les absents), sans appel au modèle"""
+        keys = [cache_key(self.model, text) for text in texts]
+        found = self._get_many(set(keys))
+        return [list(found[key]) if key in found else None for key in keys]
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "entries": self._size,
+            "max_entries": self.max_entries,
+        }
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM embeddings WHERE model = ?", (self.model,))
+        self._size = self._count()
+
+    # ------------------------------------------------------------------
+
+    def _record(self, hits: int, misses: int):
+        # Appelé depuis les threads du pipeline et des questions
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def _count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _get_many(self, keys) -> dict:
+        if not keys:
+            return {}
+        keys = list(keys)
+        found = {}
+        with self._lock, self._conn:
+            # SQLite limite le nombre de paramètres par requête
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})",
+                    part
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+        return found
+
+    def _put_many(self, vectors: dict):
+        now = time.time()
+        rows = [(key, self.model, array("f", vector).tobytes(), now)
+                for key, vector in vectors.items()]
+        keys = list(vectors)
+        with self._lock, self._conn:
+            # Les clés déjà présentes (calculées en parallèle par un autre thread) sont remplacées
+            existing = 0
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                existing += self._conn.execute(
+                    f"SELECT COUNT(*) FROM embeddings WHERE key IN ({','.join('?' * len(part))})",
+                    part
+                ).fetchone()[0]
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._size += len(rows) - existing
+            if self._size > self.max_entries:
+                self._evict()
+
+    def _evict(self):
+        # Appelé sous verrou : on redescend à 90% pour ne pas évincer à chaque insertion
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = self._size - int(self.max_entries * 0.9)
+        if excess <= 0:
+            return
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN ("
+            " SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,)
+        )
+        self._size -= excess
+        self.evictions += excess
+
+
+def make_embeddings(model: str = DEFAULT_MODEL, base_url: str = DEFAULT_BASE_URL,
+                    cache: bool = True, batch_queries: bool = True, **cache_kwargs) -> Embeddings:
+    """Construire les embeddings Ollama du projet, avec cache disque par défaut.
+
+    Le client Ollama (connexions, keep_alive) est partagé par tout le processus ;
+    avec `batch_queries`, les questions simultanées sont embeddées par lots.
+    """
+    embeddings = get_embeddings(model, base_url)
+    if batch_queries:
+        embeddings = batched(embeddings)
+    if not cache:
+        return embeddings
+    return CachedEmbeddings(embeddings, model=model, **cache_kwargs)
@@ -0,0 +1,176 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+
+
+class EmbeddingPipeline:
+    """Embeddings par lots, avec un nombre borné de requêtes Ollama en vol.
+
+    Les chunks sont regroupés en lots de `batch_size`. Au plus `max_in_flight`
+    lots sont envoyés en même temps : au-delà, `add` bloque (backpressure) au
+    lieu d'accumuler le corpus en mémoire. Chaque lot est écrit dans la
+    collection Chroma dès qu'il est embeddé, et retenté en cas d'erreur.
+    Avec `lexical_index` (BM25Index), les mêmes chunks y sont écrits en même
+    temps : les deux index restent synchronisés.
+    """
+
+    def __init__(self, embeddings, chroma_index, batch_size=32, max_in_flight=4,
+                 max_retries=3, retry_delay=1.0, progress_every=5.0, lexical_index=None):
+        self.embeddings = embeddings
+        self.collection = chroma_index._collection
+        self.lexical_index = lexical_index
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.progress_every = progress_every
+
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        # Sérialise les écritures Chroma et la comptabilité
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._futures = []
+        # tag -> [chunks restants, première erreur, callback]
+        self._tags = {}
+
+        self.submitted = 0
+        self.written = 0
+        self.failed = 0
+        self._start = None
+        self._last_report = 0.0
+
+    # ------------------------------------------------------------------
+
+    def add(self, texts, metadatas, ids, tag=None, on_done=None):
+        """Ajouter des chunks. `on_done(tag, erreur)` est appelé quand tous
+        les chunks du tag sont écrits (erreur=None) ou ont échoué."""
+        if self._start is None:
+            self._start = time.time()
+        if tag is not None:
+            with self._lock:
+                self._tags[tag] = [len(ids), None, on_done]
+            if not ids:
+                self._finish_tag(tag)
+                return
+        for item in zip(texts, metadatas, ids):
+            self._buffer.append((item, tag))
+            self.submitted += 1
+            if len(self._buffer) >= self.batch_size:
+                self._dispatch()
+
+    def delete(self, ids):
+        """Supprimer des chunks (sérialisé avec les écritures en cours)"""
+        if ids:
+            with self._lock:
+                self.collection.delete(ids=ids)
+                if self.lexical_index is not None:
+                    self.lexical_index.delete(ids)
+
+    def flush(self):
+        """Envoyer le dernier lot partiel et attendre la fin de tous les lots"""
+        if self._buffer:
+            self._dispatch()
+        for future in self._futures:
+            future.result()
+        self._futures = []
+        self._report(force=True)
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._executor.shutdown(cancel_futures=True)
+
+    # ------------------------------------------------------------------
+
+    def _dispatch(self):
+        batch, self._buffer = self._buffer, []
+        # Backpressure : attendre qu'un lot se termine s'il y en a trop en vol
+        self._slots.acquire()
+        self._futures = [f for f in self._futures if not f.done()]
+        self._futures.append(self._executor.submit(self._run_batch, batch))
+
+    def _run_batch(self, batch):
+        try:
+            texts = [text for (text, _, _), _ in batch]
+            error = None
+            for attempt in range(self.max_retries + 1):
+                try:
+                    with metrics.span("embed"):
+                        vectors = self.embeddings.embed_documents(texts)
+                    break
+                except Exception as e:
+                    error = e
+                    if attempt < self.max_retries:
+                        delay = self.retry_delay * (2 ** attempt)
+                        print(f"  [!] Lot de {len(batch)} chunks en erreur ({e}), "
+                              f"nouvel essai dans {delay:.1f}s")
+                        time.sleep(delay)
+            else:
+                print(f"  [X] Lot de {len(batch)} chunks abandonné: {error}")
+                with self._lock:
+                    self.failed += len(batch)
+                    self._account(batch, error)
+                return
+
+            ids = [chunk_id for (_, _, chunk_id), _ in batch]
+            metadatas = [metadata or None for (_, metadata, _), _ in batch]
+            with self._lock, metrics.span("index_write"):
+                self.collection.upsert(
+                    ids=ids,
+                    embeddings=vectors,
+                    documents=texts,
+                    # Chroma refuse les métadonnées vides
+                    metadatas=metadatas
+                )
+                if self.lexical_index is not None:
+                    self.lexical_index.add(ids, texts, metadatas)
+                self.written += len(batch)
+                self._account(batch, None)
+            self._report()
+        finally:
+            self._slots.release()
+
+    def _account(self, batch, error):
+        # Appelé sous self._lock
+        for _, tag in batch:
+            if tag is None:
+                continue
+            state = self._tags[tag]
+            state[0] -= 1
+            if error is not None and state[1] is None:
+                state[1] = error
+            if state[0] == 0:
+                self._call_done(tag)
+
+    def _finish_tag(self, tag):
+        with self._lock:
+            self._call_done(tag)
+
+    def _call_done(self, tag):
+        _, error, on_done = self._tags.pop(tag)
+        if on_done is not None:
+            on_done(tag, error)
+
+    def rate(self):
+        """Débit en chunks/seconde depuis le premier ajout"""
+        if self._start is None:
+            return 0.0
+        elapsed = time.time() - self._start
+        return self.written / elapsed if elapsed > 0 else 0.0
+
+    def _report(self, force=False):
+        now = time.time()
+        if not force and now - self._last_report < self.progress_every:
+            return
+        self._last_report = now
+        print(f"  [EMBED] {self.written}/{self.submitted} chunks écrits "
+              f"({self.rate():.1f} chunks/s, {self.failed} en échec)")
@@ -1,140 +1,519 @@
+import argparse
+import os
+import shutil
 import time
+from functools import partial
 from pathlib import Path
 from langchain_chroma import Chroma
-from langchain_ollama import OllamaEmbeddings
-from ingest import load_documents_from_folder
-from split import split_documents
-
-print("\n" + "="*70)
-print("CRÉATION DE L'INDEX CHROMA")
-print("="*70 + "\n")
-
-project_root = Path(__file__).parent.parent
-docs_path = project_root / "docs"
-persist_dir = project_root / "data" / "chroma_db"
-
-# Créer le dossier si nécessaire
-persist_dir.mkdir(parents=True, exist_ok=True)
-
-# ÉTAPE 1: Charger les documents
-print(" Chargement des documents...")
-start = time.time()
-documents = load_documents_from_folder(docs_path)
-load_time = time.time() - start
-print(f"{len(documents)} documents en {load_time:.2f} secondes\n")
-
-# ÉTAPE 2: Diviser en chunks
-print(" Division en chunks...")
-start = time.time()
-chunks = split_documents(documents)
-split_time = time.time() - start
-print(f" {len(chunks)} chunks en {split_time:.1f} secondes\n")
-
-# ÉTAPE 3: Créer les embeddings
-print(" Création des embeddings Ollama...")
-print("Peut prendre du temps (surtout si c'est la première fois)...")
-
-try:
-    embeddings = OllamaEmbeddings(
-        model="nomic-embed-text",
-        base_url="http://localhost:11434"
-    )
-    # Test de connexion
-    test_embedding = embeddings.embed_query("test")
-    print(f" Ollama connecté (embedding de dimension {len(test_embedding)})\n")
-except Exception as e:
-    print(f" Erreur de connexion à Ollama: {e}")
-    print("Vérifiez que Ollama est installé et lancé :")
-    print("  - Installation : curl -fsSL https://ollama.com/install.sh | sh")
-    print("  - Lancer : ollama serve")
-    print("  - Télécharger le modèle : ollama pull nomic-embed-text")
-    exit(1)
-
-# ÉTAPE 4: Créer l'index Chroma
-print(" Création de l'index Chroma...")
-start = time.time()
-
-try:
-    # Préparer les données
-    texts = [chunk.page_content for chunk in chunks]
-    metadatas = [chunk.metadata for chunk in chunks]
-    
-    # Ajouter un ID unique pour chaque chunk
-    ids = [f"chunk_{i}" for i in range(len(chunks))]
-    
-    # Créer l'index avec persistance AUTOMATIQUE
+from embedding_cache import make_embeddings
+from ingest import list_document_files, iter_loaded_files
+from split import iter_split_documents
+from embedding_pipeline import EmbeddingPipeline
+from lexical_index import BM25Index, lexical_path, backfill_from_chroma
+from compact_vectors import compact_path, build_from_chroma, existing_dtype
+import dedup
+from query_cache import cached_similarity_search
+from sharded_index import (
+    ShardedIndex, shards_path, shard_collection, new_shard_map, load_shard_map,
+    save_shard_map, assign_files, shard_files
+)
+from index_manifest import (
+    manifest_path, empty_manifest, load_manifest, save_manifest,
+    file_hash, chunk_ids, diff_files
+)
+
+
+def plan_index(persist_dir, collection_name, current_hashes, full=False):
+    """Comparer les fichiers d'un index (ou d'un shard) à son manifeste"""
+    manifest_file = manifest_path(persist_dir)
+    previous = load_manifest(manifest_file, collection_name)
+    manifest = None if full else previous
+    new_files, changed_files, unchanged_files, removed_files = diff_files(manifest, current_hashes)
+    return {
+        "persist_dir": Path(persist_dir),
+        "collection": collection_name,
+        "manifest_file": manifest_file,
+        "previous": previous,
+        "manifest": manifest,
+        "hashes": current_hashes,
+        "new": new_files,
+        "changed": changed_files,
+        "unchanged": unchanged_files,
+        "removed": removed_files,
+    }
+
+
+def update_index(plan, embeddings, docs_path, args):
+    """Mettre à jour un index (ou un shard) : Chroma, BM25, vecteurs compacts et manifeste.
+
+    Retourne les compteurs du lancement, l'index et son nouveau manifeste.
+    """
+    persist_dir = plan["persist_dir"]
+    collection_name = plan["collection"]
+    manifest_file = plan["manifest_file"]
+    manifest, previous = plan["manifest"], plan["previous"]
+    persist_dir.mkdir(parents=True, exist_ok=True)
+
+    old_files = manifest["files"] if manifest else {}
+    new_manifest = empty_manifest(collection_name)
+    # La révision reste croissante même après --full
+    base_revision = previous["revision"] if previous else 0
+    new_manifest["revision"] = base_revision
+    for key in plan["unchanged"] + plan["changed"]:
+        # Un fichier modifié garde son ancienne entrée tant qu'il n'est pas réindexé
+        new_manifest["files"][key] = old_files[key]
+
+    documents_count = 0
+    deleted_count = 0
+    merged_count = 0
+    failures = []
+    failed_keys = []
+
+    def mark_changed():
+        # Une seule nouvelle révision par lancement
+        if new_manifest["revision"] == base_revision:
+            new_manifest["revision"] += 1
+
+    def file_indexed(key, error, entry, added, removed):
+        # Appelé par le pipeline quand tous les lots du fichier sont écrits
+        if error is not None:
+            # Le fichier garde son ancienne entrée : il sera retenté
+            failures.append((key, f"embedding: {error}"))
+            failed_keys.append(key)
+            return
+        # Le manifeste n'est mis à jour qu'une fois le fichier indexé
+        new_manifest["files"][key] = entry
+        mark_changed()
+        save_manifest(manifest_file, new_manifest)
+        merged = f", {len(entry['aliases'])} doublons fusionnés" if entry.get("aliases") else ""
+        print(f"  [OK] {key} : +{added} / -{removed} chunks{merged}")
+
     # La persistance se fait automatiquement quand on spécifie persist_directory
-    chroma_index = Chroma.from_texts(
-        texts=texts,
-        embedding=embeddings,
-        metadatas=metadatas,
-        ids=ids,
+    chroma_index = Chroma(
         persist_directory=str(persist_dir),
-        collection_name="rag_documents"
+        embedding_function=embeddings,
+        collection_name=collection_name
+    )
+
+    # Index BM25 (recherche lexicale) sur les mêmes chunks, mis à jour avec Chroma
+    lexical = BM25Index(lexical_path(persist_dir))
+
+    # Quasi-doublons (MinHash) : un chunk trop proche d'un chunk déjà indexé n'est pas
+    # embeddé, il référence ce chunk (seuil --dedup, ou celui de l'index existant)
+    dedup_file = dedup.dedup_path(persist_dir)
+    dedup_threshold = args.dedup if args.dedup is not None else dedup.existing_threshold(dedup_file)
+    deduper = None
+    if args.dedup == 0:
+        dedup_file.unlink(missing_ok=True)
+    elif dedup_threshold:
+        deduper = dedup.DedupIndex(dedup_file, threshold=dedup_threshold)
+
+    if manifest is None:
+        # Sans manifeste, les IDs existants (ex: anciens chunk_{i}) sont inconnus
+        chroma_index.reset_collection()
+        lexical.clear()
+        if deduper is not None:
+            deduper.clear()
+        mark_changed()
+        save_manifest(manifest_file, new_manifest)
+    else:
+        if lexical.count() != chroma_index._collection.count():
+            # Index BM25 absent ou désynchronisé (ex: index créé avant le BM25)
+            print(" Reconstruction de l'index BM25 depuis Chroma...")
+            lexical.clear()
+            backfill_from_chroma(lexical, chroma_index)
+        if deduper is not None and deduper.count() != chroma_index._collection.count():
+            print(" Calcul des signatures MinHash des chunks existants...")
+            deduper.clear()
+            dedup.backfill_from_chroma(deduper, chroma_index)
+
+    pipeline = EmbeddingPipeline(
+        embeddings, chroma_index,
+        batch_size=args.batch_size,
+        max_in_flight=args.max_in_flight,
+        max_retries=args.max_retries,
+        lexical_index=lexical
     )
-    
- 
-    embeddings_time = time.time() - start
-    print(f"Index créé avec succès en {embeddings_time:.1f} secondes\n")
-    
-    # Vérifier que l'index a été sauvegardé
-    if persist_dir.exists() and any(persist_dir.iterdir()):
-        print(f" Index sauvegardé dans : {persist_dir}")
+
+    # Chunks stockés -> fichiers qui les référencent (un chunk fusionné reste tant qu'il est référencé)
+    refs = dedup.ChunkRefs(old_files)
+    touched = set()      # chunks stockés dont les références ont changé
+    added_ids = {}       # fichier -> chunks envoyés à l'embedding
+    new_aliases = {}     # fichier -> chunks stockés qu'il référence depuis ce lancement
+
+    def drop(stored_ids):
+        # Supprimer les chunks stockés que plus aucun fichier ne référence
+        dead = refs.unreferenced(stored_ids)
+        pipeline.delete(dead)
+        if deduper is not None:
+            deduper.delete(dead)
+        return len(dead)
+
+    # Fichiers supprimés de docs/
+    for key in plan["removed"]:
+        released = refs.remove(key, old_files[key])
+        touched |= released
+        deleted_count += drop(released)
+        mark_changed()
+    save_manifest(manifest_file, new_manifest)
+
+    # Fichiers nouveaux ou modifiés
+    filepaths = [str(docs_path / key) for key in plan["new"] + plan["changed"]]
+    with pipeline:
+        for filepath, documents, error in iter_loaded_files(filepaths, args.workers):
+            key = Path(filepath).relative_to(docs_path).as_posix()
+            if error:
+                # Le fichier sera retenté au prochain lancement
+                print(f" Erreur lors du chargement de {key}: {error}")
+                failures.append((key, error))
+                continue
+
+            chunks = list(iter_split_documents(documents))
+            documents_count += len(documents)
+
+            old_entry = old_files.get(key, {"chunks": {}})
+            old_chunks = old_entry["chunks"]
+            old_aliases = old_entry.get("aliases", {})
+            identified = chunk_ids(key, chunks)
+            entries = {chunk_id: h for chunk_id, h in identified}
+            stale = {chunk_id for chunk_id in old_chunks if chunk_id not in entries}
+            released = refs.remove(key, old_entry)
+
+            aliases = {}
+            texts, metadatas, ids = [], [], []
+            for chunk, (chunk_id, h) in zip(chunks, identified):
+                if chunk_id in old_chunks:
+                    if chunk_id in old_aliases:
+                        aliases[chunk_id] = old_aliases[chunk_id]
+                    continue
+                if deduper is not None:
+                    signature = deduper.signature(chunk.page_content)
+                    # Pas de fusion avec les anciennes versions des chunks de ce fichier
+                    match = deduper.find(signature, exclude=stale)
+                    if match is not None and match != chunk_id:
+                        aliases[chunk_id] = {"chunk": match,
+                                             "source": str(chunk.metadata.get("source", key)),
+                                             "page": chunk.metadata.get("page")}
+                        continue
+                    deduper.add(chunk_id, signature)
+                texts.append(chunk.page_content)
+                metadatas.append(chunk.metadata)
+                ids.append(chunk_id)
+
+            entry = {"hash": plan["hashes"][key], "chunks": entries}
+            if aliases:
+                entry["aliases"] = aliases
+            refs.add(key, entry)
+            linked = {alias["chunk"] for chunk_id, alias in aliases.items() if chunk_id not in old_chunks}
+            merged_count += sum(1 for chunk_id in aliases if chunk_id not in old_chunks)
+            touched |= released | linked
+            new_aliases[key] = linked
+            added_ids[key] = ids
+            removed = drop(released)
+            if deduper is not None:
+                deduper.flush()
+
+            pipeline.add(
+                texts, metadatas, ids, tag=key,
+                on_done=partial(file_indexed, entry=entry, added=len(ids), removed=removed)
+            )
+            deleted_count += removed
+
+    if deduper is not None:
+        # Chunks non écrits (embedding en échec) : ne plus les proposer comme originaux
+        for key in failed_keys:
+            deduper.delete(added_ids.get(key, []))
+        deduper.close()
+    if touched:
+        failures.extend(update_references(chroma_index, lexical, new_manifest, manifest_file,
+                                          old_files, touched, new_aliases))
+
+    # Copie compacte des vecteurs (memmap int8/float16), reconstruite depuis Chroma
+    compact_dir = compact_path(persist_dir)
+    compact_dtype = args.compact or existing_dtype(compact_dir)
+    compact = None
+    if compact_dtype == "none":
+        shutil.rmtree(compact_dir, ignore_errors=True)
+    elif compact_dtype:
+        print(f" Construction des vecteurs compacts ({compact_dtype})...")
+        compact = build_from_chroma(chroma_index, compact_dir, compact_dtype,
+                                    revision=new_manifest["revision"])
+
+    return {
+        "chroma_index": chroma_index,
+        "lexical": lexical,
+        "compact": compact,
+        "manifest": new_manifest,
+        "manifest_file": manifest_file,
+        "documents": documents_count,
+        "added": pipeline.written,
+        "deleted": deleted_count,
+        "merged": merged_count,
+        "dedup_threshold": dedup_threshold if deduper is not None else None,
+        "failures": failures,
+    }
+
+
+def update_references(chroma_index, lexical, new_manifest, manifest_file, old_files, touched, new_aliases):
+    """Après l'écriture : réécrire les métadonnées (sources, pages des doublons) des chunks touchés.
+
+    Un fichier qui référence un chunk finalement absent (embedding du
+    fichier d'origine en échec) reprend son ancienne entrée pour être
+    retenté au prochain lancement. Retourne les erreurs (clé, message).
+    """
+    collection = chroma_index._collection
+    touched = list(touched)
+    present = set()
+    for i in range(0, len(touched), 500):
+        present.update(collection.get(ids=touched[i:i + 500], include=[])["ids"])
+
+    failures = []
+    for key, linked in new_aliases.items():
+        if linked - present and key in new_manifest["files"]:
+            if key in old_files:
+                new_manifest["files"][key] = old_files[key]
+            else:
+                del new_manifest["files"][key]
+            failures.append((key, "doublon d'un chunk non indexé"))
+    if failures:
+        save_manifest(manifest_file, new_manifest)
+
+    refs = dedup.ChunkRefs(new_manifest["files"])
+    ids = [chunk_id for chunk_id in touched if chunk_id in present and refs.refs.get(chunk_id)]
+    for i in range(0, len(ids), 500):
+        found = collection.get(ids=ids[i:i + 500], include=["documents", "metadatas"])
+        metadatas = [refs.metadata(chunk_id, metadata)
+                     for chunk_id, metadata in zip(found["ids"], found["metadatas"])]
+        collection.update(ids=found["ids"], metadatas=metadatas)
+        lexical.add(found["ids"], found["documents"], metadatas)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Création / mise à jour de l'index Chroma")
+    parser.add_argument("--full", action="store_true",
+                        help="ignorer le manifeste et tout réindexer (seulement les --shard choisis)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="nombre de processus pour parser les PDF/TXT")
+    parser.add_argument("--batch-size", type=int, default=32,
+                        help="nombre de chunks par requête d'embedding")
+    parser.add_argument("--max-in-flight", type=int, default=4,
+                        help="nombre maximal de requêtes d'embedding simultanées")
+    parser.add_argument("--max-retries", type=int, default=3,
+                        help="nouveaux essais par lot en cas d'erreur Ollama")
+    parser.add_argument("--compact", choices=["int8", "float16", "none"],
+                        help="copie compacte des vecteurs pour la recherche (par défaut : "
+                             "mise à jour de la copie existante ; none : la supprimer)")
+    parser.add_argument("--dedup", type=float, metavar="SEUIL",
+                        help="fusionner les quasi-doublons (similarité MinHash >= SEUIL, ex: 0.9) ; "
+                             "par défaut : seuil de l'index existant ; 0 : désactiver")
+    parser.add_argument("--shards", type=int,
+                        help="répartir l'index en N shards (data/chroma_db_shards/) ; "
+                             "un nouveau nombre ne s'applique qu'aux nouveaux fichiers")
+    parser.add_argument("--shard-by", choices=["source", "size"],
+                        help="à la création des shards : par fichier source (hash) ou par taille")
+    parser.add_argument("--shard-max-mb", type=float,
+                        help="taille maximale d'un shard en mode size (défaut : 200 Mo de documents)")
+    parser.add_argument("--shard", action="append",
+                        help="ne mettre à jour que ce shard (ex: s01), répétable")
+    args = parser.parse_args()
+
+    print("\n" + "="*70)
+    print("CRÉATION DE L'INDEX CHROMA")
+    print("="*70 + "\n")
+
+    project_root = Path(__file__).parent.parent
+    docs_path = project_root / "docs"
+    persist_dir = project_root / "data" / "chroma_db"
+    collection_name = "rag_documents"
+
+    # ÉTAPE 1: Détecter les fichiers nouveaux / modifiés / supprimés
+    print(" Analyse des fichiers...")
+    start = time.time()
+
+    current_hashes = {}
+    for filepath in list_document_files(docs_path):
+        key = Path(filepath).relative_to(docs_path).as_posix()
+        current_hashes[key] = file_hash(filepath)
+
+    # Index unique (data/chroma_db) ou shards : chacun un index complet, mis à jour séparément
+    shards_dir = shards_path(persist_dir)
+    shard_map = load_shard_map(shards_dir, collection_name)
+    if shard_map is None and (args.shards or args.shard_by):
+        shard_map = new_shard_map(collection_name, args.shard_by or "source", args.shards or 4,
+                                  args.shard_max_mb or 200.0)
+    elif shard_map is not None:
+        if args.shard_by and args.shard_by != shard_map["shard_by"]:
+            print(f" [!] Shards déjà répartis par {shard_map['shard_by']} : --shard-by ignoré")
+        if args.shards:
+            shard_map["shards"] = args.shards
+        if args.shard_max_mb:
+            shard_map["max_mb"] = args.shard_max_mb
+    if args.shard and shard_map is None:
+        print(" [X] --shard : l'index n'est pas shardé (utiliser --shards N)")
+        exit(1)
+
+    if shard_map is not None:
+        # Les fichiers déjà placés restent dans leur shard ; les nouveaux sont placés ici
+        assign_files(shard_map, {key: (docs_path / key).stat().st_size for key in current_hashes})
+        unknown = set(args.shard or []) - set(shard_map["names"])
+        if unknown:
+            print(f" [X] Shards inconnus : {', '.join(sorted(unknown))} (existants : {', '.join(shard_map['names'])})")
+            exit(1)
+        save_shard_map(shards_dir, shard_map)
+        plans = {
+            name: plan_index(shards_dir / name, shard_collection(collection_name, name),
+                             shard_files(shard_map, name, current_hashes), args.full)
+            for name in shard_map["names"] if not args.shard or name in args.shard
+        }
+    else:
+        plans = {None: plan_index(persist_dir, collection_name, current_hashes, args.full)}
+
+    for name, plan in plans.items():
+        label = f" [{name}]" if name else ""
+        if plan["manifest"] is None:
+            print(f"{label} Pas de manifeste utilisable : reconstruction complète")
+        print(f"{label} {len(plan['new'])} nouveaux, {len(plan['changed'])} modifiés, "
+              f"{len(plan['unchanged'])} inchangés, {len(plan['removed'])} supprimés")
+    to_load = [key for plan in plans.values() for key in plan["new"] + plan["changed"]]
+    scan_time = time.time() - start
+    print(f" Analyse terminée en {scan_time:.2f} secondes\n")
+
+    # ÉTAPE 2: Connexion à Ollama
+    print(" Connexion à Ollama...")
+
+    try:
+        embeddings = make_embeddings(
+            model="nomic-embed-text",
+            base_url="http://localhost:11434"
+        )
+        # Test de connexion (inutile s'il n'y a rien à embedder), sans passer par le cache
+        if to_load:
+            test_embedding = embeddings.base.embed_query("test")
+            print(f" Ollama connecté (embedding de dimension {len(test_embedding)})\n")
+    except Exception as e:
+        print(f" Erreur de connexion à Ollama: {e}")
+        print("Vérifiez que Ollama est installé et lancé :")
+        print("  - Installation : curl -fsSL https://ollama.com/install.sh | sh")
+        print("  - Lancer : ollama serve")
+        print("  - Télécharger le modèle : ollama pull nomic-embed-text")
+        exit(1)
+
+    # ÉTAPE 3: Mettre à jour l'index Chroma (chaque shard), fichier par fichier
+    # Les fichiers sont chargés en parallèle et traités dès qu'ils arrivent ;
+    # les chunks partent en lots vers Ollama et sont écrits dès qu'ils sont prêts.
+    print(f" Mise à jour de l'index Chroma ({args.workers} workers, lots de "
+          f"{args.batch_size}, {args.max_in_flight} requêtes en vol)...")
+    start = time.time()
+
+    results = {}
+    try:
+        for name, plan in plans.items():
+            if name:
+                print(f"\n Shard {name} ({plan['collection']})...")
+            results[name] = update_index(plan, embeddings, docs_path, args)
+            if name:
+                # Fichiers supprimés de docs/ : retirés du shard, donc de la répartition
+                for key in [key for key, shard in shard_map["files"].items()
+                            if shard == name and key not in current_hashes]:
+                    del shard_map["files"][key]
+                save_shard_map(shards_dir, shard_map)
+
+        embeddings_time = time.time() - start
+        print(f"\nIndex mis à jour avec succès en {embeddings_time:.1f} secondes\n")
+
+        # Vérifier que l'index a été sauvegardé
+        storage_dir = shards_dir if shard_map is not None else persist_dir
+        if storage_dir.exists() and any(storage_dir.iterdir()):
+            print(f" Index sauvegardé dans : {storage_dir}")
+        else:
+            print(" L'index n'a pas été sauvegardé, vérifiez les permissions")
+
+    except Exception as e:
+        print(f" Erreur lors de la création de l'index: {e}")
+        exit(1)
+
+    # ÉTAPE 4: Test de recherche (sur tous les shards mis à jour)
+    print(" Test de recherche...")
+    indexes = [result["chroma_index"] for result in results.values()]
+    search_index = ShardedIndex(indexes, embeddings, collection_name) if shard_map is not None else indexes[0]
+    test_queries = [
+        "machine learning",
+        "intelligence artificielle",
+        "apprentissage automatique"
+    ]
+
+    try:
+        for query in test_queries:
+            print(f"\n Requête : '{query}'")
+            found = cached_similarity_search(search_index, query, k=2, mode="dense")
+            print(f" {len(found)} résultats trouvés")
+
+            for i, doc in enumerate(found, 1):
+                preview = doc.page_content[:150].replace('\n', ' ')
+                source = doc.metadata.get('source', 'Inconnu')
+                page = doc.metadata.get('page', 'N/A')
+                print(f"  {i}. [{source} - page {page}]")
+                print(f"     {preview}...\n")
+
+    except Exception as e:
+        print(f"  Erreur lors de la recherche: {e}")
+        print("Mais l'index a probablement été créé avec succès")
+
+    # Résumé final
+    failures = [failure for result in results.values() for failure in result["failures"]]
+    print("\n" + "="*70)
+    print(" SUCCÈS !" if not failures else f" TERMINÉ AVEC {len(failures)} ERREUR(S)")
+    print("="*70)
+
+    total_time = scan_time + embeddings_time
+    print(f"⏱  Temps total : {total_time:.1f} secondes")
+    print(f" Statistiques :")
+    print(f"   - Fichiers indexés : {sum(len(r['manifest']['files']) for r in results.values())}")
+    print(f"   - Documents rechargés : {sum(r['documents'] for r in results.values())}")
+    print(f"   - Chunks ajoutés : {sum(r['added'] for r in results.values())}")
+    print(f"   - Chunks supprimés : {sum(r['deleted'] for r in results.values())}")
+    thresholds = {r["dedup_threshold"] for r in results.values() if r["dedup_threshold"]}
+    if thresholds:
+        print(f"   - Doublons fusionnés : {sum(r['merged'] for r in results.values())} chunks non embeddés "
+              f"(seuil {', '.join(str(t) for t in sorted(thresholds))})")
+    print(f"   - Chunks dans l'index : {sum(r['chroma_index']._collection.count() for r in results.values())}")
+    print(f"   - Embedding modèle : nomic-embed-text")
+    cache_stats = embeddings.stats()
+    print(f"   - Cache d'embeddings : {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+          f"{cache_stats['entries']} entrées ({embeddings.db_path})")
+    if shard_map is not None:
+        print(f"   - Shards : {shards_dir} ({len(shard_map['names'])} shards, "
+              f"répartition par {shard_map['shard_by']}, {len(results)} mis à jour)")
+    for name, result in results.items():
+        indent = "   " if name else ""
+        if name:
+            print(f"   - Shard {name} : {len(result['manifest']['files'])} fichiers, "
+                  f"{result['chroma_index']._collection.count()} chunks")
+        else:
+            print(f"   - Index sauvegardé : {persist_dir}")
+        print(f"   {indent}- Collection : {result['chroma_index']._collection.name}")
+        print(f"   {indent}- Index BM25 : {result['lexical'].db_path} ({result['lexical'].count()} chunks)")
+        if result["compact"] is not None:
+            print(f"   {indent}- Vecteurs compacts : {result['compact'].folder} ({result['compact'].dtype}, "
+                  f"{result['compact'].nbytes() / 1024 / 1024:.2f} MB)")
+        print(f"   {indent}- Manifeste : {result['manifest_file']} (révision {result['manifest']['revision']})")
+    for key, error in failures:
+        print(f"   - [X] {key} : {error}")
+
+    # Vérification du stockage
+    print(f"\n Vérification du stockage :")
+    if storage_dir.exists():
+        db_size = sum(f.stat().st_size for f in storage_dir.rglob('*') if f.is_file())
+        print(f"   - Taille de la base : {db_size / 1024 / 1024:.2f} MB")
+        num_files = len(list(storage_dir.rglob('*')))
+        print(f"   - Nombre de fichiers : {num_files}")
     else:
-        print(" L'index n'a pas été sauvegardé, vérifiez les permissions")
-    
-except Exception as e:
-    print(f" Erreur lors de la création de l'index: {e}")
-    exit(1)
-
-# ÉTAPE 5: Test de recherche
-print(" Test de recherche...")
-test_queries = [
-    "machine learning",
-    "intelligence artificielle",
-    "apprentissage automatique"
-]
-
-try:
-    for query in test_queries:
-        print(f"\n Requête : '{query}'")
-        results = chroma_index.similarity_search(query, k=2)
-        print(f" {len(results)} résultats trouvés")
-        
-        for i, doc in enumerate(results, 1):
-            preview = doc.page_content[:150].replace('\n', ' ')
-            source = doc.metadata.get('source', 'Inconnu')
-            page = doc.metadata.get('page', 'N/A')
-            print(f"  {i}. [{source} - page {page}]")
-            print(f"     {preview}...\n")
-    
-except Exception as e:
-    print(f"  Erreur lors de la recherche: {e}")
-    print("Mais l'index a probablement été créé avec succès")
-
-# Résumé final
-print("\n" + "="*70)
-print(" SUCCÈS !")
-print("="*70)
-
-total_time = load_time + split_time + embeddings_time
-print(f"⏱  Temps total : {total_time:.1f} secondes")
-print(f" Statistiques :")
-print(f"   - Documents chargés : {len(documents)}")
-print(f"   - Chunks créés : {len(chunks)}")
-print(f"   - Embedding modèle : nomic-embed-text")
-print(f"   - Index sauvegardé : {persist_dir}")
-print(f"   - Collection : rag_documents")
-
-# Vérification du stockage
-print(f"\n Vérification du stockage :")
-if persist_dir.exists():
-    db_size = sum(f.stat().st_size for f in persist_dir.rglob('*') if f.is_file())
-    print(f"   - Taille de la base : {db_size / 1024 / 1024:.2f} MB")
-    num_files = len(list(persist_dir.rglob('*')))
-    print(f"   - Nombre de fichiers : {num_files}")
-else:
-    print("    Le dossier de persistance n'existe pas")
-
-print("="*70)
+        print("    Le dossier de persistance n'existe pas")
+
+    print("="*70)
+
 
+if __name__ == "__main__":
+    # Garde nécessaire pour le pool de processus (spawn sous Windows)
+    main()
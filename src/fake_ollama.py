@@ -0,0 +1,257 @@
+import argparse
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOllamaConfig:
+    """Paramètres du faux serveur Ollama (latences en secondes)"""
+
+    def __init__(self, dim=768, embed_latency=0.005, embed_latency_per_text=0.002,
+                 first_token_latency=0.05, token_latency=0.01, num_tokens=40,
+                 embed_parallel=0):
+        self.dim = dim
+        self.embed_latency = embed_latency
+        self.embed_latency_per_text = embed_latency_per_text
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.num_tokens = num_tokens
+        # Requêtes d'embedding traitées en même temps (0 = illimité ; Ollama : OLLAMA_NUM_PARALLEL)
+        self.embed_parallel = embed_parallel
+
+
+def fake_embedding(text, dim):
+    """Vecteur déterministe : sac de mots hachés, normalisé.
+
+    Deux textes qui partagent des mots ont des vecteurs proches, ce qui
+    garde un sens aux résultats de recherche.
+    """
+    vector = [0.0] * dim
+    for word in re.findall(r"\w+", text.lower()):
+        h = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+        vector[h % dim] += 1.0 if (h >> 32) & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector))
+    if norm == 0:
+        vector[0] = 1.0
+        return vector
+    return [v / norm for v in vector]
+
+
+def fake_tokens(prompt, count):
+    """Réponse déterministe : mots du prompt, dans un ordre fixé par son hash"""
+    words = re.findall(r"\w+", prompt) or ["ok"]
+    seed = int(hashlib.sha1(prompt.encode("utf-8")).hexdigest(), 16)
+    return [(" " if i else "") + words[(seed + i * 7) % len(words)] for i in range(count)]
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Sinon Nagle + ACK retardé ajoutent ~40 ms par requête keep-alive
+    disable_nagle_algorithm = True
+    config = FakeOllamaConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _count(self, key, n=1):
+        with self.server.stats_lock:
+            self.server.stats[key] = self.server.stats.get(key, 0) + n
+
+    def do_GET(self):
+        if self.path in ("/", "/api/version"):
+            self._send_json({"version": "0.0.0-fake"})
+        elif self.path in ("/api/tags", "/api/ps"):
+            self._send_json({"models": [{"name": name, "model": name} for name in sorted(self.server.models)]})
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        try:
+            payload = self._read_json()
+        except ValueError:
+            self._send_json({"error": "invalid json"}, 400)
+            return
+        model = payload.get("model", "")
+        if model:
+            self.server.models.add(model)
+
+        if self.path == "/api/embed":
+            self._embed(payload, model)
+        elif self.path == "/api/embeddings":
+            # Ancienne API : un seul texte dans "prompt"
+            time.sleep(self.config.embed_latency + self.config.embed_latency_per_text)
+            self._count("embed_requests")
+            self._count("embedded_texts")
+            self._send_json({"embedding": fake_embedding(payload.get("prompt", ""), self.config.dim)})
+        elif self.path == "/api/generate":
+            self._generate(payload, model, payload.get("prompt", ""), chat=False)
+        elif self.path == "/api/chat":
+            messages = payload.get("messages") or []
+            prompt = "\n".join(m.get("content", "") for m in messages)
+            self._generate(payload, model, prompt, chat=True)
+        elif self.path == "/api/show":
+            self._send_json({"modelfile": "", "parameters": "", "details": {"family": "fake"}})
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def _embed(self, payload, model):
+        texts = payload.get("input", [])
+        if isinstance(texts, str):
+            texts = [texts]
+        dim = payload.get("dimensions") or self.config.dim
+        slots = self.server.embed_slots
+        if slots is not None:
+            slots.acquire()
+        try:
+            time.sleep(self.config.embed_latency + self.config.embed_latency_per_text * len(texts))
+        finally:
+            if slots is not None:
+                slots.release()
+        self._count("embed_requests")
+        self._count("embedded_texts", len(texts))
+        self._send_json({
+            "model": model,
+            "embeddings": [fake_embedding(text, dim) for text in texts],
+        })
+
+    def _generate(self, payload, model, prompt, chat):
+        options = payload.get("options") or {}
+        count = options.get("num_predict") or self.config.num_tokens
+        count = min(count, self.config.num_tokens) if count > 0 else self.config.num_tokens
+        tokens = fake_tokens(prompt, count)
+        self._count("generate_requests")
+        self._count("generated_tokens", len(tokens))
+
+        def chunk(text, done):
+            base = {"model": model, "created_at": _now(), "done": done}
+            if chat:
+                base["message"] = {"role": "assistant", "content": text}
+            else:
+                base["response"] = text
+            if done:
+                base.update({"done_reason": "stop", "eval_count": len(tokens), "prompt_eval_count": len(prompt.split())})
+            return base
+
+        time.sleep(self.config.first_token_latency)
+        if payload.get("stream", True) is False:
+            time.sleep(self.config.token_latency * max(len(tokens) - 1, 0))
+            self._send_json(chunk("".join(tokens), True))
+            return
+
+        # Streaming NDJSON, comme Ollama
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(self.config.token_latency)
+            self._write_chunk(json.dumps(chunk(token, False)) + "\n")
+        self._write_chunk(json.dumps(chunk("", True)) + "\n")
+        self._write_chunk("")
+
+    def _write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+class FakeOllamaServer:
+    """Faux serveur HTTP Ollama, déterministe, pour les benchmarks sans modèle.
+
+    Implémente /api/embed, /api/embeddings, /api/generate (streaming ou non),
+    /api/chat, /api/tags, /api/ps et /api/version.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, config=None):
+        config = config or FakeOllamaConfig()
+        handler = type("Handler", (FakeOllamaHandler,), {"config": config})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.embed_slots = (threading.Semaphore(config.embed_parallel)
+                                  if config.embed_parallel else None)
+        self.httpd.daemon_threads = True
+        self.httpd.stats = {}
+        self.httpd.stats_lock = threading.Lock()
+        self.httpd.models = set()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def stats(self):
+        return dict(self.httpd.stats)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Faux serveur Ollama pour les benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--dim", type=int, default=768, help="dimension des embeddings")
+    parser.add_argument("--embed-latency-ms", type=float, default=5)
+    parser.add_argument("--embed-latency-per-text-ms", type=float, default=2)
+    parser.add_argument("--embed-parallel", type=int, default=0,
+                        help="requêtes d'embedding simultanées (0 = illimité)")
+    parser.add_argument("--first-token-ms", type=float, default=50)
+    parser.add_argument("--token-ms", type=float, default=10)
+    parser.add_argument("--tokens", type=int, default=40, help="tokens générés par réponse")
+    args = parser.parse_args()
+
+    config = FakeOllamaConfig(
+        dim=args.dim,
+        embed_latency=args.embed_latency_ms / 1000,
+        embed_latency_per_text=args.embed_latency_per_text_ms / 1000,
+        first_token_latency=args.first_token_ms / 1000,
+        token_latency=args.token_ms / 1000,
+        num_tokens=args.tokens,
+        embed_parallel=args.embed_parallel
+    )
+    server = FakeOllamaServer(args.host, args.port, config)
+    print(f"[OK] Faux Ollama sur {server.base_url} (dimension {args.dim})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
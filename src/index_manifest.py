@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+MANIFEST_VERSION = 1
+
+
+def manifest_path(persist_dir):
+    """Chemin du manifeste, à côté du dossier Chroma (ex: data/chroma_db_manifest.json)"""
+    persist_dir = Path(persist_dir)
+    return persist_dir.with_name(f"{persist_dir.name}_manifest.json")
+
+
+def empty_manifest(collection_name):
+    return {
+        "version": MANIFEST_VERSION,
+        "collection": collection_name,
+        "revision": 0,
+        "files": {}
+    }
+
+
+def load_manifest(path, collection_name):
+    """Charger le manifeste, ou None s'il est absent / illisible / incompatible (reconstruction complète)"""
+    path = Path(path)
+    if not path.exists():
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[WARNING] Manifeste illisible ({e}), reconstruction complète")
+        return None
+    if manifest.get("version") != MANIFEST_VERSION or manifest.get("collection") != collection_name:
+        return None
+    return manifest
+
+
+def save_manifest(path, manifest):
+    """Écriture atomique du manifeste (fichier temporaire + remplacement)"""
+    path = Path(path)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def file_hash(filepath, block_size=1 << 20):
+    """Hash SHA-256 du contenu d'un fichier, lu par blocs"""
+    h = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def chunk_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_ids(source_key, chunks):
+    """IDs stables : dépendent du fichier source et du contenu du chunk, pas de sa position.
+
+    Retourne une liste de (id, hash) dans l'ordre des chunks.
+    """
+    prefix = hashlib.sha1(source_key.encode("utf-8")).hexdigest()[:12]
+    seen = {}
+    result = []
+    for chunk in chunks:
+        h = chunk_hash(chunk.page_content)
+        # Un même texte peut apparaître plusieurs fois dans un fichier
+        n = seen.get(h, 0)
+        seen[h] = n + 1
+        chunk_id = f"{prefix}_{h[:24]}" if n == 0 else f"{prefix}_{h[:24]}_{n}"
+        result.append((chunk_id, h))
+    return result
+
+
+def diff_files(manifest, current_hashes):
+    """Comparer les fichiers actuels au manifeste.
+
+    Retourne (nouveaux, modifiés, inchangés, supprimés) sous forme de listes de clés.
+    """
+    known = manifest["files"] if manifest else {}
+    new, changed, unchanged = [], [], []
+    for key, h in current_hashes.items():
+        if key not in known:
+            new.append(key)
+        elif known[key]["hash"] != h:
+            changed.append(key)
+        else:
+            unchanged.append(key)
+    removed = [key for key in known if key not in current_hashes]
+    return new, changed, unchanged, removed
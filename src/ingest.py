@@ -1,35 +1,95 @@
 import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 from pathlib import Path
 from langchain_community.document_loaders import TextLoader
 from langchain_community.document_loaders import PyPDFLoader
 
+SUPPORTED_EXTENSIONS=('.pdf','.txt')
 
 
-def load_documents_from_folder(folder_path):
+def load_document(filepath):
+    #charger un seul fichier txt ou pdf (liste vide si extension non supportée)
+    filepath=str(filepath)
+    if filepath.endswith('.pdf'):
+        return PyPDFLoader(filepath).load()
+    if filepath.endswith('.txt'):
+        return TextLoader(filepath,encoding='utf-8').load()
+    return []
+
+
+def list_document_files(folder_path):
+    #fichiers supportés d'un dossier, triés pour un ordre stable
+    return sorted(
+        os.path.join(folder_path,filename)
+        for filename in os.listdir(folder_path)
+        if filename.endswith(SUPPORTED_EXTENSIONS)
+    )
+
+
+def _load_file(filepath):
+    #exécuté dans un worker : ne lève jamais, renvoie l'erreur avec le fichier
+    try:
+        return filepath,load_document(filepath),None
+    except Exception as e:
+        return filepath,[],f"{type(e).__name__}: {e}"
+
+
+def iter_loaded_files(filepaths,workers=1):
+    """Charger des fichiers en streaming, yield (fichier, documents, erreur).
+
+    Avec workers > 1 les PDF/TXT sont parsés dans un pool de processus ; au plus
+    2*workers fichiers sont en cours à la fois pour borner la mémoire. Les
+    fichiers sont rendus dans l'ordre où ils finissent de charger.
+    """
+    filepaths=iter(filepaths)
+    if workers<=1:
+        for filepath in filepaths:
+            yield _load_file(filepath)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending=set()
+        for filepath in filepaths:
+            pending.add(executor.submit(_load_file,filepath))
+            if len(pending)>=2*workers:
+                done,pending=wait(pending,return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            done,pending=wait(pending,return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def stream_documents_from_folder(folder_path,workers=1,failures=None):
+    """Générateur de documents d'un dossier, sans tout garder en mémoire.
+
+    Un fichier illisible n'arrête pas le chargement : l'erreur est affichée et
+    ajoutée à `failures` (liste de (fichier, erreur)) si elle est fournie.
+    """
+    for filepath,documents,error in iter_loaded_files(list_document_files(folder_path),workers):
+        if error:
+            print(f'Erreur lors du chargement de {os.path.basename(filepath)}: {error}')
+            if failures is not None:
+                failures.append((filepath,error))
+            continue
+        yield from documents
+
+
+def load_documents_from_folder(folder_path,workers=1,failures=None):
     #charger tous les documents d'un dossier soit txt ou pdf
-    documents=[]
-    for filename in os.listdir(folder_path):
-        filepath=os.path.join(folder_path,filename)
-        try:
-            if filename.endswith('.pdf'):
-                loader=PyPDFLoader(filepath)
-                documents.extend(loader.load())
-                print("fichier .pdf loader avec succèes")
-            elif filename.endswith('.txt'):
-                loader=TextLoader(filepath,encoding='utf-8')
-                documents.extend(loader.load())
-                print("fichier .txt loader avec succèes")
-        except Exception as e:
-            print(f'Erreur lors du chargement de {filename}: {e}')
-            return 
-    return documents
-            
+    #les fichiers en erreur sont ignorés (voir `failures`) au lieu de tout perdre
+    return list(stream_documents_from_folder(folder_path,workers,failures))
+
 
 if __name__=="__main__":
     project_root=Path(__file__).parent.parent
     docs_path=project_root/"docs"
 
     print("chargement des documents ...")
-    documents=load_documents_from_folder(docs_path)
+    failures=[]
+    documents=load_documents_from_folder(docs_path,workers=os.cpu_count() or 1,failures=failures)
     print(f"{len(documents)} documents chargés avec succèes")
+    if failures:
+        print(f"{len(failures)} fichiers en erreur")
         
@@ -0,0 +1,88 @@
+import threading
+import time
+
+
+class LazyComponent:
+    """Composant lourd (index, LLM, modèle) construit dans un thread.
+
+    `start()` lance la construction en arrière-plan ; sinon elle a lieu au
+    premier `get()`. Après la construction, `warmup(valeur)` (optionnel) est
+    appelé dans le même thread pour charger les modèles avant la première
+    vraie requête : une erreur de préchauffage est affichée mais n'empêche
+    pas d'utiliser le composant.
+    """
+
+    def __init__(self, name: str, factory, warmup=None):
+        self.name = name
+        self.factory = factory
+        self.warmup = warmup
+        self.value = None
+        self.error = None
+        self.warming_up = False
+        self.elapsed = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Lancer la construction en arrière-plan (sans effet si déjà lancée)"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"init-{self.name}", daemon=True)
+                self._thread.start()
+        return self
+
+    def _run(self):
+        start = time.monotonic()
+        try:
+            self.value = self.factory()
+        except Exception as e:
+            self.error = e
+            print(f"[X] {self.name} : {e}")
+        finally:
+            self.elapsed = time.monotonic() - start
+            self._ready.set()
+        if self.error is not None:
+            return
+        print(f"[OK] {self.name} prêt en {self.elapsed:.1f}s")
+
+        if self.warmup is not None:
+            self.warming_up = True
+            start = time.monotonic()
+            try:
+                self.warmup(self.value)
+                print(f"[OK] {self.name} préchauffé en {time.monotonic() - start:.1f}s")
+            except Exception as e:
+                print(f"[WARNING] Préchauffage de {self.name} impossible : {e}")
+            finally:
+                self.warming_up = False
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set() and self.error is None
+
+    @property
+    def failed(self) -> bool:
+        return self.error is not None
+
+    def get(self, timeout=None):
+        """Le composant, ou None s'il n'est pas prêt après `timeout` secondes.
+
+        Lance la construction si besoin ; relève l'erreur de construction.
+        """
+        self.start()
+        if not self._ready.wait(timeout):
+            return None
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+    def status(self) -> str:
+        """Message d'état pour l'interface"""
+        if self.error is not None:
+            return f"[X] {self.name} indisponible : {self.error}"
+        if not self._ready.is_set():
+            return f"[...] {self.name} en cours de préparation (warming up)..."
+        if self.warming_up:
+            return f"[OK] {self.name} prêt (préchauffage des modèles en cours)"
+        return f"[OK] {self.name} prêt"
@@ -0,0 +1,267 @@
+import heapq
+import json
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+from pathlib import Path
+from langchain_core.documents import Document
+from embedding_cache import normalize_text
+
+
+def lexical_path(persist_dir):
+    """Index BM25 à côté du dossier Chroma (ex: data/chroma_db_bm25.sqlite)"""
+    persist_dir = Path(persist_dir)
+    return persist_dir.with_name(f"{persist_dir.name}_bm25.sqlite")
+
+
+def tokenize(text: str):
+    # Minuscules, mots unicode : "Shard", "shard" et "shard," donnent le même terme
+    return re.findall(r"\w+", normalize_text(text).lower())
+
+
+class BM25Index:
+    """Index inversé BM25 persisté (SQLite), sur les mêmes chunks que Chroma.
+
+    Les chunks gardent leur ID Chroma : les deux classements peuvent être
+    fusionnés. Les statistiques globales (nombre de chunks, longueur
+    moyenne) sont tenues à jour en mémoire à chaque écriture (sans relire
+    toute la table), et relues quand un autre processus a modifié le
+    fichier (ex: embeddings_chroma.py pendant que l'application tourne).
+    """
+
+    def __init__(self, db_path, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        db_path = Path(db_path)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.db_path = db_path
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                " id TEXT PRIMARY KEY,"
+                " text TEXT NOT NULL,"
+                " metadata TEXT,"
+                " length INTEGER NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS postings ("
+                " term TEXT NOT NULL,"
+                " chunk_id TEXT NOT NULL,"
+                " tf INTEGER NOT NULL,"
+                " PRIMARY KEY (term, chunk_id)) WITHOUT ROWID"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings(chunk_id)")
+        with self._lock:
+            self._data_version = None
+            self._sync_stats()
+
+    # ------------------------------------------------------------------
+
+    def add(self, ids, texts, metadatas=None):
+        """Ajouter ou remplacer des chunks"""
+        metadatas = metadatas or [None] * len(ids)
+        chunk_rows, posting_rows = [], []
+        for chunk_id, text, metadata in zip(ids, texts, metadatas):
+            terms = Counter(tokenize(text))
+            chunk_rows.append((chunk_id, text, json.dumps(metadata or {}, ensure_ascii=False),
+                               sum(terms.values())))
+            posting_rows.extend((term, chunk_id, tf) for term, tf in terms.items())
+        with self._lock:
+            self._sync_stats()
+            with self._conn:
+                removed, removed_length = self._delete(ids)
+                self._conn.executemany(
+                    "INSERT INTO chunks (id, text, metadata, length) VALUES (?, ?, ?, ?)", chunk_rows
+                )
+                self._conn.executemany(
+                    "INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)", posting_rows
+                )
+            # Transaction validée : mettre à jour les statistiques
+            self._count += len(chunk_rows) - removed
+            self._total_length += sum(row[3] for row in chunk_rows) - removed_length
+
+    def delete(self, ids):
+        if not ids:
+            return
+        with self._lock:
+            self._sync_stats()
+            with self._conn:
+                removed, removed_length = self._delete(ids)
+            self._count -= removed
+            self._total_length -= removed_length
+
+    def clear(self):
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM postings")
+                self._conn.execute("DELETE FROM chunks")
+            self._count = 0
+            self._total_length = 0
+
+    def count(self) -> int:
+        with self._lock:
+            self._sync_stats()
+            return self._count
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def term_stats(self, terms):
+        """Statistiques de l'index : (nombre de chunks, longueur totale, {terme: nombre de chunks le contenant})"""
+        with self._lock:
+            self._sync_stats()
+            df = {
+                term: self._conn.execute("SELECT COUNT(*) FROM postings WHERE term = ?", (term,)).fetchone()[0]
+                for term in terms
+            }
+            return self._count, self._total_length, df
+
+    def search(self, query: str, k: int = 4, stats=None):
+        """Top-k chunks par score BM25 : liste de (Document, score).
+
+        `stats` : statistiques globales (comme `term_stats`) de plusieurs index
+        (shards) ; les scores sont alors comparables d'un index à l'autre.
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        scores = {}
+        with self._lock:
+            self._sync_stats()
+            if not self._count:
+                return []
+            count, total_length, df = stats if stats is not None else (self._count, self._total_length, {})
+            avg_length = total_length / count
+            for term in terms:
+                rows = self._conn.execute(
+                    "SELECT p.chunk_id, p.tf, c.length FROM postings p"
+                    " JOIN chunks c ON c.id = p.chunk_id WHERE p.term = ?",
+                    (term,)
+                ).fetchall()
+                if not rows:
+                    continue
+                # Jamais négatif, même si les statistiques sont en retard sur le fichier
+                n = df.get(term, len(rows))
+                idf = max(0.0, math.log(1 + (count - n + 0.5) / (n + 0.5)))
+                for chunk_id, tf, length in rows:
+                    norm = tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+
+            top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            if not top:
+                return []
+            rows = self._conn.execute(
+                f"SELECT id, text, metadata FROM chunks WHERE id IN ({','.join('?' * len(top))})",
+                [chunk_id for chunk_id, _ in top]
+            ).fetchall()
+        found = {chunk_id: (text, metadata) for chunk_id, text, metadata in rows}
+        return [
+            (Document(page_content=found[chunk_id][0], metadata=json.loads(found[chunk_id][1] or "{}"),
+                      id=chunk_id), score)
+            for chunk_id, score in top if chunk_id in found
+        ]
+
+    # ------------------------------------------------------------------
+
+    def _delete(self, ids):
+        # Appelé sous verrou ; retourne (chunks supprimés, somme de leurs longueurs)
+        ids = list(dict.fromkeys(ids))
+        removed, removed_length = 0, 0
+        for i in range(0, len(ids), 500):
+            part = ids[i:i + 500]
+            marks = ",".join("?" * len(part))
+            count, length = self._conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks WHERE id IN ({marks})", part
+            ).fetchone()
+            removed += count
+            removed_length += length
+            self._conn.execute(f"DELETE FROM postings WHERE chunk_id IN ({marks})", part)
+            self._conn.execute(f"DELETE FROM chunks WHERE id IN ({marks})", part)
+        return removed, removed_length
+
+    def _sync_stats(self):
+        # Appelé sous verrou : data_version change quand une autre connexion a écrit
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._data_version = version
+            self._refresh_stats()
+
+    def _refresh_stats(self):
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks").fetchone()
+        self._count = count
+        self._total_length = total
+
+
+def backfill_from_chroma(lexical_index, chroma_index, batch_size=1000):
+    """Remplir l'index BM25 avec les chunks déjà présents dans Chroma"""
+    collection = chroma_index._collection
+    total = collection.count()
+    for offset in range(0, total, batch_size):
+        page = collection.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+        lexical_index.add(page["ids"], page["documents"], page["metadatas"])
+    return total
+
+
+def open_for(chroma_index, db_path):
+    """Ouvrir l'index BM25 d'une collection Chroma et l'enregistrer pour la recherche hybride.
+
+    Un index BM25 vide devant une collection non vide (index créé avant le
+    BM25) est rempli depuis Chroma.
+    """
+    collection_name = chroma_index._collection.name
+    existing = get(collection_name)
+    if existing is not None and existing.db_path == Path(db_path):
+        # Déjà ouvert (ex: deux sessions rouvrent le même PDF) : partager l'index
+        # plutôt que d'en ouvrir un second, ce qui fermerait le premier
+        return existing
+    lexical_index = BM25Index(db_path)
+    if lexical_index.count() == 0 and chroma_index._collection.count() > 0:
+        print("[INFO] Construction de l'index BM25 depuis Chroma...")
+        backfill_from_chroma(lexical_index, chroma_index)
+    register(collection_name, lexical_index)
+    return lexical_index
+
+
+def reciprocal_rank_fusion(rankings, k: int = 4, constant: int = 60):
+    """Fusionner plusieurs classements de Documents : score = somme des 1 / (constant + rang)"""
+    scores, docs = {}, {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = doc.id or doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (constant + rank + 1)
+            docs.setdefault(key, doc)
+    best = sorted(scores, key=lambda key: scores[key], reverse=True)[:k]
+    return [docs[key] for key in best]
+
+
+# Index BM25 ouverts, par nom de collection Chroma (utilisés par query_cache)
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def register(collection_name: str, lexical_index):
+    with _registry_lock:
+        previous = _registry.get(collection_name)
+        _registry[collection_name] = lexical_index
+    if previous is not None and previous is not lexical_index:
+        previous.close()
+
+
+def unregister(collection_name: str, lexical_index=None):
+    """Fermer l'index BM25 enregistré ; si `lexical_index` est donné, seulement si c'est lui"""
+    with _registry_lock:
+        registered = _registry.get(collection_name)
+        if registered is None or (lexical_index is not None and registered is not lexical_index):
+            return
+        del _registry[collection_name]
+    registered.close()
+
+
+def get(collection_name: str):
+    return _registry.get(collection_name)
@@ -1,15 +1,30 @@
-from langchain_ollama import OllamaLLM
-from typing import List, Optional
+import time
+from ollama_clients import get_backend
+from typing import AsyncIterator, Callable, Iterator, List, Optional, Sequence
+from context_packer import pack_context
+import metrics
 
 class CompagnionLLM:
     """Assistant IA avec Ollama"""
     
-    def __init__(self, model: str = "mistral"):
-        """Initialiser le LLM"""
+    def __init__(self, model: str = "mistral", answer_cache=None,
+                 base_url: str = "http://localhost:11434",
+                 context_tokens: int = 200, vector_lookup: Optional[Callable] = None):
+        """Initialiser le LLM (answer_cache : cache de réponses optionnel).
+
+        `context_tokens` : budget de tokens du contexte dans le prompt RAG.
+        `vector_lookup(textes)` : embeddings déjà connus des chunks (ou None),
+        utilisés pour classer les phrases sans nouvel appel au modèle.
+        """
+        self.model = model
+        self.answer_cache = answer_cache
+        self.context_tokens = context_tokens
+        self.vector_lookup = vector_lookup
+        # Client Ollama partagé (pool de connexions, keep_alive, coupe-circuit)
+        self.backend = get_backend(base_url)
         try:
-            self.llm = OllamaLLM(
-                model=model,
-                base_url="http://localhost:11434",
+            self.llm = self.backend.llm(
+                model,
                 temperature=0.1,  # Très bas = réponses courtes et rapides
                 num_predict=200,   # Limite stricte = max 200 tokens
                 top_p=0.5          # Réduit les variations = plus rapide
@@ -19,30 +34,190 @@ class CompagnionLLM:
             print(f"[X] Erreur: {e}")
             raise
     
+    def warmup(self):
+        """Charger le modèle dans Ollama (prompt vide, 1 token max), gardé chargé par keep_alive"""
+        error = self.backend.warmup(chat_models=[self.model])[self.model]
+        if error is not None:
+            raise error
+    
     def generate_response(
         self,
         query: str,
         context: Optional[List[str]] = None,
-        language: str = "français"
+        language: str = "français",
+        query_vector: Optional[Sequence[float]] = None,
+        index_key=None
     ) -> str:
-        """Générer une réponse"""
+        """Générer une réponse.
+
+        Avec un cache de réponses, `index_key` identifie l'index interrogé et
+        `query_vector` (embedding de la question) permet de réutiliser la
+        réponse d'une question quasi-identique sur le même contexte.
+        """
+        scope, cached = self._lookup(query, context, language, query_vector, index_key)
+        if cached is not None:
+            return cached
         
-        if context:
-            prompt = self._build_rag_prompt(query, context, language)
-        else:
-            prompt = self._build_simple_prompt(query, language)
+        prompt = self._build_prompt(query, context, language, query_vector)
         
         try:
-            response = self.llm.invoke(prompt)
-            return response.strip()
+            with metrics.span("llm_generation", model=self.model):
+                response = self.llm.invoke(prompt).strip()
         except Exception as e:
             print(f" Erreur: {e}")
             return ""
+        
+        self._store(query, context, response, scope, query_vector)
+        return response
+    
+    async def agenerate_response(
+        self,
+        query: str,
+        context: Optional[List[str]] = None,
+        language: str = "français",
+        query_vector: Optional[Sequence[float]] = None,
+        index_key=None
+    ) -> str:
+        """Version asynchrone de generate_response"""
+        scope, cached = self._lookup(query, context, language, query_vector, index_key)
+        if cached is not None:
+            return cached
+        
+        prompt = self._build_prompt(query, context, language, query_vector)
+        
+        try:
+            with metrics.span("llm_generation", model=self.model):
+                response = (await self.llm.ainvoke(prompt)).strip()
+        except Exception as e:
+            print(f" Erreur: {e}")
+            return ""
+        
+        self._store(query, context, response, scope, query_vector)
+        return response
+    
+    def stream_response(
+        self,
+        query: str,
+        context: Optional[List[str]] = None,
+        language: str = "français",
+        query_vector: Optional[Sequence[float]] = None,
+        index_key=None
+    ) -> Iterator[str]:
+        """Générer une réponse token par token (mêmes paramètres que generate_response)"""
+        scope, cached = self._lookup(query, context, language, query_vector, index_key)
+        if cached is not None:
+            yield cached
+            return
+        
+        prompt = self._build_prompt(query, context, language, query_vector)
+        
+        parts = []
+        try:
+            with metrics.span("llm_generation", model=self.model):
+                start = time.perf_counter()
+                for token in self.llm.stream(prompt):
+                    # Ne pas envoyer les espaces de tête (la réponse complète est strip())
+                    if not parts and not token.strip():
+                        continue
+                    if not parts:
+                        metrics.observe("llm_first_token", time.perf_counter() - start, model=self.model)
+                    parts.append(token)
+                    yield token
+        except Exception as e:
+            print(f" Erreur: {e}")
+            return
+        
+        self._store(query, context, "".join(parts).strip(), scope, query_vector)
+    
+    async def astream_response(
+        self,
+        query: str,
+        context: Optional[List[str]] = None,
+        language: str = "français",
+        query_vector: Optional[Sequence[float]] = None,
+        index_key=None
+    ) -> AsyncIterator[str]:
+        """Version asynchrone de stream_response"""
+        scope, cached = self._lookup(query, context, language, query_vector, index_key)
+        if cached is not None:
+            yield cached
+            return
+        
+        prompt = self._build_prompt(query, context, language, query_vector)
+        
+        parts = []
+        try:
+            with metrics.span("llm_generation", model=self.model):
+                start = time.perf_counter()
+                async for token in self.llm.astream(prompt):
+                    if not parts and not token.strip():
+                        continue
+                    if not parts:
+                        metrics.observe("llm_first_token", time.perf_counter() - start, model=self.model)
+                    parts.append(token)
+                    yield token
+        except Exception as e:
+            print(f" Erreur: {e}")
+            return
+        
+        self._store(query, context, "".join(parts).strip(), scope, query_vector)
+    
+    def cached_response(
+        self,
+        query: str,
+        context: Optional[List[str]] = None,
+        language: str = "français",
+        query_vector: Optional[Sequence[float]] = None,
+        index_key=None
+    ) -> Optional[str]:
+        """Réponse déjà en cache, ou None (sans appel au modèle).
+
+        À appeler avant de prendre un créneau de génération (scheduler) :
+        une réponse en cache n'attend pas derrière les générations en cours.
+        En cas d'échec, generate/stream refont la recherche une fois le
+        créneau obtenu (une question identique a pu être répondue entre-temps).
+        """
+        if self.answer_cache is None:
+            return None
+        cached = self.answer_cache.get(query, context, (index_key, self.model, language), query_vector)
+        if cached is not None:
+            # Les échecs sont comptés par la recherche faite dans le créneau
+            metrics.hit("answers", True)
+        return cached
+    
+    def _lookup(self, query, context, language, query_vector, index_key):
+        """Chercher dans le cache de réponses : retourne (scope, réponse ou None)"""
+        scope = (index_key, self.model, language)
+        if self.answer_cache is None:
+            return scope, None
+        cached = self.answer_cache.get(query, context, scope, query_vector)
+        metrics.hit("answers", cached is not None)
+        return scope, cached
+    
+    def _store(self, query, context, response, scope, query_vector):
+        # Les réponses vides (erreurs) ne sont pas mises en cache
+        if response and self.answer_cache is not None:
+            self.answer_cache.put(query, context, response, scope, query_vector)
+    
+    def _build_prompt(self, query: str, context: Optional[List[str]], language: str,
+                      query_vector: Optional[Sequence[float]] = None) -> str:
+        with metrics.span("prompt_build"):
+            if context:
+                return self._build_rag_prompt(query, context, language, query_vector)
+            return self._build_simple_prompt(query, language)
     
-    def _build_rag_prompt(self, query: str, context: List[str], language: str) -> str:
-        """Construire un prompt RAG ultra-court"""
-        # Prendre seulement les 2 premiers chunks pour gagner du temps
-        context_text = "\n".join([chunk[:300] for chunk in context[:2]])
+    def _build_rag_prompt(self, query: str, context: List[str], language: str,
+                          query_vector: Optional[Sequence[float]] = None) -> str:
+        """Construire un prompt RAG court : les meilleures phrases de tous les chunks"""
+        chunk_vectors = None
+        if query_vector is not None and self.vector_lookup is not None:
+            chunk_vectors = self.vector_lookup(context)
+        context_text = pack_context(
+            query, context,
+            max_tokens=self.context_tokens,
+            query_vector=query_vector,
+            chunk_vectors=chunk_vectors
+        )
         
         if language.lower() == "français":
             return f"""Contexte: {context_text}
@@ -1,6 +1,10 @@
 import time
 from retrieve import load_chroma_index, retrieve_chunks
 from llm import CompagnionLLM
+from answer_cache import answer_cache
+from query_cache import query_cache
+from scheduler import scheduler
+import metrics
 
 class RAGSystem:
     """Système RAG complet"""
@@ -21,7 +25,11 @@ class RAGSystem:
         
         print(" Initialisation du LLM...")
         try:
-            self.llm = CompagnionLLM(model="orca-mini")
+            self.llm = CompagnionLLM(
+                model="orca-mini",
+                answer_cache=answer_cache,
+                vector_lookup=getattr(self.chroma_index.embeddings, "lookup", None)
+            )
             print(" LLM prêt\n")
         except Exception as e:
             print(f" Erreur: {e}")
@@ -42,7 +50,7 @@ class RAGSystem:
         # Récupérer les chunks
         print(" Recherche des documents...")
         ret_start = time.time()
-        chunks = retrieve_chunks(question, self.chroma_index, top_k=top_k)
+        chunks, query_vector, index_key = self._retrieve(question, top_k)
         ret_time = time.time() - ret_start
         print(f" {len(chunks)} documents en {ret_time:.2f}s\n")
         
@@ -52,7 +60,9 @@ class RAGSystem:
         response = self.llm.generate_response(
             question, 
             context=chunks, 
-            language="français"
+            language="français",
+            query_vector=query_vector,
+            index_key=index_key
         )
         gen_time = time.time() - gen_start
         print(f" Réponse générée en {gen_time:.2f}s\n")
@@ -71,6 +81,7 @@ class RAGSystem:
         print("─"*70)
         
         total_time = time.time() - start_time
+        metrics.observe("answer", total_time, index="documents")
         print(f"  Temps: {total_time:.2f}s")
         print("="*70 + "\n")
         
@@ -80,6 +91,75 @@ class RAGSystem:
             "sources": chunks,
             "time": total_time
         }
+    
+    def _retrieve(self, question: str, top_k: int):
+        """Recherche des chunks : retourne (chunks, embedding de la question, version de l'index)"""
+        with metrics.span("retrieval", index="documents"):
+            chunks = retrieve_chunks(question, self.chroma_index, top_k=top_k)
+        # Embedding déjà calculé pour la recherche (None en mode lexical seul)
+        query_vector = query_cache.cached_query_vector(self.chroma_index.embeddings, question)
+        return chunks, query_vector, query_cache.index_version(self.chroma_index)
+    
+    def answer_question_stream(self, question: str, top_k: int = 3):
+        """Répondre en streaming : yield (réponse partielle, sources).
+
+        Les sources sont envoyées avant le premier token.
+        """
+        chunks, query_vector, index_key = self._retrieve(question, top_k)
+        yield "", chunks
+        
+        answer = ""
+        for token in self.llm.stream_response(
+            question,
+            context=chunks,
+            language="français",
+            query_vector=query_vector,
+            index_key=index_key
+        ):
+            answer += token
+            yield answer, chunks
+    
+    async def aanswer_question(self, question: str, top_k: int = 3) -> dict:
+        """Version asynchrone de answer_question (sans affichage), via l'ordonnanceur partagé"""
+        start_time = time.time()
+        chunks, query_vector, index_key = await scheduler.retrieve(self._retrieve, question, top_k)
+        ret_time = time.time() - start_time
+        
+        gen_start = time.time()
+        options = dict(context=chunks, language="français", query_vector=query_vector, index_key=index_key)
+        # Réponse en cache : sans attendre un créneau de génération
+        response = self.llm.cached_response(question, **options)
+        if response is None:
+            response = await scheduler.generate(self.llm.model, self.llm.agenerate_response, question, **options)
+        gen_time = time.time() - gen_start
+        total_time = time.time() - start_time
+        metrics.observe("answer", total_time, index="documents")
+        
+        return {
+            "question": question,
+            "answer": response,
+            "sources": chunks,
+            "time": total_time,
+            # Inclut l'attente d'un créneau de génération
+            "ret_time": ret_time,
+            "gen_time": gen_time
+        }
+    
+    async def aanswer_question_stream(self, question: str, top_k: int = 3):
+        """Version asynchrone de answer_question_stream, via l'ordonnanceur partagé"""
+        chunks, query_vector, index_key = await scheduler.retrieve(self._retrieve, question, top_k)
+        yield "", chunks
+        
+        options = dict(context=chunks, language="français", query_vector=query_vector, index_key=index_key)
+        # Réponse en cache : sans attendre un créneau de génération
+        cached = self.llm.cached_response(question, **options)
+        if cached is not None:
+            yield cached, chunks
+            return
+        answer = ""
+        async for token in scheduler.stream(self.llm.model, self.llm.astream_response, question, **options):
+            answer += token
+            yield answer, chunks
 
 
 if __name__ == "__main__":
@@ -0,0 +1,227 @@
+import bisect
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Bornes des histogrammes (secondes) : du split d'une page à une génération LLM
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_METRIC = "rag_stage_seconds"
+HELP = {
+    STAGE_METRIC: "Durée des étapes du pipeline RAG",
+    "rag_cache_hits_total": "Réponses servies par un cache",
+    "rag_cache_misses_total": "Requêtes absentes d'un cache",
+    "rag_ollama_errors_total": "Erreurs des appels à Ollama",
+}
+
+# Désactivé par défaut : span() et inc() ne font alors qu'un test de booléen
+_enabled = os.environ.get("RAG_METRICS", "") not in ("", "0")
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Registry:
+    def __init__(self):
+        self.histograms = {}  # (nom, labels) -> Histogram
+        self.counters = {}    # (nom, labels) -> valeur
+        self.lock = threading.Lock()
+
+    def observe(self, name, labels, value):
+        with self.lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram is None:
+                histogram = self.histograms[(name, labels)] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name, labels, amount):
+        with self.lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + amount
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+
+_registry = _Registry()
+
+
+class _Span:
+    __slots__ = ("labels", "start")
+
+    def __init__(self, labels):
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _registry.observe(STAGE_METRIC, self.labels, time.perf_counter() - self.start)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def span(stage: str, **labels):
+    """Mesurer la durée d'une étape : `with metrics.span("split"): ...`"""
+    if not _enabled:
+        return _NO_SPAN
+    return _Span(_labels(stage=stage, **labels))
+
+
+def timed(iterable, stage: str, **labels):
+    """Itérer en mesurant le temps de production de chaque élément (ex: pages d'un PDF)"""
+    if not _enabled:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    key = _labels(stage=stage, **labels)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        _registry.observe(STAGE_METRIC, key, time.perf_counter() - start)
+        yield item
+
+
+def observe(stage: str, seconds: float, **labels):
+    """Enregistrer une durée déjà mesurée (ex: temps jusqu'au premier token)"""
+    if _enabled:
+        _registry.observe(STAGE_METRIC, _labels(stage=stage, **labels), seconds)
+
+
+def inc(name: str, amount: float = 1, **labels):
+    """Incrémenter un compteur (ex: inc("rag_cache_hits_total", cache="results"))"""
+    if _enabled:
+        _registry.inc(name, _labels(**labels), amount)
+
+
+def hit(cache: str, found: bool):
+    """Compter un accès à un cache (hit ou miss)"""
+    if _enabled:
+        _registry.inc("rag_cache_hits_total" if found else "rag_cache_misses_total",
+                      (("cache", cache),), 1)
+
+
+def reset():
+    _registry.clear()
+
+
+def snapshot() -> dict:
+    """Valeurs actuelles : {étape{labels}: {count, sum, mean}} et compteurs"""
+    with _registry.lock:
+        stages = {
+            _format_name(dict(labels)["stage"], tuple(l for l in labels if l[0] != "stage")): {
+                "count": h.count, "sum": h.sum, "mean": h.sum / h.count if h.count else 0.0
+            }
+            for (name, labels), h in _registry.histograms.items() if name == STAGE_METRIC
+        }
+        counters = {_format_name(name, labels): value
+                    for (name, labels), value in _registry.counters.items()}
+    return {"stages": stages, "counters": counters}
+
+
+def render() -> str:
+    """Toutes les métriques au format texte Prometheus"""
+    lines, typed = [], set()
+
+    def header(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    with _registry.lock:
+        for (name, labels), histogram in sorted(_registry.histograms.items()):
+            header(name, "histogram")
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{_format_name(name + '_bucket', labels + (('le', le),))} {cumulative}")
+            lines.append(f"{_format_name(name + '_sum', labels)} {histogram.sum}")
+            lines.append(f"{_format_name(name + '_count', labels)} {histogram.count}")
+        for (name, labels), value in sorted(_registry.counters.items()):
+            header(name, "counter")
+            lines.append(f"{_format_name(name, labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_http_server(port: int = 9108, host: str = "127.0.0.1"):
+    """Active les métriques et les sert sur http://host:port/metrics (thread en arrière-plan)"""
+    enable()
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def _labels(**labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_name(name, labels):
+    if not labels:
+        return name
+    inner = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+    return f"{name}{{{inner}}}"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
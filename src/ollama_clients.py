@@ -0,0 +1,301 @@
+import asyncio
+import threading
+import time
+import weakref
+import httpx
+import ollama
+from langchain_ollama import OllamaEmbeddings, OllamaLLM
+import metrics
+
+DEFAULT_BASE_URL = "http://localhost:11434"
+# Durée (secondes) pendant laquelle Ollama garde un modèle chargé après la dernière requête
+KEEP_ALIVE = 30 * 60
+
+
+class CircuitBreaker:
+    """Coupe-circuit : après `failure_threshold` échecs consécutifs, les appels
+    échouent tout de suite pendant `reset_timeout` secondes, puis un seul appel
+    d'essai est autorisé (demi-ouvert) ; un succès referme le circuit.
+
+    Un essai annulé (client déconnecté, Stop) libère sa place (`release`) ;
+    un essai sans réponse après `trial_timeout` secondes (par défaut
+    `reset_timeout`) n'empêche plus un nouvel essai.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0,
+                 trial_timeout: float = None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.trial_timeout = trial_timeout if trial_timeout is not None else reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.rejected = 0
+        # Début de l'appel d'essai en cours (demi-ouvert), ou None
+        self._trial_started = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            now = time.monotonic()
+            if state == "half-open" and (self._trial_started is None
+                                         or now - self._trial_started >= self.trial_timeout):
+                self._trial_started = now
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_started = None
+
+    def release(self):
+        """Appel terminé sans réponse ni erreur réseau (annulé, interrompu) : libérer l'essai"""
+        with self._lock:
+            self._trial_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_started = None
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                # Échec de l'appel d'essai : nouvelle période d'ouverture
+                self.opened_at = time.monotonic()
+
+
+def _check(breaker, request):
+    if not breaker.allow():
+        metrics.inc("rag_ollama_errors_total", kind="circuit_open")
+        raise httpx.ConnectError("Ollama indisponible (circuit ouvert)", request=request)
+
+
+def _record(breaker, response):
+    if response.status_code >= 500:
+        metrics.inc("rag_ollama_errors_total", kind="http_5xx")
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return response
+
+
+def _failed(breaker, error):
+    kind = "timeout" if isinstance(error, httpx.TimeoutException) else "connection"
+    metrics.inc("rag_ollama_errors_total", kind=kind)
+    breaker.record_failure()
+
+
+class _BreakerTransport(httpx.HTTPTransport):
+    """Transport HTTP (pool de connexions) qui alimente le coupe-circuit"""
+
+    def __init__(self, breaker, **kwargs):
+        super().__init__(**kwargs)
+        self.breaker = breaker
+
+    def handle_request(self, request):
+        _check(self.breaker, request)
+        try:
+            response = super().handle_request(request)
+        except httpx.TransportError as e:
+            _failed(self.breaker, e)
+            raise
+        except BaseException:
+            # Interrompu (KeyboardInterrupt...) : ni succès ni échec, l'essai est libéré
+            self.breaker.release()
+            raise
+        return _record(self.breaker, response)
+
+
+class _AsyncBreakerTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, breaker, **kwargs):
+        super().__init__(**kwargs)
+        self.breaker = breaker
+
+    async def handle_async_request(self, request):
+        _check(self.breaker, request)
+        try:
+            response = await super().handle_async_request(request)
+        except httpx.TransportError as e:
+            _failed(self.breaker, e)
+            raise
+        except BaseException:
+            # Annulé (CancelledError : client Gradio déconnecté, Stop) : l'essai est libéré
+            self.breaker.release()
+            raise
+        return _record(self.breaker, response)
+
+
+class _LoopAsyncClient:
+    """AsyncClient Ollama par boucle asyncio (un pool httpx ne passe pas d'une boucle à l'autre)"""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._clients = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._clients.get(loop)
+            if client is None:
+                client = self._clients[loop] = self._factory()
+        return getattr(client, name)
+
+
+class OllamaBackend:
+    """Un serveur Ollama partagé par tout le processus.
+
+    Un seul client HTTP synchrone (et un asynchrone par boucle asyncio) avec
+    pool de connexions persistantes, utilisé par tous les OllamaEmbeddings /
+    OllamaLLM créés ici ; `keep_alive` est envoyé à chaque requête. `warmup()` charge les
+    modèles à l'avance et `start_health_checks()` interroge périodiquement
+    /api/ps : un modèle préchauffé qui a été déchargé est rechargé. Les
+    erreurs de connexion ouvrent le coupe-circuit : les appels suivants
+    échouent immédiatement au lieu d'attendre le délai réseau.
+    """
+
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, keep_alive=KEEP_ALIVE,
+                 max_connections: int = 16, failure_threshold: int = 3,
+                 reset_timeout: float = 30.0):
+        self.base_url = base_url
+        self.keep_alive = keep_alive
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        limits = httpx.Limits(max_connections=max_connections,
+                              max_keepalive_connections=max_connections)
+        self.client = ollama.Client(
+            host=base_url, transport=_BreakerTransport(self.breaker, limits=limits)
+        )
+        self.async_client = _LoopAsyncClient(lambda: ollama.AsyncClient(
+            host=base_url, transport=_AsyncBreakerTransport(self.breaker, limits=limits)
+        ))
+        # (type, modèle, paramètres) -> objet langchain
+        self._models = {}
+        # modèles préchauffés : nom -> "embed" | "generate"
+        self._warm = {}
+        self._lock = threading.Lock()
+        self._health_thread = None
+        self.last_probe = None
+
+    def embeddings(self, model: str) -> OllamaEmbeddings:
+        return self._get(("embed", model), lambda: OllamaEmbeddings(
+            model=model, base_url=self.base_url, keep_alive=self.keep_alive
+        ))
+
+    def llm(self, model: str, **params) -> OllamaLLM:
+        return self._get(("generate", model, tuple(sorted(params.items()))), lambda: OllamaLLM(
+            model=model, base_url=self.base_url, keep_alive=self.keep_alive, **params
+        ))
+
+    def warmup(self, embedding_models=(), chat_models=()):
+        """Charger les modèles dans Ollama ; renvoie {modèle: None ou erreur}"""
+        results = {}
+        for model in embedding_models:
+            self._warm[model] = "embed"
+            results[model] = self._load(model, "embed")
+        for model in chat_models:
+            self._warm[model] = "generate"
+            results[model] = self._load(model, "generate")
+        return results
+
+    def probe(self) -> dict:
+        """Sonde de santé : modèles chargés (/api/ps), et rechargement des modèles préchauffés"""
+        start = time.perf_counter()
+        try:
+            loaded = {m.model.split(":")[0] for m in self.client.ps().models}
+            result = {"ok": True, "loaded": sorted(loaded)}
+        except Exception as e:
+            result = {"ok": False, "error": str(e)}
+        result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        result["circuit"] = self.breaker.state
+        self.last_probe = result
+        if result["ok"]:
+            for model, kind in list(self._warm.items()):
+                if model.split(":")[0] not in loaded:
+                    error = self._load(model, kind)
+                    if error is not None:
+                        print(f"[WARNING] Rechargement de '{model}' impossible : {error}")
+        return result
+
+    def start_health_checks(self, interval: float = 30.0):
+        """Lancer la sonde de santé en arrière-plan (sans effet si déjà lancée)"""
+        with self._lock:
+            if self._health_thread is None:
+                self._health_thread = threading.Thread(
+                    target=self._health_loop, args=(interval,), name="ollama-health", daemon=True
+                )
+                self._health_thread.start()
+        return self
+
+    @property
+    def available(self) -> bool:
+        return self.breaker.state != "open"
+
+    def stats(self) -> dict:
+        return {
+            "base_url": self.base_url,
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "rejected": self.breaker.rejected,
+            "models": sorted({key[1] for key in self._models}),
+            "warm_models": sorted(self._warm),
+            "last_probe": self.last_probe,
+        }
+
+    def _get(self, key, factory):
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                model = factory()
+                # Tous les modèles partagent les clients (et le pool de connexions) du serveur
+                model._client = self.client
+                model._async_client = self.async_client
+                self._models[key] = model
+            return model
+
+    def _load(self, model, kind):
+        try:
+            if kind == "embed":
+                self.client.embed(model, "warmup", keep_alive=self.keep_alive)
+            else:
+                self.client.generate(model, "", keep_alive=self.keep_alive, options={"num_predict": 1})
+            return None
+        except Exception as e:
+            return e
+
+    def _health_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            self.probe()
+
+
+# Un backend par URL de serveur, partagé par tout le processus
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(base_url: str = DEFAULT_BASE_URL, **kwargs) -> OllamaBackend:
+    """Backend partagé pour ce serveur (les options ne comptent qu'à la première création)"""
+    with _backends_lock:
+        backend = _backends.get(base_url)
+        if backend is None:
+            backend = _backends[base_url] = OllamaBackend(base_url, **kwargs)
+        return backend
+
+
+def get_embeddings(model: str, base_url: str = DEFAULT_BASE_URL) -> OllamaEmbeddings:
+    return get_backend(base_url).embeddings(model)
+
+
+def get_llm(model: str, base_url: str = DEFAULT_BASE_URL, **params) -> OllamaLLM:
+    return get_backend(base_url).llm(model, **params)
@@ -0,0 +1,166 @@
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from langchain_chroma import Chroma
+from index_manifest import file_hash, chunk_ids
+import lexical_index
+
+DEFAULT_STORE_DIR = Path(__file__).parent.parent / "data" / "pdf_indexes"
+META_FILE = "meta.json"
+LEXICAL_FILE = "bm25.sqlite"
+
+
+def _dir_size(path) -> int:
+    path = Path(path)
+    if not path.exists():
+        return 0
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+class PdfIndexStore:
+    """Index Chroma persistés par PDF, identifiés par l'empreinte du contenu.
+
+    Chaque PDF a son dossier `<store>/<sha256>/`, sa propre collection et
+    son index BM25 (`bm25.sqlite`, enregistré pour la recherche hybride).
+    `meta.json` est écrit en dernier : un dossier sans ce fichier est un
+    index incomplet (crash pendant l'indexation) et sera reconstruit.
+    """
+
+    def __init__(self, root=DEFAULT_STORE_DIR, max_age_days: float = 30,
+                 max_total_mb: float = 2048):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_age = max_age_days * 24 * 3600
+        self.max_total_bytes = max_total_mb * 1024 * 1024
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def fingerprint(self, file_path) -> str:
+        return file_hash(file_path)
+
+    def lock(self, fingerprint):
+        """Verrou par PDF : deux uploads simultanés du même fichier n'indexent qu'une fois"""
+        with self._locks_guard:
+            return self._locks.setdefault(fingerprint, threading.Lock())
+
+    def collection_name(self, fingerprint) -> str:
+        return f"pdf_{fingerprint[:32]}"
+
+    def path(self, fingerprint) -> Path:
+        return self.root / fingerprint
+
+    def index_bytes(self, fingerprint) -> int:
+        """Taille de l'index sur disque (vecteurs + textes + métadonnées)"""
+        return _dir_size(self.path(fingerprint))
+
+    def read_meta(self, fingerprint):
+        try:
+            with open(self.path(fingerprint) / META_FILE, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, fingerprint, meta):
+        path = self.path(fingerprint) / META_FILE
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def open(self, fingerprint, embeddings):
+        """Rouvrir un index complet, ou (None, None) s'il n'existe pas"""
+        meta = self.read_meta(fingerprint)
+        if meta is None:
+            return None, None
+        chroma_index = Chroma(
+            persist_directory=str(self.path(fingerprint)),
+            embedding_function=embeddings,
+            collection_name=self.collection_name(fingerprint)
+        )
+        lexical_index.open_for(chroma_index, self.path(fingerprint) / LEXICAL_FILE)
+        meta["last_used"] = time.time()
+        self._write_meta(fingerprint, meta)
+        return chroma_index, meta
+
+    def begin(self, fingerprint, embeddings):
+        """Créer un index vide (sans meta.json) à remplir au fil de l'eau"""
+        path = self.path(fingerprint)
+        # Un index BM25 encore enregistré pointerait vers le fichier supprimé
+        lexical_index.unregister(self.collection_name(fingerprint))
+        if path.exists():
+            # Reste d'une indexation interrompue
+            shutil.rmtree(path, ignore_errors=True)
+        path.mkdir(parents=True)
+
+        chroma_index = Chroma(
+            persist_directory=str(path),
+            embedding_function=embeddings,
+            collection_name=self.collection_name(fingerprint)
+        )
+        lexical_index.open_for(chroma_index, path / LEXICAL_FILE)
+        return chroma_index
+
+    def lexical(self, fingerprint):
+        """Index BM25 ouvert de ce PDF (après open ou begin)"""
+        return lexical_index.get(self.collection_name(fingerprint))
+
+    def commit(self, fingerprint, **meta):
+        """Marquer l'index comme complet (écrit meta.json)"""
+        now = time.time()
+        meta.update({
+            "fingerprint": fingerprint,
+            "collection": self.collection_name(fingerprint),
+            "created": now,
+            "last_used": now
+        })
+        self._write_meta(fingerprint, meta)
+        return meta
+
+    def create(self, fingerprint, chunks, embeddings, **meta):
+        """Indexer des chunks dans un nouveau dossier persistant"""
+        chroma_index = self.begin(fingerprint, embeddings)
+        ids = [chunk_id for chunk_id, _ in chunk_ids(fingerprint, chunks)]
+        chroma_index.add_documents(chunks, ids=ids)
+        self.lexical(fingerprint).add(
+            ids,
+            [chunk.page_content for chunk in chunks],
+            [chunk.metadata for chunk in chunks]
+        )
+        return chroma_index, self.commit(fingerprint, chunks=len(chunks), **meta)
+
+    def gc(self, keep=()):
+        """Supprimer les index trop vieux, puis les moins récents au-delà du budget disque.
+
+        Retourne la liste des empreintes supprimées.
+        """
+        now = time.time()
+        entries = []
+        for path in self.root.iterdir():
+            if not path.is_dir() or path.name in keep:
+                continue
+            meta = self.read_meta(path.name)
+            if meta is None:
+                # Index incomplet : ne pas toucher s'il est en cours de construction
+                if self.lock(path.name).locked():
+                    continue
+                last_used = path.stat().st_mtime
+            else:
+                last_used = meta.get("last_used", 0)
+            size = _dir_size(path)
+            entries.append((last_used, path, size))
+
+        removed = []
+        total = sum(size for _, _, size in entries)
+        total += sum(self.index_bytes(name) for name in keep)
+        for last_used, path, size in sorted(entries, key=lambda e: e[0]):
+            if now - last_used <= self.max_age and total <= self.max_total_bytes:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed.append(path.name)
+        if removed:
+            print(f"[GC] {len(removed)} index PDF supprimés")
+        return removed
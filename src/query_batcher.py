@@ -0,0 +1,123 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List
+from langchain_core.embeddings import Embeddings
+
+
+class QueryBatcher:
+    """Regroupe les embeddings de questions simultanées en un seul appel au modèle.
+
+    Chaque appelant dépose sa question et attend son vecteur. Un thread
+    envoie tout de suite les questions en attente si le modèle est libre ;
+    si un lot est déjà en cours, il attend au plus `max_wait` secondes que
+    d'autres questions arrivent (jusqu'à `max_batch`). Un utilisateur seul
+    ne paie donc aucune attente, une rafale part en quelques gros lots.
+
+    Les questions passent par `embed_documents` : pour Ollama, l'embedding
+    d'une question et celui d'un document sont le même appel.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_batch: int = 32,
+                 max_wait: float = 0.005, workers: int = 2):
+        self.embeddings = embeddings
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.workers = workers
+        self.requests = 0
+        self.batches = 0
+        self.max_batch_seen = 0
+        self._queue = queue.Queue()
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def embed(self, text: str) -> List[float]:
+        future = Future()
+        self._start()
+        self._queue.put((text, future))
+        return future.result()
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "avg_batch": self.requests / self.batches if self.batches else 0.0,
+            "max_batch": self.max_batch_seen,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+    def _start(self):
+        if len(self._threads) == self.workers:
+            return
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, name=f"query-batch-{len(self._threads)}",
+                                          daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        with self._lock:
+            busy = self._in_flight > 0
+        # Modèle occupé : laisser le lot se remplir, au plus max_wait
+        deadline = time.monotonic() + (self.max_wait if busy else 0.0)
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            with self._lock:
+                self._in_flight += 1
+                self.requests += len(batch)
+                self.batches += 1
+                self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            # Questions identiques dans le lot : un seul embedding
+            texts = list(dict.fromkeys(text for text, _ in batch))
+            try:
+                vectors = dict(zip(texts, self.embeddings.embed_documents(texts)))
+                for text, future in batch:
+                    future.set_result(vectors[text])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+
+
+class BatchedQueryEmbeddings(Embeddings):
+    """Embeddings dont `embed_query` passe par un QueryBatcher (documents inchangés)"""
+
+    def __init__(self, base: Embeddings, batcher: QueryBatcher):
+        self.base = base
+        self.batcher = batcher
+        self.model = getattr(base, "model", type(base).__name__)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.base.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.batcher.embed(text)
+
+
+# Un batcher par modèle d'embeddings, partagé par tout le processus
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+def batched(base: Embeddings, **kwargs) -> BatchedQueryEmbeddings:
+    """Envelopper un modèle d'embeddings avec le batcher partagé de ce modèle"""
+    with _batchers_lock:
+        wrapper = _batchers.get(id(base))
+        if wrapper is None or wrapper.base is not base:
+            wrapper = _batchers[id(base)] = BatchedQueryEmbeddings(base, QueryBatcher(base, **kwargs))
+        return wrapper
@@ -0,0 +1,292 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from embedding_cache import normalize_text
+import compact_vectors
+import lexical_index
+import metrics
+from sharded_index import ShardedIndex, merge_top_k
+
+
+class LRUCache:
+    """Cache LRU borné en nombre d'entrées, avec expiration (TTL) optionnelle"""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, expires = item
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def discard_if(self, predicate):
+        """Supprimer les entrées dont la clé vérifie `predicate`"""
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+        }
+
+
+class QueryCache:
+    """Cache en mémoire des embeddings de questions et des résultats top-k.
+
+    Les résultats sont indexés par la version de l'index : (collection,
+    nombre de chunks, révision). Quand la collection change, la version
+    change et les anciens résultats ne sont plus jamais servis.
+
+    Si un index BM25 est enregistré pour la collection (lexical_index.register),
+    la recherche est hybride : classements vectoriel et lexical fusionnés
+    (RRF). Si l'embedding de la question dépasse `embed_timeout` ou échoue,
+    la réponse est lexicale seule, et le vectoriel est ignoré pendant
+    `retry_after` secondes.
+
+    Si une copie compacte des vecteurs est enregistrée (compact_vectors.register),
+    la recherche vectorielle la parcourt puis reclasse en float32 ; si la
+    copie est périmée (chunks supprimés de Chroma), retour à Chroma.
+
+    Un index shardé (sharded_index.ShardedIndex) est interrogé shard par
+    shard en parallèle avec le même embedding de question ; les résultats
+    sont fusionnés par score (cosinus exact, BM25 calculé avec les
+    statistiques de tous les shards) avant la fusion RRF.
+    """
+
+    def __init__(self, max_embeddings: int = 2048, max_results: int = 1024,
+                 ttl: float = 3600, cache_results: bool = True,
+                 embed_timeout: float = 5.0, retry_after: float = 30.0):
+        self.embeddings = LRUCache(max_embeddings, ttl)
+        self.results = LRUCache(max_results, ttl)
+        self.cache_results = cache_results
+        self.embed_timeout = embed_timeout
+        self.retry_after = retry_after
+        self._dense_down_until = 0.0
+        self.lexical_fallbacks = 0
+        self.compact_searches = 0
+        # Embeddings des questions avec délai maximal (le calcul continue et remplit le cache).
+        # Les threads attendent surtout le batcher de questions : assez pour former des lots
+        self._executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="query-embed")
+        # collection -> fonction renvoyant une révision (ex: manifeste d'indexation)
+        self._revision_sources = {}
+        # collection -> compteur d'invalidations explicites
+        self._bumps = {}
+
+    def register_revision(self, collection_name: str, source):
+        """Associer à une collection une source de révision (appelée à chaque recherche)"""
+        self._revision_sources[collection_name] = source
+
+    def invalidate(self, collection_name: str):
+        """Forcer l'invalidation des résultats d'une collection"""
+        self._bumps[collection_name] = self._bumps.get(collection_name, 0) + 1
+        self.results.discard_if(lambda key: key[0][0] == collection_name)
+
+    def index_version(self, chroma_index) -> tuple:
+        if isinstance(chroma_index, ShardedIndex):
+            # Change dès qu'un shard change (nom global en tête, pour invalidate/answer_cache)
+            return (chroma_index.name,) + tuple(self.index_version(shard) for shard in chroma_index.shards)
+        collection = chroma_index._collection
+        source = self._revision_sources.get(collection.name)
+        return (
+            collection.name,
+            collection.count(),
+            source() if source else None,
+            self._bumps.get(collection.name, 0)
+        )
+
+    def embed_query(self, embeddings, question: str):
+        model = getattr(embeddings, "model", type(embeddings).__name__)
+        key = (model, normalize_text(question))
+        vector = self.embeddings.get(key)
+        metrics.hit("query_embeddings", vector is not None)
+        if vector is None:
+            with metrics.span("query_embed"):
+                vector = embeddings.embed_query(question)
+            self.embeddings.put(key, vector)
+        return vector
+
+    def prefetch(self, embeddings, questions, batch_size: int = 64) -> int:
+        """Embedder d'avance une liste de questions, par lots de `batch_size` (mode batch).
+
+        Les recherches suivantes trouvent l'embedding en cache. Retourne le
+        nombre de questions réellement envoyées au modèle.
+        """
+        model = getattr(embeddings, "model", type(embeddings).__name__)
+        missing = {}
+        for question in questions:
+            key = (model, normalize_text(question))
+            if key not in missing and self.cached_query_vector(embeddings, question) is None:
+                missing[key] = question
+        keys = list(missing)
+        for start in range(0, len(keys), batch_size):
+            part = keys[start:start + batch_size]
+            with metrics.span("query_embed_batch"):
+                vectors = embeddings.embed_documents([missing[key] for key in part])
+            for key, vector in zip(part, vectors):
+                self.embeddings.put(key, vector)
+        return len(keys)
+
+    def cached_query_vector(self, embeddings, question: str):
+        """Embedding de la question s'il est déjà en cache (sans appel au modèle)"""
+        model = getattr(embeddings, "model", type(embeddings).__name__)
+        return self.embeddings.get((model, normalize_text(question)))
+
+    def search(self, chroma_index, question: str, k: int = 4, mode: str = "hybrid"):
+        """Recherche top-k avec cache de l'embedding de la question et des résultats.
+
+        mode : "hybrid" (vectoriel + BM25 si disponible), "dense" ou "lexical".
+        """
+        if not self._has_lexical(chroma_index):
+            mode = "dense"
+        if self.cache_results:
+            key = (self.index_version(chroma_index), normalize_text(question), k, mode)
+            docs = self.results.get(key)
+            metrics.hit("results", docs is not None)
+            if docs is not None:
+                return list(docs)
+
+        if mode == "dense":
+            vector = self.embed_query(chroma_index.embeddings, question)
+            docs = self._similar(chroma_index, vector, k)
+        else:
+            # Plus de candidats que k dans chaque classement avant la fusion
+            candidates = max(k * 4, 20)
+            with metrics.span("lexical_search"):
+                lexical_docs = [doc for doc, _ in self._lexical(chroma_index, question, candidates)]
+            vector = self._dense_vector(chroma_index.embeddings, question) if mode == "hybrid" else None
+            if vector is None:
+                docs = lexical_docs[:k]
+                if mode == "hybrid":
+                    # Résultat dégradé : ne pas le mettre en cache
+                    return docs
+            else:
+                dense_docs = self._similar(chroma_index, vector, candidates)
+                docs = lexical_index.reciprocal_rank_fusion([dense_docs, lexical_docs], k=k)
+
+        if self.cache_results:
+            self.results.put(key, list(docs))
+        return docs
+
+    def _has_lexical(self, chroma_index):
+        if isinstance(chroma_index, ShardedIndex):
+            return all(lexical_index.get(shard._collection.name) is not None for shard in chroma_index.shards)
+        return lexical_index.get(chroma_index._collection.name) is not None
+
+    def _lexical(self, chroma_index, question, k, stats=None):
+        # (Document, score BM25)
+        if isinstance(chroma_index, ShardedIndex):
+            # Nombre de chunks, longueur moyenne et fréquence des termes de tout l'index :
+            # chaque shard calcule les mêmes scores qu'un index unique
+            terms = set(lexical_index.tokenize(question))
+            parts = chroma_index.map(lambda shard: lexical_index.get(shard._collection.name).term_stats(terms))
+            df = {term: sum(part[2][term] for part in parts) for term in terms}
+            stats = (sum(part[0] for part in parts), sum(part[1] for part in parts), df)
+            if not stats[0]:
+                return []
+            return merge_top_k(chroma_index.map(self._lexical, question, k, stats), k)
+        return lexical_index.get(chroma_index._collection.name).search(question, k, stats)
+
+    def _similar(self, chroma_index, vector, k):
+        if isinstance(chroma_index, ShardedIndex):
+            with metrics.span("shard_fanout", shards=len(chroma_index.shards)):
+                return [doc for doc, _ in merge_top_k(chroma_index.map(self._scored_similar, vector, k), k)]
+        # Vecteurs compacts (int8/float16) + reclassement float32 s'ils sont à jour, sinon Chroma
+        compact = compact_vectors.get(chroma_index._collection.name)
+        if compact is not None and compact.matches(chroma_index):
+            with metrics.span("vector_search", backend="compact"):
+                docs = compact.search(chroma_index, vector, k)
+            if docs is not None:
+                self.compact_searches += 1
+                return docs
+        with metrics.span("vector_search", backend="chroma"):
+            return chroma_index.similarity_search_by_vector(vector, k=k)
+
+    def _scored_similar(self, chroma_index, vector, k):
+        # Top-k d'un shard avec le cosinus exact : scores comparables d'un shard à l'autre
+        compact = compact_vectors.get(chroma_index._collection.name)
+        if compact is not None and compact.matches(chroma_index):
+            with metrics.span("vector_search", backend="compact"):
+                found = compact.search_with_scores(chroma_index, vector, k)
+            if found is not None:
+                self.compact_searches += 1
+                return found
+        with metrics.span("vector_search", backend="chroma"):
+            found = chroma_index._collection.query(
+                query_embeddings=[list(vector)], n_results=k,
+                include=["documents", "metadatas", "embeddings"]
+            )
+        # Une seule requête : première (et unique) ligne de chaque champ
+        fields = ("ids", "documents", "metadatas", "embeddings")
+        return compact_vectors.rank_by_cosine(vector, {field: found[field][0] for field in fields}, k)
+
+    def _dense_vector(self, embeddings, question):
+        # Embedding de la question, ou None si le serveur est lent ou indisponible
+        vector = self.cached_query_vector(embeddings, question)
+        if vector is not None:
+            return vector
+        if time.monotonic() < self._dense_down_until:
+            self.lexical_fallbacks += 1
+            return None
+        future = self._executor.submit(self.embed_query, embeddings, question)
+        try:
+            return future.result(timeout=self.embed_timeout)
+        except Exception as e:
+            reason = "délai dépassé" if isinstance(e, FutureTimeout) else e
+            print(f"[WARNING] Embedding de la question indisponible ({reason}) : recherche lexicale seule")
+            self._dense_down_until = time.monotonic() + self.retry_after
+            self.lexical_fallbacks += 1
+            return None
+
+    def stats(self) -> dict:
+        return {
+            "query_embeddings": self.embeddings.stats(),
+            "results": self.results.stats(),
+            "lexical_fallbacks": self.lexical_fallbacks,
+            "compact_searches": self.compact_searches,
+        }
+
+
+# Cache partagé par tout le processus
+query_cache = QueryCache()
+
+
+def cached_similarity_search(chroma_index, question: str, k: int = 4, mode: str = "hybrid"):
+    return query_cache.search(chroma_index, question, k, mode)
@@ -0,0 +1,113 @@
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+import joblib
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+project_root = Path(__file__).parent.parent
+DEFAULT_CSV = project_root / "dataset" / "PEEKC-Dataset-main" / "datasets" / "v2" / "id_to_wiki_metadata_mapping.csv"
+DEFAULT_MODEL_DIR = project_root / "data" / "recommender"
+COLUMNS = ['title', 'url', 'platform']
+
+
+def _source_signature(csv_path):
+    stat = os.stat(csv_path)
+    return {"source": str(csv_path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def build_recommender(csv_path=DEFAULT_CSV, model_dir=DEFAULT_MODEL_DIR):
+    """Étape hors-ligne : ajuster le TF-IDF et sauvegarder vocabulaire + matrice.
+
+    La matrice est stockée transposée (termes x ressources, CSR) : une requête
+    ne parcourt que les listes des termes qu'elle contient.
+    """
+    model_dir = Path(model_dir)
+    model_dir.mkdir(parents=True, exist_ok=True)
+
+    wiki_mapping = pd.read_csv(csv_path)
+    wiki_mapping['combined_text'] = wiki_mapping['title'].fillna('') + ' ' + wiki_mapping['description'].fillna('')
+    wiki_mapping = wiki_mapping.dropna(subset=['title'])
+
+    # norm='l2' (défaut) : le produit scalaire est directement le cosinus
+    vectorizer = TfidfVectorizer(max_features=5000, stop_words='english')
+    tfidf_matrix = vectorizer.fit_transform(wiki_mapping['combined_text'])
+
+    joblib.dump(vectorizer, model_dir / "vectorizer.joblib")
+    sparse.save_npz(model_dir / "term_matrix.npz", tfidf_matrix.T.tocsr().astype(np.float32))
+    wiki_mapping[COLUMNS].to_csv(model_dir / "resources.csv", index=False)
+    with open(model_dir / "meta.json", "w", encoding="utf-8") as f:
+        json.dump({**_source_signature(csv_path), "resources": int(tfidf_matrix.shape[0]),
+                   "terms": int(tfidf_matrix.shape[1]), "built": time.time()}, f)
+    return Recommender(model_dir)
+
+
+class Recommender:
+    """Recommandation de modules à partir d'un modèle TF-IDF pré-calculé"""
+
+    def __init__(self, model_dir=DEFAULT_MODEL_DIR):
+        model_dir = Path(model_dir)
+        self.vectorizer = joblib.load(model_dir / "vectorizer.joblib")
+        self.term_matrix = sparse.load_npz(model_dir / "term_matrix.npz").tocsr()
+        self.resources = pd.read_csv(model_dir / "resources.csv")
+        with open(model_dir / "meta.json", "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+
+    def __len__(self):
+        return len(self.resources)
+
+    def _top_k(self, row, top_n):
+        # row : scores creux d'une requête (seules les ressources correspondantes)
+        if row.nnz == 0:
+            return np.empty(0, dtype=np.int64)
+        scores, indices = row.data, row.indices
+        if len(scores) > top_n:
+            # Sélection partielle au lieu d'un tri complet
+            part = np.argpartition(-scores, top_n - 1)[:top_n]
+            scores, indices = scores[part], indices[part]
+        order = np.lexsort((indices, -scores))
+        return indices[order]
+
+    def recommend_batch(self, queries, top_n=10):
+        """Top-n ressources pour plusieurs requêtes en un seul produit creux"""
+        query_matrix = self.vectorizer.transform(queries)
+        scores = (query_matrix @ self.term_matrix).tocsr()
+        results = []
+        for i in range(len(queries)):
+            top = self._top_k(scores.getrow(i), top_n)
+            results.append(self.resources.iloc[top][COLUMNS])
+        return results
+
+    def recommend(self, query, top_n=10):
+        return self.recommend_batch([query], top_n)[0]
+
+
+def load_or_build(csv_path=DEFAULT_CSV, model_dir=DEFAULT_MODEL_DIR):
+    """Charger le modèle sauvegardé, ou le (re)construire si le CSV a changé"""
+    model_dir = Path(model_dir)
+    try:
+        with open(model_dir / "meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        signature = _source_signature(csv_path)
+        if all(meta.get(key) == value for key, value in signature.items()):
+            return Recommender(model_dir)
+        print("[INFO] Dataset modifié, reconstruction du modèle de recommandation...")
+    except (OSError, ValueError):
+        print("[INFO] Modèle de recommandation absent, construction...")
+    return build_recommender(csv_path, model_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Construire le modèle de recommandation de modules")
+    parser.add_argument("--csv", default=str(DEFAULT_CSV), help="CSV PEEKC id_to_wiki_metadata_mapping")
+    parser.add_argument("--output", default=str(DEFAULT_MODEL_DIR), help="dossier du modèle")
+    args = parser.parse_args()
+
+    start = time.time()
+    recommender = build_recommender(args.csv, args.output)
+    print(f"[OK] {len(recommender)} ressources, {recommender.meta['terms']} termes "
+          f"en {time.time() - start:.1f}s -> {args.output}")
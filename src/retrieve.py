@@ -1,34 +1,73 @@
 from pathlib import Path
 from langchain_chroma import Chroma
-from langchain_ollama import OllamaEmbeddings
+from embedding_cache import make_embeddings
+from index_manifest import manifest_path, load_manifest
+from compact_vectors import compact_path, open_for as open_compact
+from lexical_index import lexical_path, open_for
+from query_cache import query_cache, cached_similarity_search
+from sharded_index import ShardedIndex, shards_path, load_shard_map, shard_collection
+from scheduler import scheduler
 from typing import List
 
 
 def load_chroma_index():
     db_path = Path(__file__).parent.parent / "data" / "chroma_db"
+    # Index shardé (embeddings_chroma.py --shards) : prioritaire sur l'index unique
+    shards_dir = shards_path(db_path)
+    shard_map = load_shard_map(shards_dir, "rag_documents")
 
-    if not db_path.exists():
+    if shard_map is None and not db_path.exists():
         raise FileNotFoundError(f"Index non trouvé: {db_path}")
     
-    embeddings = OllamaEmbeddings(
+    embeddings = make_embeddings(
         model="nomic-embed-text",
         base_url="http://localhost:11434"
     )
 
+    if shard_map is not None:
+        shards = [
+            open_index(shards_dir / name, shard_collection("rag_documents", name), embeddings)
+            for name in shard_map["names"]
+        ]
+        return ShardedIndex(shards, embeddings, name="rag_documents")
+    return open_index(db_path, "rag_documents", embeddings)
+
+
+def open_index(db_path, collection_name, embeddings):
+    """Ouvrir un index Chroma (ou un shard) avec sa révision, son BM25 et ses vecteurs compacts"""
     chroma_index = Chroma(
         persist_directory=str(db_path),
         embedding_function=embeddings,
-        collection_name="rag_documents"
+        collection_name=collection_name
+    )
+
+    # Le manifeste est réécrit à chaque mise à jour de l'index (embeddings_chroma.py) :
+    # sa date de modification sert de révision pour invalider le cache de résultats
+    manifest_file = manifest_path(db_path)
+    query_cache.register_revision(
+        collection_name,
+        lambda: manifest_file.stat().st_mtime_ns if manifest_file.exists() else None
     )
+    # Index BM25 construit par embeddings_chroma.py : recherche hybride (vectoriel + mots exacts)
+    open_for(chroma_index, lexical_path(db_path))
+    # Vecteurs compacts optionnels (embeddings_chroma.py --compact int8|float16)
+    manifest = load_manifest(manifest_file, collection_name)
+    open_compact(chroma_index, compact_path(db_path), revision=manifest["revision"] if manifest else None)
     return chroma_index
 
 
-def retrieve_chunks(query:str,chroma_index,top_k:int=5)->List[str]:
-    results=chroma_index.similarity_search(query,k=top_k)
+def retrieve_chunks(query:str,chroma_index,top_k:int=5,mode:str="hybrid")->List[str]:
+    #mode : "hybrid" (fusion RRF vectoriel + BM25), "dense" ou "lexical" (sans appel à Ollama)
+    results=cached_similarity_search(chroma_index,query,k=top_k,mode=mode)
     chunks=[doc.page_content for doc in results]
     return chunks
 
 
+async def aretrieve_chunks(query:str,chroma_index,top_k:int=5,mode:str="hybrid")->List[str]:
+    #version asynchrone : la recherche tourne dans un thread de l'ordonnanceur
+    return await scheduler.retrieve(retrieve_chunks,query,chroma_index,top_k,mode)
+
+
 if __name__=="__main__":
     print("chargement de l'index chroma ..")
     chroma_index=load_chroma_index()
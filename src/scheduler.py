@@ -0,0 +1,103 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+
+class _QueueStats:
+    def __init__(self):
+        self.waiting = 0
+        self.running = 0
+        self.served = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def as_dict(self, limit) -> dict:
+        return {
+            "limit": limit,
+            "waiting": self.waiting,
+            "running": self.running,
+            "served": self.served,
+            "avg_wait": self.total_wait / self.served if self.served else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+
+class RAGScheduler:
+    """Ordonnanceur asyncio du pipeline RAG.
+
+    La recherche (embedding de la question + Chroma) tourne dans des threads,
+    bornée par `max_retrievals`. La génération est bornée par modèle
+    (`max_generations`) : pendant que le LLM répond à une question, la
+    recherche des questions suivantes avance. Les files d'attente (nombre
+    en attente, temps d'attente) sont exposées par `stats()`.
+
+    Les appelants cherchent d'abord la réponse dans le cache
+    (CompagnionLLM.cached_response) : une réponse en cache ne prend pas de
+    créneau de génération.
+    """
+
+    def __init__(self, max_generations: int = 2, max_retrievals: int = 8,
+                 per_model_limits: dict = None):
+        self.max_generations = max_generations
+        self.max_retrievals = max_retrievals
+        self.per_model_limits = per_model_limits or {}
+        # Sémaphores créés à la demande, dans la boucle asyncio qui les utilise
+        self._semaphores = {}
+        self._stats = {}
+
+    def _limit(self, name):
+        if name == "retrieval":
+            return self.max_retrievals
+        return self.per_model_limits.get(name, self.max_generations)
+
+    @asynccontextmanager
+    async def _slot(self, name):
+        semaphore = self._semaphores.get(name)
+        if semaphore is None:
+            semaphore = self._semaphores[name] = asyncio.Semaphore(self._limit(name))
+        stats = self._stats.setdefault(name, _QueueStats())
+
+        stats.waiting += 1
+        start = time.monotonic()
+        try:
+            await semaphore.acquire()
+        finally:
+            stats.waiting -= 1
+        wait = time.monotonic() - start
+        stats.served += 1
+        stats.total_wait += wait
+        stats.max_wait = max(stats.max_wait, wait)
+
+        stats.running += 1
+        try:
+            yield
+        finally:
+            stats.running -= 1
+            semaphore.release()
+
+    async def retrieve(self, fn, *args, **kwargs):
+        """Exécuter une recherche synchrone dans un thread"""
+        async with self._slot("retrieval"):
+            return await asyncio.to_thread(fn, *args, **kwargs)
+
+    async def generate(self, model: str, coro_fn, *args, **kwargs):
+        """Exécuter une génération asynchrone (coroutine) sous la limite du modèle"""
+        async with self._slot(model):
+            return await coro_fn(*args, **kwargs)
+
+    async def stream(self, model: str, agen_fn, *args, **kwargs):
+        """Comme generate, pour un générateur asynchrone de tokens"""
+        async with self._slot(model):
+            async for token in agen_fn(*args, **kwargs):
+                yield token
+
+    def queue_depth(self, name: str) -> int:
+        stats = self._stats.get(name)
+        return stats.waiting if stats else 0
+
+    def stats(self) -> dict:
+        return {name: stats.as_dict(self._limit(name)) for name, stats in self._stats.items()}
+
+
+# Ordonnanceur partagé par tout le processus
+scheduler = RAGScheduler()
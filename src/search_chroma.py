@@ -1,33 +1,19 @@
-from pathlib import Path
-from langchain_chroma import Chroma
-from langchain_ollama import OllamaEmbeddings
-
-# Configuration
-project_root = Path(__file__).parent.parent
-persist_dir = project_root / "data" / "chroma_db"
+from query_cache import cached_similarity_search
+from retrieve import load_chroma_index
 
 print("\n" + "="*70)
 print("RECHERCHE DANS LA BASE CHROMA")
 print("="*70 + "\n")
 
-# Se connecter à la base
-embeddings = OllamaEmbeddings(
-    model="nomic-embed-text",
-    base_url="http://localhost:11434"
-)
-
-chroma_index = Chroma(
-    persist_directory=str(persist_dir),
-    embedding_function=embeddings,
-    collection_name="rag_documents"
-)
+# Se connecter à la base (index unique ou shards), avec BM25 et vecteurs compacts s'ils existent
+chroma_index = load_chroma_index()
 
 # Faire une recherche
 query = input("Entrez votre requête : ")
 
 print(f"\n[SEARCH] Recherche pour : '{query}'\n")
 
-results = chroma_index.similarity_search(query, k=5)
+results = cached_similarity_search(chroma_index, query, k=5)
 
 print(f"[OK] {len(results)} résultats trouvés:\n")
 
@@ -0,0 +1,192 @@
+import threading
+import time
+from contextlib import contextmanager
+import lexical_index
+
+
+class _OpenIndex:
+    def __init__(self, chroma_index, size):
+        self.chroma_index = chroma_index
+        # Index BM25 de cet index : seul lui est fermé avec l'index
+        self.lexical = lexical_index.get(chroma_index._collection.name)
+        self.size = size
+        self.last_used = time.monotonic()
+        self.active = 0
+
+
+class SessionIndexes:
+    """Index PDF par session Gradio, avec un budget mémoire.
+
+    Chaque session (`gr.Request.session_hash`) pointe vers l'empreinte du PDF
+    qu'elle a chargé ; deux sessions qui chargent le même PDF partagent son
+    index. Les index ouverts sont comptés avec leur taille (celle de leur
+    dossier dans le PdfIndexStore). Au-delà de `max_memory_mb`, ou après
+    `ttl` secondes sans utilisation, les moins récents sont fermés : ils
+    restent sur disque et sont rouverts à la prochaine question de la session.
+    Un index en cours d'utilisation (`use()`) n'est jamais fermé.
+    """
+
+    def __init__(self, store, embeddings, max_memory_mb: float = 1024,
+                 ttl: float = 3600, session_ttl: float = 24 * 3600):
+        self.store = store
+        self.embeddings = embeddings
+        self.max_memory_bytes = max_memory_mb * 1024 * 1024
+        self.ttl = ttl
+        self.session_ttl = session_ttl
+        # session -> [empreinte, dernière activité]
+        self._sessions = {}
+        # empreinte -> _OpenIndex
+        self._open = {}
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.reloads = 0
+
+    def get_open(self, fingerprint):
+        """L'index déjà ouvert pour cette empreinte, ou None"""
+        with self._lock:
+            entry = self._open.get(fingerprint)
+            if entry is None:
+                return None
+            entry.last_used = time.monotonic()
+            return entry.chroma_index
+
+    def attach(self, session_id, fingerprint, chroma_index):
+        """Associer une session au PDF qu'elle vient de charger"""
+        size = self.store.index_bytes(fingerprint)
+        now = time.monotonic()
+        with self._lock:
+            self._sessions[session_id] = [fingerprint, now]
+            self._register(fingerprint, chroma_index, size)
+            self._evict(keep=fingerprint)
+
+    def release(self, session_id):
+        """Oublier une session (fermeture de l'onglet) ; l'index reste en cache LRU"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def has_pdf(self, session_id) -> bool:
+        with self._lock:
+            return session_id in self._sessions
+
+    @contextmanager
+    def use(self, session_id):
+        """Index de la session (rouvert depuis le disque s'il a été évincé), ou None"""
+        entry = self._acquire(session_id)
+        try:
+            yield entry.chroma_index if entry is not None else None
+        finally:
+            if entry is not None:
+                with self._lock:
+                    entry.active -= 1
+                    entry.last_used = time.monotonic()
+
+    @contextmanager
+    def hold(self, fingerprint, chroma_index):
+        """Garder un index ouvert (ex: pendant son indexation) même hors budget"""
+        size = self.store.index_bytes(fingerprint)
+        with self._lock:
+            entry = self._register(fingerprint, chroma_index, size)
+            entry.active += 1
+        try:
+            yield entry.chroma_index
+        finally:
+            # La taille a changé pendant l'indexation
+            size = self.store.index_bytes(fingerprint)
+            with self._lock:
+                entry.active -= 1
+                entry.size = size
+                entry.last_used = time.monotonic()
+                self._evict(keep=fingerprint)
+
+    def discard(self, fingerprint):
+        """Fermer un index avant de le reconstruire (les sessions le rouvriront)"""
+        with self._lock:
+            entry = self._open.pop(fingerprint, None)
+        if entry is not None:
+            _close(entry.chroma_index, entry.lexical)
+
+    def fingerprints(self) -> set:
+        """Empreintes utilisées par une session (à protéger du GC disque)"""
+        with self._lock:
+            return {fingerprint for fingerprint, _ in self._sessions.values()} | set(self._open)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "open_indexes": len(self._open),
+                "memory_mb": sum(e.size for e in self._open.values()) / 1024 / 1024,
+                "max_memory_mb": self.max_memory_bytes / 1024 / 1024,
+                "evictions": self.evictions,
+                "reloads": self.reloads,
+            }
+
+    def _acquire(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            session[1] = now
+            fingerprint = session[0]
+            entry = self._open.get(fingerprint)
+            if entry is not None:
+                entry.active += 1
+                entry.last_used = now
+                return entry
+
+        # Index évincé : le rouvrir depuis le disque (hors du verrou global)
+        with self.store.lock(fingerprint):
+            chroma_index, _ = self.store.open(fingerprint, self.embeddings)
+        if chroma_index is None:
+            # Supprimé du disque entre-temps (GC) : la session doit recharger son PDF
+            self.release(session_id)
+            return None
+        size = self.store.index_bytes(fingerprint)
+
+        with self._lock:
+            self.reloads += 1
+            entry = self._register(fingerprint, chroma_index, size)
+            entry.active += 1
+            self._evict(keep=fingerprint)
+            return entry
+
+    def _register(self, fingerprint, chroma_index, size):
+        entry = self._open.get(fingerprint)
+        if entry is None:
+            entry = self._open[fingerprint] = _OpenIndex(chroma_index, size)
+        elif entry.chroma_index is not chroma_index:
+            # Ouvert deux fois en parallèle : garder le premier. L'index BM25 est
+            # partagé (lexical_index.open_for) : ne fermer que le client Chroma
+            _close(chroma_index)
+        entry.size = size
+        entry.last_used = time.monotonic()
+        return entry
+
+    def _evict(self, keep=None):
+        now = time.monotonic()
+        for session_id, (_, last_seen) in list(self._sessions.items()):
+            if now - last_seen > self.session_ttl:
+                del self._sessions[session_id]
+
+        total = sum(e.size for e in self._open.values())
+        for fingerprint, entry in sorted(self._open.items(), key=lambda item: item[1].last_used):
+            if fingerprint == keep or entry.active:
+                continue
+            if now - entry.last_used <= self.ttl and total <= self.max_memory_bytes:
+                continue
+            del self._open[fingerprint]
+            _close(entry.chroma_index, entry.lexical)
+            total -= entry.size
+            self.evictions += 1
+
+
+def _close(chroma_index, lexical=None):
+    # Libère le client Chroma (index HNSW, connexion SQLite) et l'index BM25 `lexical`
+    # s'il est toujours celui enregistré pour la collection ; les données restent sur disque
+    try:
+        if lexical is not None:
+            lexical_index.unregister(chroma_index._collection.name, lexical)
+        chroma_index._client.close()
+    except Exception as e:
+        print(f"[WARNING] Fermeture de l'index impossible : {e}")
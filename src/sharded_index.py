@@ -0,0 +1,129 @@
+import hashlib
+import heapq
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from pathlib import Path
+
+SHARD_MAP_VERSION = 1
+SHARD_MAP_FILE = "shards.json"
+
+
+def shards_path(persist_dir):
+    """Dossier des shards à côté du dossier Chroma (ex: data/chroma_db_shards/)"""
+    persist_dir = Path(persist_dir)
+    return persist_dir.with_name(f"{persist_dir.name}_shards")
+
+
+def shard_collection(collection_name: str, shard: str) -> str:
+    """Nom de la collection Chroma d'un shard (unique : les registres sont indexés par nom)"""
+    return f"{collection_name}_{shard}"
+
+
+def new_shard_map(collection_name: str, shard_by: str = "source", shards: int = 4,
+                  max_mb: float = 200.0) -> dict:
+    """Répartition vide : `source` (hash du fichier, `shards` shards) ou `size` (shards de `max_mb` Mo)"""
+    if shard_by not in ("source", "size"):
+        raise ValueError(f"Répartition inconnue : {shard_by} (source ou size)")
+    return {
+        "version": SHARD_MAP_VERSION,
+        "collection": collection_name,
+        "shard_by": shard_by,
+        "shards": shards,
+        "max_mb": max_mb,
+        "names": [],
+        "files": {}
+    }
+
+
+def load_shard_map(shards_dir, collection_name):
+    """Répartition des fichiers entre shards, ou None si l'index n'est pas shardé"""
+    path = Path(shards_dir) / SHARD_MAP_FILE
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        shard_map = json.load(f)
+    if shard_map.get("version") != SHARD_MAP_VERSION or shard_map.get("collection") != collection_name:
+        raise ValueError(f"Répartition des shards incompatible : {path}")
+    return shard_map
+
+
+def save_shard_map(shards_dir, shard_map):
+    """Écriture atomique de la répartition (fichier temporaire + remplacement)"""
+    path = Path(shards_dir) / SHARD_MAP_FILE
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(shard_map, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def assign_files(shard_map, file_sizes: dict) -> list:
+    """Placer les nouveaux fichiers dans un shard ; les fichiers déjà placés ne bougent jamais.
+
+    `file_sizes` : clé du fichier -> taille en octets. En mode `source`, le
+    shard dépend du hash de la clé ; en mode `size`, les fichiers remplissent
+    le dernier shard jusqu'à `max_mb` puis un nouveau shard est ouvert.
+    Retourne les clés nouvellement placées.
+    """
+    files = shard_map["files"]
+    names = shard_map["names"]
+    new_keys = sorted(key for key in file_sizes if key not in files)
+    if shard_map["shard_by"] == "source":
+        for i in range(shard_map["shards"]):
+            if f"s{i:02d}" not in names:
+                names.append(f"s{i:02d}")
+        for key in new_keys:
+            bucket = int(hashlib.sha1(key.encode("utf-8")).hexdigest(), 16) % shard_map["shards"]
+            files[key] = f"s{bucket:02d}"
+        return new_keys
+
+    limit = shard_map["max_mb"] * 1024 * 1024
+    if not names:
+        names.append("s00")
+    used = sum(file_sizes.get(key, 0) for key, shard in files.items() if shard == names[-1])
+    for key in new_keys:
+        if used and used + file_sizes[key] > limit:
+            names.append(f"s{len(names):02d}")
+            used = 0
+        files[key] = names[-1]
+        used += file_sizes[key]
+    return new_keys
+
+
+def shard_files(shard_map, shard: str, current_hashes: dict) -> dict:
+    """Fichiers actuels (clé -> hash) placés dans `shard`"""
+    return {key: h for key, h in current_hashes.items() if shard_map["files"].get(key) == shard}
+
+
+def merge_top_k(results, k: int):
+    """Fusionner des listes de (Document, score) venant de plusieurs shards : top-k global"""
+    return heapq.nlargest(k, chain.from_iterable(results), key=lambda item: item[1])
+
+
+class ShardedIndex:
+    """Plusieurs index Chroma (shards) interrogés comme un seul.
+
+    Chaque shard est un index complet (dossier Chroma, manifeste, BM25,
+    vecteurs compacts) reconstructible séparément. `query_cache` embedde la
+    question une fois, interroge tous les shards en parallèle (`map`) puis
+    garde le top-k global.
+    """
+
+    def __init__(self, shards, embeddings, name: str = "rag_documents", max_workers: int = None):
+        self.shards = list(shards)
+        self.embeddings = embeddings
+        self.name = name
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or max(len(self.shards), 1),
+                                            thread_name_prefix="shard-search")
+
+    def map(self, fn, *args):
+        """fn(shard, *args) sur chaque shard non vide, en parallèle ; liste des résultats"""
+        shards = [shard for shard in self.shards if shard._collection.count()]
+        if len(shards) == 1:
+            return [fn(shards[0], *args)]
+        return list(self._executor.map(lambda shard: fn(shard, *args), shards))
+
+    def count(self) -> int:
+        return sum(shard._collection.count() for shard in self.shards)
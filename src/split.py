@@ -1,24 +1,116 @@
+import re
+from bisect import bisect_left, bisect_right
 from pathlib import Path
-from langchain_text_splitters import CharacterTextSplitter
-from ingest import load_documents_from_folder
+from ingest import stream_documents_from_folder
+
+CHUNK_SIZE=1000
+CHUNK_OVERLAP=200
+#fin de phrase (ponctuation suivie d'un espace) ou saut de ligne
+_BOUNDARY=re.compile(r"[.!?](?=\s)|\n")
+
+
+class ChunkSpan:
+    """Chunk = (document, début, fin) : le texte du document n'est stocké qu'une fois.
+
+    Se comporte comme un Document langchain (page_content, metadata, id) ;
+    page_content est extrait du document seulement quand on le lit
+    (embedding, affichage). Les métadonnées sont celles du document, partagées.
+    """
+    __slots__=("document","start","end","id")
+
+    def __init__(self,document,start,end):
+        self.document=document
+        self.start=start
+        self.end=end
+        self.id=None
+
+    @property
+    def page_content(self):
+        return self.document.page_content[self.start:self.end]
+
+    @property
+    def metadata(self):
+        return self.document.metadata
+
+    def __len__(self):
+        return self.end-self.start
+
+    def __repr__(self):
+        return f"ChunkSpan(start={self.start}, end={self.end}, metadata={self.metadata!r})"
+
+
+def _boundaries(text):
+    #positions juste après une fin de phrase / de ligne (entiers seulement, aucune copie du texte)
+    return [match.end() for match in _BOUNDARY.finditer(text)]
+
+
+def _skip_spaces(text,start,end):
+    while start<end and text[start].isspace():
+        start+=1
+    while end>start and text[end-1].isspace():
+        end-=1
+    return start,end
+
+
+def split_spans(document,chunk_size=CHUNK_SIZE,chunk_overlap=CHUNK_OVERLAP):
+    """Découper un document en spans d'au plus chunk_size caractères.
+
+    Les coupures tombent sur une fin de phrase ou de ligne (sinon un espace,
+    sinon à chunk_size) ; le chevauchement avec le chunk précédent commence
+    lui aussi en début de phrase.
+    """
+    text=document.page_content
+    length=len(text)
+    boundaries=_boundaries(text)
+    spans=[]
+    start,_=_skip_spaces(text,0,length)
+    while start<length:
+        limit=start+chunk_size
+        if limit>=length:
+            end=length
+        else:
+            #dernière fin de phrase dans la fenêtre, en gardant au moins la moitié du chunk
+            i=bisect_right(boundaries,limit)-1
+            if i>=0 and boundaries[i]>start+chunk_size//2:
+                end=boundaries[i]
+            else:
+                space=text.rfind(" ",start+chunk_size//2,limit)
+                end=space if space>0 else limit
+        chunk_start,chunk_end=_skip_spaces(text,start,end)
+        if chunk_end>chunk_start:
+            spans.append(ChunkSpan(document,chunk_start,chunk_end))
+        if end>=length:
+            break
+        #reprendre chunk_overlap caractères plus tôt, au début de phrase suivant
+        j=bisect_left(boundaries,end-chunk_overlap)
+        if j<len(boundaries) and boundaries[j]<end:
+            next_start=boundaries[j]
+        else:
+            #pas de fin de phrase dans le chevauchement : début de mot
+            space=text.find(" ",end-chunk_overlap,end)
+            next_start=space if space>=0 else end
+        start,_=_skip_spaces(text,max(next_start,start+1),length)
+    return spans
+
 
 def split_documents(documents):
-    #diviser les documents en chunks
-    splitter=CharacterTextSplitter(
-        separator='\n',
-        chunk_size=1000,
-        chunk_overlap=200
-    )
-    chunks=splitter.split_documents(documents)
+    #diviser les documents en chunks (spans sur le texte de chaque document)
+    chunks=[]
+    for document in documents:
+        chunks.extend(split_spans(document))
     return chunks
 
+def iter_split_documents(documents):
+    #diviser un flux de documents (ex: générateur de ingest) sans le matérialiser
+    for document in documents:
+        yield from split_spans(document)
+
 if __name__=="__main__":
     project_root=Path(__file__).parent.parent
     docs_path=project_root/"docs"
 
-    print("chargement ...")
-    documents=load_documents_from_folder(docs_path)
-    print(len(documents))
-    print("division en chunks en cours ...")
-    chunks=split_documents(documents)
-    print(f"{len(chunks)} chunks créés avec succèes"  )
\ No newline at end of file
+    print("chargement et division en chunks en cours ...")
+    count=0
+    for chunk in iter_split_documents(stream_documents_from_folder(docs_path)):
+        count+=1
+    print(f"{count} chunks créés avec succèes"  )
@@ -1,69 +1,288 @@
+import argparse
+import hashlib
+import json
+import math
+from collections import Counter, defaultdict
 from pathlib import Path
 import chromadb
+import numpy as np
+from embedding_cache import normalize_text
+from sharded_index import shards_path, shard_collection, load_shard_map
 
 # Configuration
 project_root = Path(__file__).parent.parent
 persist_dir = project_root / "data" / "chroma_db"
 
-print("\n" + "="*70)
-print("VISUALISATION DE LA BASE CHROMA")
-print("="*70 + "\n")
-
-# Vérifier que la base existe
-if not Path(persist_dir).exists():
-    print(f"[X] La base Chroma n'existe pas à : {persist_dir}")
-    exit(1)
-
-print(f"[DB] Chemin de la base : {persist_dir}\n")
-
-# Se connecter à la base existante directement
-try:
-    # Utiliser ChromaDB directement sans passer par LangChain
-    client = chromadb.PersistentClient(path=str(persist_dir))
-    collection = client.get_collection(name="rag_documents")
-    
-    # Récupérer la collection
-    collection = client.get_collection(name="rag_documents")
-    
-    # Obtenir les statistiques
+
+class RunningStats:
+    """Moyenne / écart-type / min / max en une passe, fusionnés page par page (Chan)"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if not len(values):
+            return
+        count = self.count + len(values)
+        mean = float(values.mean())
+        delta = mean - self.mean
+        self.m2 += float(((values - mean) ** 2).sum()) + delta * delta * self.count * len(values) / count
+        self.mean += delta * len(values) / count
+        self.count = count
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / self.count) if self.count else 0.0
+
+    def as_dict(self):
+        if not self.count:
+            return {"count": 0}
+        return {"count": self.count, "mean": round(self.mean, 4), "std": round(self.std, 4),
+                "min": round(self.min, 4), "max": round(self.max, 4)}
+
+
+def size_distribution(sizes):
+    sizes = np.asarray(sizes)
+    if not len(sizes):
+        return {}
+    return {
+        "min": int(sizes.min()),
+        "p50": int(np.percentile(sizes, 50)),
+        "p95": int(np.percentile(sizes, 95)),
+        "max": int(sizes.max()),
+        "mean": round(float(sizes.mean()), 1),
+    }
+
+
+def iter_batches(collection, batch_size, include):
+    """Parcourir la collection par pages de `batch_size` (jamais tout en mémoire)"""
+    offset = 0
+    while True:
+        batch = collection.get(include=include, limit=batch_size, offset=offset)
+        if not batch["ids"]:
+            return
+        yield batch
+        offset += len(batch["ids"])
+
+
+class Exporter:
+    """Export en colonnes : embeddings.npy (memmap), une colonne .npy par champ, metadata.jsonl"""
+
+    def __init__(self, folder, total):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.total = total
+        self.rows = 0
+        self.embeddings = None
+        self.columns = defaultdict(list)
+        self._metadata_file = open(self.folder / "metadata.jsonl", "w", encoding="utf-8")
+
+    def write(self, ids, documents, metadatas, vectors, norms):
+        if vectors is not None and len(vectors):
+            if self.embeddings is None:
+                # Fichier .npy pré-alloué et rempli page par page
+                self.embeddings = np.lib.format.open_memmap(
+                    self.folder / "embeddings.npy", mode="w+", dtype=np.float32,
+                    shape=(self.total, vectors.shape[1])
+                )
+            self.embeddings[self.rows:self.rows + len(vectors)] = vectors
+        for doc_id, document, metadata in zip(ids, documents, metadatas):
+            metadata = metadata or {}
+            self.columns["ids"].append(doc_id)
+            self.columns["source"].append(str(metadata.get("source", "")))
+            page = metadata.get("page", -1)
+            self.columns["page"].append(page if isinstance(page, int) else -1)
+            self.columns["chars"].append(len(document or ""))
+            self._metadata_file.write(json.dumps({"id": doc_id, **metadata}, ensure_ascii=False) + "\n")
+        if norms is not None:
+            self.columns["norm"].extend(norms.tolist())
+        self.rows += len(ids)
+
+    def close(self):
+        self._metadata_file.close()
+        if self.embeddings is not None:
+            self.embeddings.flush()
+        # Colonnes légères (une valeur par chunk) : écrites à la fin
+        dtypes = {"page": np.int32, "chars": np.int32, "norm": np.float32}
+        for name, values in self.columns.items():
+            np.save(self.folder / f"{name}.npy", np.asarray(values, dtype=dtypes.get(name)))
+        with open(self.folder / "export.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "rows": self.rows,
+                "dimension": int(self.embeddings.shape[1]) if self.embeddings is not None else None,
+                "files": sorted(p.name for p in self.folder.iterdir()),
+                "note": "embeddings.npy : np.load(..., mmap_mode='r') ; lignes alignées avec ids.npy",
+            }, f, ensure_ascii=False, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspection / export de l'index Chroma, page par page")
+    parser.add_argument("--collection", default="rag_documents")
+    parser.add_argument("--batch-size", type=int, default=500, help="chunks lus par page")
+    parser.add_argument("--preview", type=int, default=10, help="nombre de chunks à afficher (0 = aucun)")
+    parser.add_argument("--top-sources", type=int, default=20, help="sources détaillées dans le rapport")
+    parser.add_argument("--no-embeddings", action="store_true",
+                        help="ne pas lire les vecteurs (pas de statistiques de norme ni d'export .npy)")
+    parser.add_argument("--export", help="dossier d'export (embeddings.npy, colonnes .npy, metadata.jsonl)")
+    parser.add_argument("--json", help="écrire les statistiques dans ce fichier JSON")
+    parser.add_argument("--shard", help="inspecter un shard (ex: s00) de l'index shardé")
+    args = parser.parse_args()
+
+    db_dir = persist_dir
+    if args.shard:
+        db_dir = shards_path(persist_dir) / args.shard
+        args.collection = shard_collection(args.collection, args.shard)
+
+    print("\n" + "="*70)
+    print("VISUALISATION DE LA BASE CHROMA")
+    print("="*70 + "\n")
+
+    # Index shardé (embeddings_chroma.py --shards) : lister les shards
+    shard_map = None if args.shard else load_shard_map(shards_path(persist_dir), args.collection)
+    if shard_map is not None:
+        shards_dir = shards_path(persist_dir)
+        print(f"[INFO] Index shardé ({shard_map['shard_by']}) : {shards_dir}")
+        for name in shard_map["names"]:
+            files = sum(1 for shard in shard_map["files"].values() if shard == name)
+            chunks = 0
+            if (shards_dir / name).exists():
+                try:
+                    chunks = chromadb.PersistentClient(path=str(shards_dir / name)).get_collection(
+                        name=shard_collection(args.collection, name)).count()
+                except Exception:
+                    pass
+            print(f"   - {name} : {files} fichiers, {chunks} chunks")
+        print(f"\n   Inspecter un shard : python view_chroma.py --shard {shard_map['names'][0] if shard_map['names'] else 's00'}\n")
+        if not Path(db_dir).exists():
+            exit(0)
+        print("[!] Un index non shardé existe aussi (ignoré par la recherche) : inspection ci-dessous\n")
+
+    # Vérifier que la base existe
+    if not Path(db_dir).exists():
+        print(f"[X] La base Chroma n'existe pas à : {db_dir}")
+        exit(1)
+
+    print(f"[DB] Chemin de la base : {db_dir}\n")
+
+    # ChromaDB directement, sans LangChain ni Ollama
+    client = chromadb.PersistentClient(path=str(db_dir))
+    collection = client.get_collection(name=args.collection)
     count = collection.count()
-    print(f"[INFO] Nombre de documents dans Chroma : {count}\n")
-    
+    print(f"[INFO] Nombre de chunks dans Chroma : {count}\n")
     if count == 0:
         print("La base est vide.")
         exit(0)
-    
-    # Afficher les documents
+
+    include = ["documents", "metadatas"] + ([] if args.no_embeddings else ["embeddings"])
+    exporter = Exporter(args.export, count) if args.export else None
+
+    sizes = defaultdict(list)              # source -> tailles des chunks
+    pages = defaultdict(Counter)           # source -> chunks par page
+    norms = defaultdict(RunningStats)      # source -> normes des embeddings
+    duplicates = Counter()                 # source -> chunks déjà vus (texte identique)
+    all_norms = RunningStats()
+    seen = set()
+    dimension = None
+    shown = 0
+
+    for batch in iter_batches(collection, args.batch_size, include):
+        vectors = batch.get("embeddings") if not args.no_embeddings else None
+        batch_norms = None
+        if vectors is not None and len(vectors):
+            vectors = np.asarray(vectors, dtype=np.float32)
+            dimension = vectors.shape[1]
+            batch_norms = np.linalg.norm(vectors, axis=1)
+            all_norms.update(batch_norms)
+
+        batch_sources = []
+        for doc_id, document, metadata in zip(batch["ids"], batch["documents"], batch["metadatas"]):
+            metadata = metadata or {}
+            document = document or ""
+            source = str(metadata.get("source", "N/A"))
+            sizes[source].append(len(document))
+            pages[source][metadata.get("page", "N/A")] += 1
+            batch_sources.append(source)
+            digest = hashlib.blake2b(normalize_text(document).encode("utf-8"), digest_size=16).digest()
+            if digest in seen:
+                duplicates[source] += 1
+            else:
+                seen.add(digest)
+
+            if shown < args.preview:
+                shown += 1
+                print(f"[DOC] Chunk {shown}")
+                print(f"   ID: {doc_id}")
+                print(f"   Source: {source}")
+                print(f"   Page: {metadata.get('page', 'N/A')}")
+                preview = document[:200].replace('\n', ' ')
+                print(f"   Contenu: {preview}...")
+                print(f"   Taille: {len(document)} caractères\n")
+
+        if batch_norms is not None:
+            batch_sources = np.asarray(batch_sources)
+            for source in set(batch_sources):
+                norms[source].update(batch_norms[batch_sources == source])
+
+        if exporter is not None:
+            exporter.write(batch["ids"], batch["documents"], batch["metadatas"], vectors, batch_norms)
+
+    if exporter is not None:
+        exporter.close()
+
+    # Rapport
+    all_sizes = [size for values in sizes.values() for size in values]
+    report = {
+        "collection": args.collection,
+        "chunks": len(all_sizes),
+        "sources": len(sizes),
+        "dimension": dimension,
+        "chunk_chars": size_distribution(all_sizes),
+        "embedding_norm": all_norms.as_dict(),
+        "duplicates": sum(duplicates.values()),
+        "per_source": {
+            source: {
+                "chunks": len(sizes[source]),
+                "pages": len(pages[source]),
+                "chunks_per_page": size_distribution(list(pages[source].values())),
+                "chunk_chars": size_distribution(sizes[source]),
+                "embedding_norm": norms[source].as_dict(),
+                "duplicates": duplicates[source],
+            }
+            for source in sorted(sizes, key=lambda s: len(sizes[s]), reverse=True)
+        },
+    }
+
     print("="*70)
-    print("CONTENU DE LA BASE CHROMA")
-    print("="*70 + "\n")
-    
-    # Récupérer tous les documents
-    all_data = collection.get(include=["documents", "metadatas", "embeddings"])
-    
-    for i, (doc_id, document, metadata) in enumerate(
-        zip(all_data["ids"], all_data["documents"], all_data["metadatas"]), 1
-    ):
-        print(f"\n[DOC] Document {i}/{count}")
-        print(f"   ID: {doc_id}")
-        print(f"   Source: {metadata.get('source', 'N/A')}")
-        print(f"   Page: {metadata.get('page', 'N/A')}")
-        preview = document[:200].replace('\n', ' ')
-        print(f"   Contenu: {preview}...")
-        print(f"   Taille: {len(document)} caractères")
-    
-    print("\n" + "="*70)
-    print(f"✅ Total: {count} documents dans la base")
+    print("STATISTIQUES")
+    print("="*70)
+    print(f"   - Chunks : {report['chunks']} ({report['sources']} sources)")
+    print(f"   - Taille des chunks (caractères) : {report['chunk_chars']}")
+    if dimension:
+        print(f"   - Embeddings : dimension {dimension}, normes {report['embedding_norm']}")
+    print(f"   - Doublons (texte identique) : {report['duplicates']}")
+    print(f"\n   Par source ({min(args.top_sources, len(sizes))} / {len(sizes)}) :")
+    for source, stats in list(report["per_source"].items())[:args.top_sources]:
+        print(f"   - {source} : {stats['chunks']} chunks, {stats['pages']} pages, "
+              f"taille p50={stats['chunk_chars'].get('p50')} max={stats['chunk_chars'].get('max')}, "
+              f"{stats['duplicates']} doublons")
+
+    db_size = sum(f.stat().st_size for f in db_dir.rglob('*') if f.is_file())
+    print(f"\n💾 Taille de la base : {db_size / 1024 / 1024:.2f} MB")
+    if exporter is not None:
+        print(f"[OK] Export : {exporter.rows} lignes dans {args.export}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"[OK] Statistiques écrites dans {args.json}")
     print("="*70 + "\n")
-    
-    # Option : Afficher la taille de la base
-    if persist_dir.exists():
-        db_size = sum(f.stat().st_size for f in persist_dir.rglob('*') if f.is_file())
-        print(f"💾 Taille de la base : {db_size / 1024 / 1024:.2f} MB\n")
-
-except Exception as e:
-    print(f"[X] Erreur : {e}")
-    print("\nAssurez-vous que:")
-    print("  1. Ollama est en train de tourner (ollama serve)")
-    print("  2. Le modèle nomic-embed-text est téléchargé (ollama pull nomic-embed-text)")
-    print("  3. La base Chroma existe et contient des données")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from dedup import MinHasher, NUM_PERM, _MERSENNE, shingles, similarity  # noqa: E402
+
+
+def _overlapping_pairs(count, words=150, seed=0):
+    # Chunks voisins comme ceux du découpage : une fin commune, le reste différent
+    rng = np.random.default_rng(seed)
+    vocab = [f"mot{i}" for i in range(3000)]
+    for _ in range(count):
+        base = list(rng.choice(vocab, words))
+        cut = int(rng.integers(5, words - 5))
+        yield " ".join(base), " ".join(base[cut:] + list(rng.choice(vocab, cut)))
+
+
+def _jaccard(a, b):
+    a, b = shingles(a), shingles(b)
+    return len(a & b) / len(a | b)
+
+
+def test_permutations_are_exact_modular_hashes():
+    hasher = MinHasher()
+    h = np.array([0, 1, 12345, 987654321, 2**32 - 1], dtype=np.uint64)
+    expected = [[(int(a) * int(x) + int(b)) % _MERSENNE for a, b in zip(hasher.a, hasher.b)] for x in h]
+    assert np.array_equal(hasher._permute(h[:, None]), np.array(expected, dtype=np.uint64))
+
+
+def test_estimates_match_exact_jaccard():
+    hasher = MinHasher()
+    errors, expected_var = [], []
+    for a, b in _overlapping_pairs(300):
+        j = _jaccard(a, b)
+        errors.append(similarity(hasher.signature(a), hasher.signature(b)) - j)
+        expected_var.append(j * (1 - j) / NUM_PERM)
+    errors = np.array(errors)
+    # Erreur attendue : écart-type sqrt(J(1-J)/num_perm), au plus ~0.044
+    assert abs(errors.mean()) < 0.01
+    assert errors.std() < 1.25 * np.sqrt(np.mean(expected_var))
+    assert np.all(np.abs(errors) < 5 * np.sqrt(np.maximum(expected_var, 1 / NUM_PERM ** 2)) + 0.02)
+
+
+def test_no_near_duplicate_below_threshold():
+    hasher = MinHasher()
+    for a, b in _overlapping_pairs(300, seed=1):
+        if _jaccard(a, b) < 0.5:
+            assert similarity(hasher.signature(a), hasher.signature(b)) < 0.9